@@ -2,13 +2,13 @@
 Admin Panel Routes - Batera Command Center
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Dict
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 from app.core.database import get_db
-from app.core.security import decode_token
-from app.models.user import UserRole
+from app.core.auth import get_current_admin_id
+from loguru import logger
 
 router = APIRouter()
 
@@ -31,57 +31,64 @@ class UserManagement(BaseModel):
     created_at: str
 
 
-def get_current_admin_id(authorization: str = Header(...)) -> str:
-    """Verify admin access"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    user_id = payload.get("sub")
-    role = payload.get("role")
-    
-    if role != UserRole.ADMIN.value:
-        raise HTTPException(
-            status_code=403,
-            detail="Accès refusé. Seul Nathanael Batera peut accéder au panneau Batera Command."
-        )
-    
-    return user_id
+def is_missing_relation(error: Exception) -> bool:
+    """True for "relation does not exist" errors (Postgres 42P01, PostgREST PGRST205)"""
+    code = getattr(error, "code", None) or getattr(getattr(error, "orig", None), "pgcode", None)
+    return code in ("42P01", "PGRST205")
 
 
-@router.get("/stats", response_model=AdminStats)
-async def get_admin_stats(admin_id: str = Depends(get_current_admin_id)):
-    """Get dashboard statistics"""
-    db = get_db()
+def compute_admin_stats(db) -> AdminStats:
+    """Compute dashboard statistics from the base tables (deployments without admin_stats_mv)"""
+    users = db.table("users").select("status, batera_coins").execute()
     
-    # Total users
-    users = db.table("users").select("id, status, batera_coins").execute()
-    total_users = len(users.data)
-    active_users = len([u for u in users.data if u["status"] == "active"])
-    coins_in_circulation = sum([u["batera_coins"] for u in users.data])
+    # Single pass over users
+    total_users = active_users = 0
+    coins_in_circulation = 0.0
+    for u in users.data:
+        total_users += 1
+        if u["status"] == "active":
+            active_users += 1
+        coins_in_circulation += u["batera_coins"]
     
-    # Total revenue
     purchases = db.table("purchase_transactions").select("amount_usd").eq("status", "completed").execute()
-    total_revenue = sum([p["amount_usd"] for p in purchases.data])
+    total_revenue = sum(p["amount_usd"] for p in purchases.data)
     
-    # Total AI queries
     ai_usage = db.table("ai_usage").select("id").execute()
-    total_ai_queries = len(ai_usage.data)
     
     return AdminStats(
         total_users=total_users,
         active_users=active_users,
         total_revenue=total_revenue,
-        total_ai_queries=total_ai_queries,
+        total_ai_queries=len(ai_usage.data),
         coins_in_circulation=coins_in_circulation
     )
 
 
+@router.get("/stats", response_model=AdminStats)
+async def get_admin_stats(admin_id: str = Depends(get_current_admin_id)):
+    """Get dashboard statistics"""
+    db = get_db()
+    
+    # Pre-aggregated by admin_stats_mv (refreshed every minute by pg_cron)
+    try:
+        stats = db.table("admin_stats_mv").select(
+            "total_users, active_users, total_revenue, total_ai_queries, coins_in_circulation"
+        ).execute()
+    except Exception as e:
+        # Only deployments without the view fall back to the base tables
+        if not is_missing_relation(e):
+            raise
+        logger.warning(f"admin_stats_mv unavailable, computing stats from base tables: {e}")
+        if db.is_sqlalchemy:
+            db.client.rollback()
+        stats = None
+    
+    if stats and stats.data:
+        return AdminStats(**stats.data[0])
+    
+    return compute_admin_stats(db)
+
+
 @router.get("/users", response_model=List[UserManagement])
 async def list_users(
     status: str = None,
@@ -91,26 +98,18 @@ async def list_users(
     """List all users with management info"""
     db = get_db()
     
-    query = db.table("users").select("*")
-    
-    if status:
-        query = query.eq("status", status)
-    
-    users = query.limit(limit).execute()
+    # Users and their total spent in a single round trip (see list_users_with_spend)
+    users = db.rpc("list_users_with_spend", {"p_status": status, "p_limit": limit}).execute()
     
     result = []
     for user in users.data:
-        # Get total spent
-        transactions = db.table("transactions").select("amount").eq("user_id", user["id"]).eq("type", "debit").execute()
-        total_spent = sum([t["amount"] for t in transactions.data])
-        
         result.append(UserManagement(
             id=user["id"],
             email=user["email"],
             full_name=user["full_name"],
             status=user["status"],
             batera_coins=user["batera_coins"],
-            total_spent=total_spent,
+            total_spent=user["total_spent"],
             created_at=user["created_at"]
         ))
     
@@ -136,8 +135,7 @@ async def suspend_user(
         "admin_id": admin_id,
         "action": "suspend_user",
         "target_user_id": user_id,
-        "reason": reason,
-        "created_at": datetime.utcnow().isoformat()
+        "reason": reason
     }).execute()
     
     return {"success": True, "message": f"Utilisateur suspendu. Raison: {reason}"}
@@ -169,38 +167,33 @@ async def add_coins(
     """Add Batera Coins to user account"""
     db = get_db()
     
-    # Get current balance
-    user = db.table("users").select("batera_coins").eq("id", user_id).execute()
+    # Credit and ledger entry in one transaction (see add_coins)
+    new_balance = db.rpc("add_coins", {
+        "p_uid": user_id,
+        "p_amount": amount,
+        "p_desc": f"Ajouté par admin: {reason}"
+    }).execute().data
     
-    if not user.data:
+    if new_balance is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    new_balance = user.data[0]["batera_coins"] + amount
-    
-    # Update balance
-    db.table("users").update({"batera_coins": new_balance}).eq("id", user_id).execute()
-    
-    # Log transaction
-    db.table("transactions").insert({
-        "user_id": user_id,
-        "type": "credit",
-        "amount": amount,
-        "description": f"Ajouté par admin: {reason}",
-        "created_at": datetime.utcnow().isoformat()
-    }).execute()
-    
     return {"success": True, "new_balance": new_balance}
 
 
 @router.get("/purchases")
-async def list_pending_purchases(admin_id: str = Depends(get_current_admin_id)):
+async def list_pending_purchases(
+    limit: int = 200,
+    admin_id: str = Depends(get_current_admin_id)
+):
     """List pending purchase transactions"""
     db = get_db()
     
+    # Only what manual payment verification needs (served by the pending partial index)
     purchases = db.table("purchase_transactions")\
-        .select("*")\
+        .select("id, user_id, package_id, coins, amount_usd, payment_method, phone_number, status, created_at")\
         .eq("status", "pending")\
         .order("created_at", desc=True)\
+        .limit(limit)\
         .execute()
     
     return purchases.data
@@ -214,35 +207,13 @@ async def approve_purchase(
     """Approve a pending purchase"""
     db = get_db()
     
-    # Get transaction
-    transaction = db.table("purchase_transactions").select("*").eq("id", transaction_id).execute()
+    # Credit, status update and ledger entry in one transaction (see approve_purchase)
+    result = db.rpc("approve_purchase", {"p_tx": transaction_id, "p_admin": admin_id}).execute()
     
-    if not transaction.data:
+    if not result.data:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    
-    trans_data = transaction.data[0]
-    
-    # Add coins to user
-    user = db.table("users").select("batera_coins").eq("id", trans_data["user_id"]).execute()
-    new_balance = user.data[0]["batera_coins"] + trans_data["coins"]
-    
-    db.table("users").update({"batera_coins": new_balance}).eq("id", trans_data["user_id"]).execute()
-    
-    # Update transaction status
-    db.table("purchase_transactions").update({
-        "status": "completed",
-        "approved_by": admin_id,
-        "approved_at": datetime.utcnow().isoformat()
-    }).eq("id", transaction_id).execute()
-    
-    # Log credit transaction
-    db.table("transactions").insert({
-        "user_id": trans_data["user_id"],
-        "type": "credit",
-        "amount": trans_data["coins"],
-        "description": f"Achat approuvé: {trans_data['coins']} Coins",
-        "created_at": datetime.utcnow().isoformat()
-    }).execute()
+    if result.data.get("error") == "not_pending":
+        raise HTTPException(status_code=409, detail=f"Transaction already {result.data['status']}")
     
     return {"success": True, "message": "Achat approuvé et coins ajoutés"}
 
@@ -257,29 +228,17 @@ async def get_ai_usage_stats(
     
     since = (datetime.utcnow() - timedelta(days=days)).isoformat()
     
-    usage = db.table("ai_usage")\
-        .select("service, cost, created_at")\
-        .gte("created_at", since)\
-        .execute()
-    
-    # Aggregate by service
-    stats = {}
-    total_cost = 0
+    # Aggregated server-side (see get_ai_usage_by_service)
+    rows = db.rpc("get_ai_usage_by_service", {"p_since": since}).execute().data
     
-    for record in usage.data:
-        service = record["service"]
-        cost = record["cost"]
-        
-        if service not in stats:
-            stats[service] = {"count": 0, "total_cost": 0}
-        
-        stats[service]["count"] += 1
-        stats[service]["total_cost"] += cost
-        total_cost += cost
+    stats = {
+        r["service"]: {"count": r["count"], "total_cost": r["total_cost"]}
+        for r in rows
+    }
     
     return {
         "period_days": days,
-        "total_queries": len(usage.data),
-        "total_cost": total_cost,
+        "total_queries": sum(s["count"] for s in stats.values()),
+        "total_cost": sum(s["total_cost"] for s in stats.values()),
         "by_service": stats
     }
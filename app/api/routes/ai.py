@@ -2,7 +2,8 @@
 AI services routes - Le moteur Batera Intelligence
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import StreamingResponse
 from app.models.ai import (
     AIQuestionRequest, AIQuestionResponse, AIServiceType,
     MindMapRequest, MindMapResponse,
@@ -12,37 +13,103 @@ from app.models.ai import (
     PredictorRequest, PredictorResponse
 )
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
 from app.core.config import settings
+from app.core import log_queue
 import google.generativeai as genai
 from datetime import datetime
+from typing import Optional
 from loguru import logger
+import asyncio
 import httpx
+import re
 
 router = APIRouter()
 
 # Configure Google AI
 genai.configure(api_key=settings.GOOGLE_AI_API_KEY)
 
+# Shared Gemini model (prompts are passed per call)
+_GEMINI_PRO = genai.GenerativeModel('gemini-pro')
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+# Code-Solver answer sections (see the format requested in solve_code)
+_SOLVE_RE = re.compile(
+    r"###\s*CODE\s*CORRIG[ÉE]\s*(?:(?:(?!###).)*?```[\w+#-]*\n(?P<code>.*?)```|(?P<code_plain>.*?)(?=###|\Z))"
+    r"|###\s*EXPLICATION\s*(?P<expl>.*?)(?=###|\Z)"
+    r"|###\s*SUGGESTIONS\s*(?P<sugg>.*?)(?=###|\Z)",
+    re.DOTALL | re.IGNORECASE
+)
+_BULLET_RE = re.compile(r"^\s*[-*]\s+(.+?)\s*$", re.MULTILINE)
+
+# Google branding replaced in model answers (single pass)
+_BRAND = {"Google": "Batera", "Gemini": "Oracle"}
+_BRAND_RE = re.compile(r"\b(Google|Gemini)\b")
+
+# Appended to a streamed answer when generation fails mid-way (the charge is refunded)
+STREAM_ERROR_MARKER = "[ERREUR] Réponse interrompue, vos Coins ont été remboursés."
+
+# Shared Semantic Scholar client (keep-alive pool, opened/closed by the app lifespan)
+_scholar_client: Optional[httpx.AsyncClient] = None
+
+
+def get_scholar_client() -> httpx.AsyncClient:
+    """Return the shared Semantic Scholar client, creating it if needed"""
+    global _scholar_client
+    if _scholar_client is None or _scholar_client.is_closed:
+        _scholar_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+        )
+    return _scholar_client
+
+
+async def close_scholar_client():
+    """Close the shared Semantic Scholar client"""
+    global _scholar_client
+    if _scholar_client is not None:
+        await _scholar_client.aclose()
+        _scholar_client = None
+
+
+def charge_user(user_id: str, cost: float) -> float:
+    """Debit Batera Coins atomically, returns the new balance"""
+    db = get_db()
     
-    return payload.get("sub")
+    # Conditional debit + ledger entry in one transaction (see charge_user RPC)
+    try:
+        return db.rpc("charge_user", {
+            "p_uid": user_id,
+            "p_cost": cost,
+            "p_desc": "Service IA utilisé"
+        }).execute().data
+    except Exception as e:
+        if "insufficient_funds" in str(e):
+            raise HTTPException(
+                status_code=402,
+                detail=f"Solde insuffisant. Cette action coûte {cost} Coins."
+            )
+        if "user_not_found" in str(e):
+            raise HTTPException(status_code=404, detail="User not found")
+        raise
+
+
+def refund_user(user_id: str, cost: float):
+    """Give back coins charged for a service that failed (logged in the ledger)"""
+    try:
+        get_db().rpc("add_coins", {
+            "p_uid": user_id,
+            "p_amount": cost,
+            "p_desc": "Remboursement service IA"
+        }).execute()
+    except Exception as e:
+        logger.error(f"Refund of {cost} Coins failed for user {user_id}: {e}")
 
 
-def check_user_balance(user_id: str, cost: float):
-    """Check if user has enough Batera Coins"""
+async def check_balance_async(user_id: str, cost: float) -> float:
+    """Check if user has enough Batera Coins (charge_user remains authoritative)"""
     db = get_db()
-    user = db.table("users").select("batera_coins").eq("id", user_id).execute()
+    user = await asyncio.to_thread(db.table("users").select("batera_coins").eq("id", user_id).execute)
     
     if not user.data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -58,23 +125,117 @@ def check_user_balance(user_id: str, cost: float):
     return balance
 
 
-def deduct_coins(user_id: str, cost: float):
-    """Deduct Batera Coins from user"""
-    db = get_db()
-    user = db.table("users").select("batera_coins").eq("id", user_id).execute()
-    current_balance = user.data[0]["batera_coins"]
-    new_balance = current_balance - cost
-    
-    db.table("users").update({"batera_coins": new_balance}).eq("id", user_id).execute()
-    
-    # Log transaction
-    db.table("transactions").insert({
+async def settle_balance_check(balance_check: asyncio.Task):
+    """Await the balance pre-check on an error path: its 402/404 wins over the upstream error"""
+    try:
+        await balance_check
+    except HTTPException:
+        raise
+    except Exception as e:
+        # The upstream error is the one reported
+        logger.warning(f"Balance pre-check failed: {e}")
+
+
+def log_ai_usage(user_id: str, service: AIServiceType, question: str, response: str, cost: float):
+    """Queue an ai_usage row (bulk-inserted in the background)"""
+    log_queue.enqueue("ai_usage", {
         "user_id": user_id,
-        "type": "debit",
-        "amount": cost,
-        "description": "Service IA utilisé",
-        "created_at": datetime.utcnow().isoformat()
-    }).execute()
+        "service": service.value,
+        "question": question,
+        "response": response,
+        "cost": cost
+    })
+
+
+# Prompt templates (only the substitution runs per request)
+ORACLE_TMPL = """Tu es Oracle, l'assistant IA de Campus OS UNIGOM développé par Nathanael Batera Akilimali. 
+        Tu aides les étudiants de l'Université de Goma (UNIGOM) avec leurs études. 
+        Réponds en français, de manière claire et pédagogique. 
+        Utilise parfois des expressions locales comme 'Kaka' (frère) pour créer de la proximité.
+        N'oublie jamais que tu es l'intelligence Batera, conçue à Goma.
+
+Question de l'étudiant: {question}
+        
+Contexte: {context}
+Cours: {course}
+
+Fournis une réponse détaillée et pédagogique."""
+
+MINDMAP_TMPL = """Génère un diagramme Mermaid.js pour visualiser ce sujet: {topic}
+        
+Contexte: {context}
+
+Crée un diagramme de type flowchart ou mindmap qui structure l'information de manière claire et logique.
+Retourne UNIQUEMENT le code Mermaid, sans explications."""
+
+CODE_SOLVER_TMPL = """Tu es un expert en programmation {language}. 
+        
+Analyse ce code et corrige les erreurs:
+
+```{language}
+{code}
+```
+
+Problème décrit: {problem_description}
+
+Fournis:
+1. Le code corrigé
+2. Une explication des erreurs trouvées
+3. Des suggestions d'amélioration
+
+Format ta réponse ainsi:
+### CODE CORRIGÉ
+[code corrigé ici]
+
+### EXPLICATION
+[explication ici]
+
+### SUGGESTIONS
+- [suggestion 1]
+- [suggestion 2]
+"""
+
+PREDICTOR_TMPL = """Tu es un système de prédiction des examens pour l'UNIGOM.
+
+Cours: {course}
+Faculté: {faculty}
+Niveau: {academic_level}
+
+Historique des examens passés:
+{history_text}
+
+Sur base de l'historique et du calendrier académique typique congolais (3 sessions par an), 
+prédis la date probable du prochain examen.
+
+Format ta réponse:
+DATE: [date prédite au format YYYY-MM-DD ou "Indéterminé"]
+CONFIANCE: [pourcentage]
+RAISONNEMENT: [explication courte]
+"""
+
+
+def build_oracle_prompt(request: AIQuestionRequest) -> str:
+    """Construct Oracle prompt with local context"""
+    return ORACLE_TMPL.format_map({
+        "question": request.question,
+        "context": request.context or "Aucun contexte fourni",
+        "course": request.course or "Non spécifié"
+    })
+
+
+def rebrand(text: str) -> str:
+    """Clean response to remove any Google branding"""
+    return _BRAND_RE.sub(lambda m: _BRAND[m.group(1)], text)
+
+
+async def iter_stream_async(response):
+    """Iterate a streamed Gemini response without blocking the event loop"""
+    chunks = iter(response)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
 
 
 @router.post("/oracle", response_model=AIQuestionResponse)
@@ -87,48 +248,21 @@ async def ask_oracle(
     """
     cost = 0.5 if request.difficulty == "simple" else 1.0
     
-    # Check balance
-    check_user_balance(user_id, cost)
+    # Balance pre-check runs while the model/API call is in flight
+    balance_check = asyncio.create_task(check_balance_async(user_id, cost))
     
     try:
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-pro')
-        
-        # Construct prompt with local context
-        system_prompt = """Tu es Oracle, l'assistant IA de Campus OS UNIGOM développé par Nathanael Batera Akilimali. 
-        Tu aides les étudiants de l'Université de Goma (UNIGOM) avec leurs études. 
-        Réponds en français, de manière claire et pédagogique. 
-        Utilise parfois des expressions locales comme 'Kaka' (frère) pour créer de la proximité.
-        N'oublie jamais que tu es l'intelligence Batera, conçue à Goma."""
-        
-        user_prompt = f"""Question de l'étudiant: {request.question}
-        
-Contexte: {request.context or 'Aucun contexte fourni'}
-Cours: {request.course or 'Non spécifié'}
-
-Fournis une réponse détaillée et pédagogique."""
+        model = _GEMINI_PRO
         
         # Generate response
-        response = model.generate_content(f"{system_prompt}\n\n{user_prompt}")
-        answer_text = response.text
+        response = await asyncio.to_thread(model.generate_content, build_oracle_prompt(request))
+        answer_text = rebrand(response.text)
         
-        # Clean response to remove any Google branding
-        answer_text = answer_text.replace("Google", "Batera")
-        answer_text = answer_text.replace("Gemini", "Oracle")
+        await balance_check
         
-        # Deduct coins
-        deduct_coins(user_id, cost)
-        
-        # Log AI usage
-        db = get_db()
-        db.table("ai_usage").insert({
-            "user_id": user_id,
-            "service": AIServiceType.ORACLE.value,
-            "question": request.question,
-            "response": answer_text,
-            "cost": cost,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        # Charge coins, usage is logged off the request path
+        await asyncio.to_thread(charge_user, user_id, cost)
+        log_ai_usage(user_id, AIServiceType.ORACLE, request.question, answer_text, cost)
         
         logger.info(f"✅ Oracle question answered for user {user_id}")
         
@@ -141,7 +275,11 @@ Fournis une réponse détaillée et pédagogique."""
             tokens_used=len(answer_text.split())
         )
         
+    except HTTPException:
+        await settle_balance_check(balance_check)
+        raise
     except Exception as e:
+        await settle_balance_check(balance_check)
         logger.error(f"Oracle error: {e}")
         raise HTTPException(
             status_code=500,
@@ -149,6 +287,53 @@ Fournis une réponse détaillée et pédagogique."""
         )
 
 
+@router.post("/oracle/stream")
+async def ask_oracle_stream(
+    request: AIQuestionRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Pose une question à Oracle, réponse envoyée au fil de la génération
+    """
+    cost = 0.5 if request.difficulty == "simple" else 1.0
+    
+    # Nothing can be refused once the first chunk is sent: charge up front (402/404 here),
+    # refund if the generation fails
+    await asyncio.to_thread(charge_user, user_id, cost)
+    
+    try:
+        response = await asyncio.to_thread(
+            _GEMINI_PRO.generate_content, build_oracle_prompt(request), stream=True
+        )
+    except Exception as e:
+        logger.error(f"Oracle stream error: {e}")
+        await asyncio.to_thread(refund_user, user_id, cost)
+        raise HTTPException(
+            status_code=500,
+            detail="Erreur de calcul dans le noyau Batera v15. Nathanael a été notifié."
+        )
+    
+    async def oracle_stream():
+        parts = []
+        try:
+            async for chunk in iter_stream_async(response):
+                text = rebrand(chunk.text)
+                parts.append(text)
+                yield text
+        except Exception as e:
+            logger.error(f"Oracle stream error: {e}")
+            await asyncio.to_thread(refund_user, user_id, cost)
+            yield f"\n\n{STREAM_ERROR_MARKER}"
+            return
+        
+        # Usage is logged off the request path
+        log_ai_usage(user_id, AIServiceType.ORACLE, request.question, "".join(parts), cost)
+        
+        logger.info(f"✅ Oracle question streamed for user {user_id}")
+    
+    return StreamingResponse(oracle_stream(), media_type="text/plain; charset=utf-8")
+
+
 @router.post("/mindmap", response_model=MindMapResponse)
 async def generate_mindmap(
     request: MindMapRequest,
@@ -158,19 +343,19 @@ async def generate_mindmap(
     Génère un diagramme Batera MindMap
     """
     cost = 1.0
-    check_user_balance(user_id, cost)
+    
+    # Balance pre-check runs while the model/API call is in flight
+    balance_check = asyncio.create_task(check_balance_async(user_id, cost))
     
     try:
-        model = genai.GenerativeModel('gemini-pro')
+        model = _GEMINI_PRO
         
-        prompt = f"""Génère un diagramme Mermaid.js pour visualiser ce sujet: {request.topic}
+        prompt = MINDMAP_TMPL.format_map({
+            "topic": request.topic,
+            "context": request.context or "Aucun"
+        })
         
-Contexte: {request.context or 'Aucun'}
-
-Crée un diagramme de type flowchart ou mindmap qui structure l'information de manière claire et logique.
-Retourne UNIQUEMENT le code Mermaid, sans explications."""
-        
-        response = model.generate_content(prompt)
+        response = await asyncio.to_thread(model.generate_content, prompt)
         diagram_code = response.text.strip()
         
         # Extract only Mermaid code if wrapped in markdown
@@ -179,18 +364,11 @@ Retourne UNIQUEMENT le code Mermaid, sans explications."""
         elif "```" in diagram_code:
             diagram_code = diagram_code.split("```")[1].split("```")[0].strip()
         
-        deduct_coins(user_id, cost)
+        await balance_check
         
-        # Log usage
-        db = get_db()
-        db.table("ai_usage").insert({
-            "user_id": user_id,
-            "service": AIServiceType.MINDMAP.value,
-            "question": request.topic,
-            "response": diagram_code,
-            "cost": cost,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        # Charge coins, usage is logged off the request path
+        await asyncio.to_thread(charge_user, user_id, cost)
+        log_ai_usage(user_id, AIServiceType.MINDMAP, request.topic, diagram_code, cost)
         
         return MindMapResponse(
             topic=request.topic,
@@ -200,7 +378,11 @@ Retourne UNIQUEMENT le code Mermaid, sans explications."""
             timestamp=datetime.utcnow()
         )
         
+    except HTTPException:
+        await settle_balance_check(balance_check)
+        raise
     except Exception as e:
+        await settle_balance_check(balance_check)
         logger.error(f"MindMap error: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la génération du diagramme")
 
@@ -214,23 +396,24 @@ async def search_scholar(
     Recherche académique Batera Scholar Search
     """
     cost = 2.0
-    check_user_balance(user_id, cost)
+    
+    # Balance pre-check runs while the model/API call is in flight
+    balance_check = asyncio.create_task(check_balance_async(user_id, cost))
     
     try:
         # Use Semantic Scholar API (free)
-        async with httpx.AsyncClient() as client:
-            url = "https://api.semanticscholar.org/graph/v1/paper/search"
-            params = {
-                "query": request.query,
-                "limit": request.max_results,
-                "fields": "title,authors,year,abstract,url,citationCount"
-            }
-            
-            if request.year_from:
-                params["year"] = f"{request.year_from}-"
-            
-            response = await client.get(url, params=params, timeout=30.0)
-            data = response.json()
+        url = "https://api.semanticscholar.org/graph/v1/paper/search"
+        params = {
+            "query": request.query,
+            "limit": request.max_results,
+            "fields": "title,authors,year,abstract,url,citationCount"
+        }
+        
+        if request.year_from:
+            params["year"] = f"{request.year_from}-"
+        
+        response = await get_scholar_client().get(url, params=params)
+        data = response.json()
         
         papers = []
         for paper in data.get("data", []):
@@ -244,18 +427,11 @@ async def search_scholar(
                 citations=paper.get("citationCount", 0)
             ))
         
-        deduct_coins(user_id, cost)
+        await balance_check
         
-        # Log usage
-        db = get_db()
-        db.table("ai_usage").insert({
-            "user_id": user_id,
-            "service": AIServiceType.SCHOLAR.value,
-            "question": request.query,
-            "response": f"{len(papers)} papers found",
-            "cost": cost,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        # Charge coins, usage is logged off the request path
+        await asyncio.to_thread(charge_user, user_id, cost)
+        log_ai_usage(user_id, AIServiceType.SCHOLAR, request.query, f"{len(papers)} papers found", cost)
         
         return ScholarSearchResponse(
             query=request.query,
@@ -265,7 +441,11 @@ async def search_scholar(
             timestamp=datetime.utcnow()
         )
         
+    except HTTPException:
+        await settle_balance_check(balance_check)
+        raise
     except Exception as e:
+        await settle_balance_check(balance_check)
         logger.error(f"Scholar search error: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la recherche académique")
 
@@ -279,68 +459,42 @@ async def solve_code(
     Batera Code-Solver: Déboggage et correction de code
     """
     cost = 1.0
-    check_user_balance(user_id, cost)
+    
+    # Balance pre-check runs while the model/API call is in flight
+    balance_check = asyncio.create_task(check_balance_async(user_id, cost))
     
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        
-        prompt = f"""Tu es un expert en programmation {request.language}. 
+        model = _GEMINI_PRO
         
-Analyse ce code et corrige les erreurs:
-
-```{request.language}
-{request.code}
-```
-
-Problème décrit: {request.problem_description or 'Aucune description'}
-
-Fournis:
-1. Le code corrigé
-2. Une explication des erreurs trouvées
-3. Des suggestions d'amélioration
-
-Format ta réponse ainsi:
-### CODE CORRIGÉ
-[code corrigé ici]
-
-### EXPLICATION
-[explication ici]
-
-### SUGGESTIONS
-- [suggestion 1]
-- [suggestion 2]
-"""
+        prompt = CODE_SOLVER_TMPL.format_map({
+            "language": request.language,
+            "code": request.code,
+            "problem_description": request.problem_description or "Aucune description"
+        })
         
-        response = model.generate_content(prompt)
+        response = await asyncio.to_thread(model.generate_content, prompt)
         result = response.text
         
         # Parse response
-        parts = result.split("###")
         fixed_code = request.code  # Default
         explanation = ""
         suggestions = []
         
-        for part in parts:
-            if "CODE CORRIGÉ" in part or "CODE CORRIGE" in part:
-                fixed_code = part.split("```")[1].strip() if "```" in part else part.strip()
-            elif "EXPLICATION" in part:
-                explanation = part.replace("EXPLICATION", "").strip()
-            elif "SUGGESTIONS" in part:
-                sugg_text = part.replace("SUGGESTIONS", "").strip()
-                suggestions = [s.strip("- ").strip() for s in sugg_text.split("\n") if s.strip()]
+        for match in _SOLVE_RE.finditer(result):
+            if match.group("code") is not None:
+                fixed_code = match.group("code").strip()
+            elif match.group("code_plain") is not None:
+                fixed_code = match.group("code_plain").strip()
+            elif match.group("expl") is not None:
+                explanation = match.group("expl").strip()
+            elif match.group("sugg") is not None:
+                suggestions = _BULLET_RE.findall(match.group("sugg"))
         
-        deduct_coins(user_id, cost)
+        await balance_check
         
-        # Log usage
-        db = get_db()
-        db.table("ai_usage").insert({
-            "user_id": user_id,
-            "service": AIServiceType.CODE_SOLVER.value,
-            "question": f"Code debug: {request.language}",
-            "response": explanation,
-            "cost": cost,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        # Charge coins, usage is logged off the request path
+        await asyncio.to_thread(charge_user, user_id, cost)
+        log_ai_usage(user_id, AIServiceType.CODE_SOLVER, f"Code debug: {request.language}", explanation, cost)
         
         return CodeSolverResponse(
             original_code=request.code,
@@ -351,7 +505,11 @@ Format ta réponse ainsi:
             timestamp=datetime.utcnow()
         )
         
+    except HTTPException:
+        await settle_balance_check(balance_check)
+        raise
     except Exception as e:
+        await settle_balance_check(balance_check)
         logger.error(f"Code solver error: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de l'analyse du code")
 
@@ -365,36 +523,29 @@ async def predict_exam(
     Batera Predictor: Prédiction des dates d'examens
     """
     cost = 3.0
-    check_user_balance(user_id, cost)
+    
+    # Balance pre-check runs while the model/API call is in flight
+    balance_check = asyncio.create_task(check_balance_async(user_id, cost))
     
     try:
         # Get historical data
         db = get_db()
-        history = db.table("exam_history").select("*").eq("course", request.course).eq("faculty", request.faculty).execute()
+        history = await asyncio.to_thread(
+            db.table("exam_history").select("*").eq("course", request.course).eq("faculty", request.faculty).execute
+        )
         
-        model = genai.GenerativeModel('gemini-pro')
+        model = _GEMINI_PRO
         
         history_text = "\n".join([f"- {h['date']}: {h['type']}" for h in history.data]) if history.data else "Aucun historique disponible"
         
-        prompt = f"""Tu es un système de prédiction des examens pour l'UNIGOM.
-
-Cours: {request.course}
-Faculté: {request.faculty}
-Niveau: {request.academic_level}
-
-Historique des examens passés:
-{history_text}
-
-Sur base de l'historique et du calendrier académique typique congolais (3 sessions par an), 
-prédis la date probable du prochain examen.
-
-Format ta réponse:
-DATE: [date prédite au format YYYY-MM-DD ou "Indéterminé"]
-CONFIANCE: [pourcentage]
-RAISONNEMENT: [explication courte]
-"""
+        prompt = PREDICTOR_TMPL.format_map({
+            "course": request.course,
+            "faculty": request.faculty,
+            "academic_level": request.academic_level,
+            "history_text": history_text
+        })
         
-        response = model.generate_content(prompt)
+        response = await asyncio.to_thread(model.generate_content, prompt)
         result = response.text
         
         # Parse response
@@ -414,17 +565,11 @@ RAISONNEMENT: [explication courte]
             elif "RAISONNEMENT:" in line:
                 reasoning = line.split("RAISONNEMENT:")[1].strip()
         
-        deduct_coins(user_id, cost)
+        await balance_check
         
-        # Log usage
-        db.table("ai_usage").insert({
-            "user_id": user_id,
-            "service": AIServiceType.PREDICTOR.value,
-            "question": f"Prediction: {request.course}",
-            "response": predicted_date or "Indéterminé",
-            "cost": cost,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        # Charge coins, usage is logged off the request path
+        await asyncio.to_thread(charge_user, user_id, cost)
+        log_ai_usage(user_id, AIServiceType.PREDICTOR, f"Prediction: {request.course}", predicted_date or "Indéterminé", cost)
         
         return PredictorResponse(
             course=request.course,
@@ -435,6 +580,10 @@ RAISONNEMENT: [explication courte]
             timestamp=datetime.utcnow()
         )
         
+    except HTTPException:
+        await settle_balance_check(balance_check)
+        raise
     except Exception as e:
+        await settle_balance_check(balance_check)
         logger.error(f"Predictor error: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la prédiction")
@@ -4,18 +4,28 @@ Campus OS UNIGOM - Professional Broadcast System
 Développé par Nathanael Batera Akilimali
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile, File, Form, status
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime, timezone
 from uuid import uuid4
 from app.core.database import get_db
-from app.core.security import decode_token
-from app.models.user import UserRole
+from app.core.auth import get_current_user_id, get_current_admin_id
+from app.core.cache import cache_get, cache_set, cache_invalidate, singleflight
+from app.core import announcement_events
 from loguru import logger
-import json
+from collections import defaultdict
+import asyncio
+import orjson
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# Response cache (keys are per user: audience filtering and view flags differ)
+CACHE_PREFIX = "announcements:"
+USER_LIST_TTL = 300
+ITEM_TTL = 900
+SSE_HEARTBEAT_SECONDS = 15
 
 
 # ============================================
@@ -68,6 +78,8 @@ class AnnouncementUpdate(BaseModel):
 
 class AnnouncementResponse(BaseModel):
     """Announcement response schema"""
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+    
     id: str
     title: str
     content: str
@@ -88,6 +100,28 @@ class AnnouncementResponse(BaseModel):
     user_has_viewed: Optional[bool] = None
 
 
+class AttachmentCreate(BaseModel):
+    """Already uploaded file to link to an announcement"""
+    file_url: str
+    file_name: str
+    file_type: str
+    file_size: int
+    mime_type: str
+    thumbnail_url: Optional[str] = None
+
+
+class AttachmentsBulkCreate(BaseModel):
+    """Link several uploaded files at once"""
+    attachments: List[AttachmentCreate] = Field(..., min_length=1, max_length=50)
+
+
+# Table columns behind AnnouncementResponse (attachments/stats/view flag are assembled)
+ANNOUNCEMENT_COLUMNS = ", ".join(
+    name for name in AnnouncementResponse.model_fields
+    if name not in ("attachments", "stats", "user_has_viewed")
+)
+
+
 class ReactionCreate(BaseModel):
     """Add reaction to announcement"""
     reaction: str = Field(..., min_length=1, max_length=10)
@@ -97,81 +131,92 @@ class ReactionCreate(BaseModel):
 # HELPER FUNCTIONS
 # ============================================
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
+async def get_announcement_with_details(db, announcement_id: str, user_id: Optional[str] = None):
+    """Get announcement with attachments and stats"""
     
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
+    # Announcement, attachments, stats and view flag in one round trip (see get_announcement_bundle)
+    result = await db.rpc("get_announcement_bundle", {"p_id": announcement_id, "p_user": user_id}).execute_async()
+    bundle = result.data
     
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if not bundle:
+        return None
     
-    return payload.get("sub")
+    return flatten_announcement_bundle(bundle)
 
 
-def get_current_admin_id(authorization: str = Header(...)) -> str:
-    """Verify admin access"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
+def flatten_announcement_bundle(bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a get_announcement_bundle document into AnnouncementResponse fields"""
+    return {
+        **bundle["announcement"],
+        "attachments": bundle["attachments"],
+        "stats": bundle["stats"],
+        "user_has_viewed": bundle["user_has_viewed"]
+    }
+
+
+def change_event(announcement: Dict[str, Any], action: str) -> Dict[str, Any]:
+    """Change event with the same fields as the announcements_notify trigger payload"""
+    return {
+        "id": str(announcement["id"]),
+        "action": action,
+        "status": announcement["status"],
+        "target_all_users": announcement["target_all_users"],
+        "target_faculties": announcement.get("target_faculties"),
+        "target_academic_levels": announcement.get("target_academic_levels")
+    }
+
+
+async def get_announcements_with_details_bulk(
+    db,
+    announcement_ids: List[str],
+    user_id: Optional[str] = None,
+    rows: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """Get announcements with attachments and stats for a whole page (order preserved)"""
+    if not announcement_ids:
+        return []
     
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    # One query per relation for the whole page, run concurrently
+    queries = [
+        db.table("announcement_attachments").select("*").in_("announcement_id", announcement_ids),
+        db.rpc("get_announcement_stats_bulk", {"p_ids": announcement_ids})
+    ]
     
-    user_id = payload.get("sub")
-    role = payload.get("role")
+    # Announcement rows already fetched by the caller are reused as-is
+    if rows is None:
+        queries.append(db.table("announcements").select(ANNOUNCEMENT_COLUMNS).in_("id", announcement_ids))
     
-    if role != UserRole.ADMIN.value:
-        raise HTTPException(
-            status_code=403,
-            detail="Accès refusé. Seuls les administrateurs peuvent gérer les annonces officielles."
+    if user_id:
+        queries.append(
+            db.table("announcement_views").select("announcement_id").in_(
+                "announcement_id", announcement_ids
+            ).eq("user_id", user_id)
         )
     
-    return user_id
-
-
-async def get_announcement_with_details(db, announcement_id: str, user_id: Optional[str] = None):
-    """Get announcement with attachments and stats"""
-    
-    # Get announcement
-    announcement = db.table("announcements").select("*").eq("id", announcement_id).execute()
+    attachments, stats, *rest = await db.execute_concurrently(*queries)
     
-    if not announcement.data:
-        return None
+    if rows is None:
+        rows = rest.pop(0).data
     
-    ann_data = announcement.data[0]
+    viewed = {v["announcement_id"] for v in rest[0].data} if user_id else set()
     
-    # Get attachments
-    attachments = db.table("announcement_attachments").select("*").eq(
-        "announcement_id", announcement_id
-    ).execute()
+    attachments_by_id = defaultdict(list)
+    for attachment in attachments.data:
+        attachments_by_id[attachment["announcement_id"]].append(attachment)
     
-    # Get stats
-    stats_result = db.rpc("get_announcement_stats", {"p_announcement_id": announcement_id}).execute()
-    stats = stats_result.data[0] if stats_result.data else {
-        "total_views": 0,
-        "total_reactions": 0,
-        "reaction_breakdown": {}
-    }
+    stats_by_id = {row["announcement_id"]: row["stats"] for row in stats.data}
+    rows_by_id = {ann["id"]: ann for ann in rows}
     
-    # Check if user has viewed
-    user_has_viewed = False
-    if user_id:
-        view_check = db.table("announcement_views").select("id").eq(
-            "announcement_id", announcement_id
-        ).eq("user_id", user_id).execute()
-        user_has_viewed = len(view_check.data) > 0
-    
-    return {
-        **ann_data,
-        "attachments": attachments.data if attachments.data else [],
-        "stats": stats,
-        "user_has_viewed": user_has_viewed
-    }
+    return [
+        {
+            **rows_by_id[ann_id],
+            "attachments": attachments_by_id[ann_id],
+            "stats": stats_by_id.get(ann_id),
+            "user_has_viewed": ann_id in viewed
+        }
+        for ann_id in announcement_ids
+        if ann_id in rows_by_id
+    ]
 
 
 # ============================================
@@ -196,8 +241,7 @@ async def create_announcement(
             "status": announcement.status,
             "background_image_url": announcement.background_image_url,
             "background_color": announcement.background_color,
-            "created_by": admin_id,
-            "created_at": datetime.utcnow().isoformat()
+            "created_by": admin_id
         }
         
         # Handle target audience
@@ -213,7 +257,7 @@ async def create_announcement(
             announcement_data["published_at"] = datetime.utcnow().isoformat()
         
         # Create announcement
-        result = db.table("announcements").insert(announcement_data).execute()
+        result = await db.table("announcements").insert(announcement_data).execute_async()
         
         if not result.data:
             raise HTTPException(
@@ -223,12 +267,22 @@ async def create_announcement(
         
         created = result.data[0]
         
-        # Get full details
-        full_announcement = await get_announcement_with_details(db, created["id"], admin_id)
+        # A new announcement has no attachments, views or reactions yet: no need to read it back
+        full_announcement = {
+            **created,
+            "id": str(created["id"]),
+            "created_by": str(created["created_by"]),
+            "attachments": [],
+            "stats": {"total_views": 0, "total_reactions": 0, "reaction_breakdown": {}},
+            "user_has_viewed": False
+        }
+        
+        await cache_invalidate(CACHE_PREFIX)
+        announcement_events.announcement_changed(change_event(full_announcement, "insert"))
         
         logger.info(f"Announcement created by admin {admin_id}: {created['id']}")
         
-        return AnnouncementResponse(**full_announcement)
+        return AnnouncementResponse.model_validate(full_announcement)
     
     except HTTPException:
         raise
@@ -252,7 +306,7 @@ async def get_admin_announcements(
     Get all announcements for admin management (Admin only)
     """
     try:
-        query = db.table("announcements").select("*")
+        query = db.table("announcements").select(ANNOUNCEMENT_COLUMNS)
         
         if status_filter:
             query = query.eq("status", status_filter)
@@ -260,15 +314,14 @@ async def get_admin_announcements(
         if type_filter:
             query = query.eq("type", type_filter)
         
-        result = query.order("created_at", desc=True).limit(limit).execute()
+        result = await query.order("created_at", desc=True).limit(limit).execute_async()
         
-        # Get full details for each
-        announcements = []
-        for ann in result.data:
-            full_ann = await get_announcement_with_details(db, ann["id"], admin_id)
-            announcements.append(AnnouncementResponse(**full_ann))
+        # Get full details for the whole page
+        announcements = await get_announcements_with_details_bulk(
+            db, [ann["id"] for ann in result.data], admin_id, rows=result.data
+        )
         
-        return announcements
+        return [AnnouncementResponse.model_validate(ann) for ann in announcements]
     
     except HTTPException:
         raise
@@ -291,12 +344,6 @@ async def update_announcement(
     Update an announcement (Admin only)
     """
     try:
-        # Check if announcement exists
-        existing = db.table("announcements").select("*").eq("id", announcement_id).execute()
-        
-        if not existing.data:
-            raise HTTPException(status_code=404, detail="Annonce non trouvée")
-        
         # Prepare update data
         update_dict = {}
         
@@ -307,13 +354,8 @@ async def update_announcement(
         if update_data.type is not None:
             update_dict["type"] = update_data.type
         if update_data.status is not None:
+            # published_at / archived_at are stamped by the announcements_status_timestamps trigger
             update_dict["status"] = update_data.status
-            # Set published_at if changing to published
-            if update_data.status == "published" and existing.data[0]["published_at"] is None:
-                update_dict["published_at"] = datetime.utcnow().isoformat()
-            # Set archived_at if changing to archived
-            elif update_data.status == "archived":
-                update_dict["archived_at"] = datetime.utcnow().isoformat()
         if update_data.background_image_url is not None:
             update_dict["background_image_url"] = update_data.background_image_url
         if update_data.background_color is not None:
@@ -323,23 +365,39 @@ async def update_announcement(
             update_dict["target_faculties"] = update_data.target_audience.faculties
             update_dict["target_academic_levels"] = update_data.target_audience.academic_levels
         
-        update_dict["updated_at"] = datetime.utcnow().isoformat()
-        
-        # Update
-        result = db.table("announcements").update(update_dict).eq("id", announcement_id).execute()
+        # updated_at is stamped by the announcements_set_updated_at trigger; an empty
+        # update still touches it (the UPDATE needs at least one column)
+        if not update_dict:
+            update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+        
+        # This endpoint never touches attachments, views or reactions, so they are
+        # read alongside the UPDATE instead of re-fetching the announcement after it
+        result, attachments, stats, viewed = await db.execute_concurrently(
+            db.table("announcements").update(update_dict).eq("id", announcement_id),
+            db.table("announcement_attachments").select("*").eq("announcement_id", announcement_id),
+            db.rpc("get_announcement_stats_bulk", {"p_ids": [announcement_id]}),
+            db.table("announcement_views").select("announcement_id").eq(
+                "announcement_id", announcement_id
+            ).eq("user_id", admin_id)
+        )
         
+        # An empty RETURNING set means the announcement does not exist
         if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Erreur lors de la mise à jour"
-            )
+            raise HTTPException(status_code=404, detail="Annonce non trouvée")
         
-        # Get full details
-        full_announcement = await get_announcement_with_details(db, announcement_id, admin_id)
+        full_announcement = {
+            **result.data[0],
+            "attachments": attachments.data,
+            "stats": stats.data[0]["stats"] if stats.data else None,
+            "user_has_viewed": bool(viewed.data)
+        }
         
         logger.info(f"Announcement updated by admin {admin_id}: {announcement_id}")
         
-        return AnnouncementResponse(**full_announcement)
+        await cache_invalidate(CACHE_PREFIX)
+        announcement_events.announcement_changed(change_event(full_announcement, "update"))
+        
+        return AnnouncementResponse.model_validate(full_announcement)
     
     except HTTPException:
         raise
@@ -361,17 +419,17 @@ async def delete_announcement(
     Delete an announcement (Admin only)
     """
     try:
-        # Check if exists
-        existing = db.table("announcements").select("id").eq("id", announcement_id).execute()
+        # Delete (cascade will handle attachments, views, reactions)
+        deleted = await db.table("announcements").delete().eq("id", announcement_id).execute_async()
         
-        if not existing.data:
+        if not deleted.data:
             raise HTTPException(status_code=404, detail="Annonce non trouvée")
         
-        # Delete (cascade will handle attachments, views, reactions)
-        db.table("announcements").delete().eq("id", announcement_id).execute()
-        
         logger.info(f"Announcement deleted by admin {admin_id}: {announcement_id}")
         
+        await cache_invalidate(CACHE_PREFIX)
+        announcement_events.announcement_changed({"id": announcement_id, "action": "delete"})
+        
         return {"success": True, "message": "Annonce supprimée avec succès"}
     
     except HTTPException:
@@ -399,7 +457,7 @@ async def add_announcement_attachment(
     """
     try:
         # Check if announcement exists
-        announcement = db.table("announcements").select("id").eq("id", announcement_id).execute()
+        announcement = await db.table("announcements").select("id").eq("id", announcement_id).execute_async()
         
         if not announcement.data:
             raise HTTPException(status_code=404, detail="Annonce non trouvée")
@@ -445,11 +503,10 @@ async def link_announcement_attachment(
             "file_name": file_name,
             "file_size": file_size,
             "mime_type": mime_type,
-            "thumbnail_url": thumbnail_url,
-            "created_at": datetime.utcnow().isoformat()
+            "thumbnail_url": thumbnail_url
         }
         
-        result = db.table("announcement_attachments").insert(attachment_data).execute()
+        result = await db.table("announcement_attachments").insert(attachment_data).execute_async()
         
         if not result.data:
             raise HTTPException(
@@ -459,6 +516,8 @@ async def link_announcement_attachment(
         
         logger.info(f"Attachment added to announcement {announcement_id} by admin {admin_id}")
         
+        await cache_invalidate(CACHE_PREFIX)
+        
         return result.data[0]
     
     except HTTPException:
@@ -471,6 +530,46 @@ async def link_announcement_attachment(
         )
 
 
+@router.post("/{announcement_id}/attachments/bulk")
+async def link_announcement_attachments_bulk(
+    announcement_id: str,
+    payload: AttachmentsBulkCreate,
+    db=Depends(get_db),
+    admin_id: str = Depends(get_current_admin_id)
+):
+    """
+    Link several already uploaded files to announcement in one insert (Admin only)
+    """
+    try:
+        rows = [
+            {"announcement_id": announcement_id, **attachment.model_dump()}
+            for attachment in payload.attachments
+        ]
+        
+        result = await db.table("announcement_attachments").insert(rows).execute_async()
+        
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Erreur lors de l'ajout des pièces jointes"
+            )
+        
+        logger.info(f"{len(result.data)} attachments added to announcement {announcement_id} by admin {admin_id}")
+        
+        await cache_invalidate(CACHE_PREFIX)
+        
+        return result.data
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error linking attachments: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erreur lors de l'ajout des pièces jointes"
+        )
+
+
 # ============================================
 # USER ROUTES
 # ============================================
@@ -484,17 +583,28 @@ async def get_user_announcements(
     """
     Get announcements for current user (filtered by target audience)
     """
+    cache_key = f"{CACHE_PREFIX}user:{user_id}:{limit}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        # Already serialized once: skip response_model validation and encoding
+        return ORJSONResponse(cached)
+    
+    async def load():
+        # Filtered, limited and fully shaped page in one round trip (see get_user_announcement_feed)
+        result = await db.rpc(
+            "get_user_announcement_feed", {"p_user_id": user_id, "p_limit": limit}
+        ).execute_async()
+        
+        page = [
+            AnnouncementResponse.model_validate(flatten_announcement_bundle(bundle)).model_dump(mode="json")
+            for bundle in result.data or []
+        ]
+        await cache_set(cache_key, page, USER_LIST_TTL)
+        return page
+    
     try:
-        # Use the SQL function to get filtered announcements
-        result = db.rpc("get_user_announcements", {"p_user_id": user_id}).execute()
-        
-        # Get full details for each
-        announcements = []
-        for ann in result.data[:limit]:
-            full_ann = await get_announcement_with_details(db, ann["id"], user_id)
-            announcements.append(AnnouncementResponse(**full_ann))
-        
-        return announcements
+        # Concurrent misses for the same key share one feed query
+        return ORJSONResponse(await singleflight(cache_key, load))
     
     except Exception as e:
         logger.error(f"Error fetching user announcements: {e}")
@@ -504,6 +614,45 @@ async def get_user_announcements(
         )
 
 
+@router.get("/stream")
+async def stream_announcement_changes(
+    db=Depends(get_db),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Server-Sent Events stream of announcement changes visible to the current user
+    (clients refetch /user or /{announcement_id} on each event instead of polling)
+    """
+    user = await db.table("users").select("faculty, academic_level").eq("id", user_id).execute_async()
+    if not user.data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Utilisateur non trouvé")
+    
+    faculty = user.data[0]["faculty"]
+    academic_level = user.data[0]["academic_level"]
+    
+    async def event_stream():
+        queue = announcement_events.subscribe()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                if announcement_events.is_visible_to(event, faculty, academic_level):
+                    yield f"event: announcement\ndata: {orjson.dumps(event).decode()}\n\n"
+        finally:
+            announcement_events.unsubscribe(queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{announcement_id}", response_model=AnnouncementResponse)
 async def get_announcement(
     announcement_id: str,
@@ -513,13 +662,22 @@ async def get_announcement(
     """
     Get single announcement details
     """
+    cache_key = f"{CACHE_PREFIX}item:{announcement_id}:{user_id}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        # Already serialized once: skip response_model validation and encoding
+        return ORJSONResponse(cached)
+    
     try:
         full_announcement = await get_announcement_with_details(db, announcement_id, user_id)
         
         if not full_announcement:
             raise HTTPException(status_code=404, detail="Annonce non trouvée")
         
-        return AnnouncementResponse(**full_announcement)
+        response = AnnouncementResponse.model_validate(full_announcement)
+        await cache_set(cache_key, response.model_dump(mode="json"), ITEM_TTL)
+        
+        return response
     
     except HTTPException:
         raise
@@ -541,22 +699,18 @@ async def mark_announcement_viewed(
     Mark announcement as viewed by user
     """
     try:
-        # Check if already viewed
-        existing = db.table("announcement_views").select("id").eq(
-            "announcement_id", announcement_id
-        ).eq("user_id", user_id).execute()
-        
-        if existing.data:
-            return {"success": True, "message": "Déjà marquée comme vue"}
-        
-        # Create view record
-        view_data = {
+        # Idempotent at the DB layer (unique announcement_id, user_id)
+        result = await db.table("announcement_views").upsert({
             "announcement_id": announcement_id,
-            "user_id": user_id,
-            "viewed_at": datetime.utcnow().isoformat()
-        }
+            "user_id": user_id
+        }, on_conflict="announcement_id,user_id", ignore_duplicates=True).execute_async()
         
-        db.table("announcement_views").insert(view_data).execute()
+        # A first view changes the user's view flag and the announcement's total_views
+        # (repeat views return no row and change nothing). Other users' feeds keep their
+        # counters until USER_LIST_TTL: clearing every feed on each view would empty the cache.
+        if result.data:
+            await cache_invalidate(f"{CACHE_PREFIX}user:{user_id}:")
+            await cache_invalidate(f"{CACHE_PREFIX}item:{announcement_id}:")
         
         return {"success": True, "message": "Marquée comme vue"}
     
@@ -579,25 +733,17 @@ async def react_to_announcement(
     Add or update reaction to announcement
     """
     try:
-        # Check if user already reacted
-        existing = db.table("announcement_reactions").select("id").eq(
-            "announcement_id", announcement_id
-        ).eq("user_id", user_id).execute()
-        
-        if existing.data:
-            # Update existing reaction
-            result = db.table("announcement_reactions").update({
-                "reaction": reaction_data.reaction
-            }).eq("announcement_id", announcement_id).eq("user_id", user_id).execute()
-        else:
-            # Create new reaction
-            reaction_record = {
-                "announcement_id": announcement_id,
-                "user_id": user_id,
-                "reaction": reaction_data.reaction,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            result = db.table("announcement_reactions").insert(reaction_record).execute()
+        # Insert or replace the user's reaction in one statement
+        await db.table("announcement_reactions").upsert({
+            "announcement_id": announcement_id,
+            "user_id": user_id,
+            "reaction": reaction_data.reaction
+        }, on_conflict="announcement_id,user_id").execute_async()
+        
+        # Reaction stats changed: fresh in the announcement details and the user's own feed,
+        # other users' feeds catch up within USER_LIST_TTL
+        await cache_invalidate(f"{CACHE_PREFIX}item:{announcement_id}:")
+        await cache_invalidate(f"{CACHE_PREFIX}user:{user_id}:")
         
         return {"success": True, "message": "Réaction ajoutée"}
     
@@ -619,7 +765,7 @@ async def get_announcement_statistics(
     Get announcement statistics (views, reactions)
     """
     try:
-        stats_result = db.rpc("get_announcement_stats", {"p_announcement_id": announcement_id}).execute()
+        stats_result = await db.rpc("get_announcement_stats", {"p_announcement_id": announcement_id}).execute_async()
         
         if not stats_result.data:
             return {
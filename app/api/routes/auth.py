@@ -3,7 +3,7 @@ Authentication routes
 """
 
 from fastapi import APIRouter, HTTPException, status, Header, Request, Depends
-from app.models.user import UserCreate, UserLogin, TokenResponse, UserResponse, UserRole, UserStatus
+from app.models.user import UserCreate, UserLogin, TokenResponse, UserResponse, UserRole, UserStatus, USER_RESPONSE_COLUMNS
 from app.core.database import get_db_session
 from app.core.security import (
     get_password_hash,
@@ -15,6 +15,7 @@ from app.core.security import (
 )
 from datetime import datetime
 from loguru import logger
+import asyncio
 
 router = APIRouter()
 
@@ -28,15 +29,6 @@ async def register(user_data: UserCreate, request: Request, db_session = Depends
     db = DatabaseWrapper(db_session)
     
     try:
-        # Check if email exists
-        existing_user = db.select("users", filters={"email": user_data.email})
-        if existing_user:
-            logger.debug(f"Registration blocked - existing email: {user_data.email} -> {existing_user}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cet email est déjà utilisé. Le système Batera a détecté un doublon."
-            )
-        
         # Generate device ID
         user_agent = request.headers.get("user-agent", "unknown")
         ip_address = request.client.host
@@ -45,7 +37,8 @@ async def register(user_data: UserCreate, request: Request, db_session = Depends
         
         # Create user with password validation
         try:
-            hashed_password = get_password_hash(user_data.password)
+            # bcrypt is CPU-bound: keep it off the event loop
+            hashed_password = await asyncio.to_thread(get_password_hash, user_data.password)
         except ValueError as e:
             logger.error(f"Password hashing error: {e}")
             raise HTTPException(
@@ -63,20 +56,24 @@ async def register(user_data: UserCreate, request: Request, db_session = Depends
             "student_id": user_data.student_id,
             "role": UserRole.STUDENT.value,
             "status": UserStatus.ACTIVE.value,
-            "batera_coins": 5.0,  # Welcome bonus
-            "device_id": encrypted_device_id,
-            "created_at": datetime.utcnow().isoformat(),
-            "last_login": datetime.utcnow().isoformat()
+            "device_id": encrypted_device_id
+            # batera_coins (welcome bonus), created_at and last_login are column defaults
         }
         
-        created_user = db.insert("users", user_insert)
+        # Single round trip: the unique email index rejects duplicates atomically
+        result = await db.table("users").upsert(
+            user_insert, on_conflict="email", ignore_duplicates=True
+        ).execute_async()
         
-        if not created_user:
+        if not result.data:
+            logger.debug(f"Registration blocked - existing email: {user_data.email}")
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Erreur lors de la création du compte. Nathanael a été notifié."
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cet email est déjà utilisé. Le système Batera a détecté un doublon."
             )
         
+        created_user = result.data[0]
+        
         # Create tokens
         token_data = {"sub": str(created_user["id"]), "email": created_user["email"], "role": created_user["role"]}
         access_token = create_access_token(token_data)
@@ -127,7 +124,7 @@ async def login(credentials: UserLogin, request: Request, db_session = Depends(g
     
     try:
         # Get user
-        users = db.select("users", filters={"email": credentials.email})
+        users = await asyncio.to_thread(db.select, "users", filters={"email": credentials.email})
         
         if not users:
             raise HTTPException(
@@ -146,7 +143,7 @@ async def login(credentials: UserLogin, request: Request, db_session = Depends(g
         
         # Check password
         try:
-            password_ok = verify_password(credentials.password, user["password_hash"])
+            password_ok = await asyncio.to_thread(verify_password, credentials.password, user["password_hash"])
         except Exception as e:
             logger.error(f"Password verification error: {e}")
             raise HTTPException(
@@ -179,7 +176,7 @@ async def login(credentials: UserLogin, request: Request, db_session = Depends(g
             # For now, we allow it but log it (can be made stricter)
         
         # Update device ID and last login
-        db.update("users", {
+        await asyncio.to_thread(db.update, "users", {
             "device_id": encrypted_device_id,
             "last_login": datetime.utcnow().isoformat()
         }, filters={"id": user["id"]})
@@ -253,7 +250,7 @@ async def get_current_user(authorization: str = Header(...), db_session = Depend
         user_id = payload.get("sub")
         
         # Get user from database
-        users = db.select("users", filters={"id": user_id})
+        users = await asyncio.to_thread(db.select, "users", filters={"id": user_id}, columns=USER_RESPONSE_COLUMNS)
         
         if not users:
             raise HTTPException(
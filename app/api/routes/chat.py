@@ -2,11 +2,15 @@
 Chat routes - L'Oracle conversation management
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, Header
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional
+import asyncio
+from cachetools import TTLCache
+from loguru import logger
 from app.core.database import get_db
-from app.core.security import decode_token
-from datetime import datetime
+from app.core.auth import get_current_user_id
+from datetime import datetime, timezone
 from pydantic import BaseModel
 from uuid import uuid4
 
@@ -51,27 +55,52 @@ class ChatMessageResponse(BaseModel):
     is_read: bool
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
+CHAT_SESSION_COLUMNS = ", ".join(ChatSessionResponse.model_fields)
+
+# Next message page, fetched while the client is still rendering the current one.
+# Keyed by (user_id, chat_id, before, limit); older pages are immutable so 10s is safe.
+_prefetched_pages: TTLCache = TTLCache(maxsize=10_000, ttl=10)
+_prefetch_tasks: set = set()
+
+
+async def fetch_chat_page(db, chat_id: str, user_id: str, before: Optional[datetime], limit: int):
+    """One page of an owned chat (None when not the owner)"""
+    return (await db.rpc("get_owned_chat_messages", {
+        "p_chat": chat_id,
+        "p_user": user_id,
+        "p_before": before.isoformat() if before else None,
+        "p_limit": limit
+    }).execute_async()).data
+
+
+async def prefetch_chat_page(db, chat_id: str, user_id: str, before: datetime, limit: int):
+    """Warm the page cache for the next scroll request (errors are only logged)"""
+    try:
+        page = await fetch_chat_page(db, chat_id, user_id, before, limit)
+        if page is not None:
+            _prefetched_pages[(user_id, chat_id, before, limit)] = page
+    except Exception as e:
+        logger.warning(f"Chat page prefetch failed for {chat_id}: {e}")
+
+
+def schedule_prefetch(db, chat_id: str, user_id: str, before: datetime, limit: int):
+    """Fire-and-forget prefetch (the task is referenced until done)"""
+    task = asyncio.create_task(prefetch_chat_page(db, chat_id, user_id, before, limit))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
 
 
-@router.get("/sessions", response_model=List[ChatSessionResponse])
+@router.get("/sessions", responses={200: {"model": List[ChatSessionResponse]}})
 async def get_chat_sessions(db = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """Get all chat sessions for user"""
     
-    result = db.table("chat_sessions").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute()
+    # message_count is aggregated from chat_messages by the view (see chat_session_stats_view)
+    result = await db.table("chat_sessions_with_stats").select(
+        CHAT_SESSION_COLUMNS
+    ).eq("user_id", user_id).order("updated_at", desc=True).execute_async()
     
-    return result.data
+    # Rows already have the response shape: serialize directly (model kept for OpenAPI only)
+    return ORJSONResponse(result.data)
 
 
 @router.post("/sessions", response_model=ChatSessionResponse)
@@ -82,40 +111,53 @@ async def create_chat_session(
 ):
     """Create new chat session"""
     
+    now = datetime.now(timezone.utc).isoformat()
     session_data = {
         "id": str(uuid4()),
         "user_id": user_id,
         "title": session.title,
         "course_context": session.course_context,
         "faculty_context": session.faculty_context,
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat(),
+        "created_at": now,
+        "updated_at": now,
         "is_active": True,
         "message_count": 0,
         "total_cost": 0.0
     }
     
-    result = db.table("chat_sessions").insert(session_data).execute()
+    result = await db.table("chat_sessions").insert(session_data).execute_async()
     
     return result.data[0]
 
 
-@router.get("/sessions/{chat_id}/messages", response_model=List[ChatMessageResponse])
+@router.get("/sessions/{chat_id}/messages", responses={200: {"model": List[ChatMessageResponse]}})
 async def get_chat_messages(
     chat_id: str,
+    request: Request,
+    before: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
     db = Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get all messages in a chat session"""
-    
-    # Verify user owns this chat
-    session = db.table("chat_sessions").select("user_id").eq("id", chat_id).execute()
-    if not session.data or session.data[0]["user_id"] != user_id:
+    """Get a page of messages in a chat session (oldest first, older pages via before)"""
+    
+    # Served from the prefetch when the client scrolls to the page we anticipated
+    messages = _prefetched_pages.pop((user_id, chat_id, before, limit), None)
+    if messages is None:
+        # Ownership check and messages in one round trip (NULL when not the owner)
+        messages = await fetch_chat_page(db, chat_id, user_id, before, limit)
+    if messages is None:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    result = db.table("chat_messages").select("*").eq("chat_id", chat_id).order("timestamp").execute()
+    headers = None
+    if len(messages) == limit:
+        # A full page: there may be older messages, point to them and fetch them ahead
+        next_before = datetime.fromisoformat(messages[0]["timestamp"])
+        next_url = request.url.include_query_params(before=next_before.isoformat(), limit=limit)
+        headers = {"Link": f'<{next_url}>; rel="next"'}
+        schedule_prefetch(db, chat_id, user_id, next_before, limit)
     
-    return result.data
+    return ORJSONResponse(messages, headers=headers)
 
 
 @router.post("/sessions/{chat_id}/messages", response_model=ChatMessageResponse)
@@ -127,31 +169,18 @@ async def send_chat_message(
 ):
     """Send a message in chat session"""
     
-    # Verify user owns this chat
-    session = db.table("chat_sessions").select("user_id").eq("id", chat_id).execute()
-    if not session.data or session.data[0]["user_id"] != user_id:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    # Create user message
-    user_message = {
-        "id": str(uuid4()),
-        "chat_id": chat_id,
-        "sender": "user",
-        "type": message.type,
-        "content": message.content,
-        "timestamp": datetime.utcnow().isoformat(),
-        "is_read": True
-    }
+    # Ownership check, message insert and session counter in one round trip
+    created = (await db.rpc("post_chat_message", {
+        "p_chat": chat_id,
+        "p_user": user_id,
+        "p_type": message.type,
+        "p_content": message.content
+    }).execute_async()).data
     
-    result = db.table("chat_messages").insert(user_message).execute()
-    
-    # Update session
-    db.table("chat_sessions").update({
-        "updated_at": datetime.utcnow().isoformat(),
-        "message_count": db.func("message_count + 1")
-    }).eq("id", chat_id).execute()
+    if created is None:
+        raise HTTPException(status_code=403, detail="Access denied")
     
-    return result.data[0]
+    return created
 
 
 @router.delete("/sessions/{chat_id}")
@@ -162,15 +191,19 @@ async def delete_chat_session(
 ):
     """Delete a chat session"""
     
-    # Verify user owns this chat
-    session = db.table("chat_sessions").select("user_id").eq("id", chat_id).execute()
-    if not session.data or session.data[0]["user_id"] != user_id:
+    # Verify user owns this chat (enforced by the filter, not compared in Python)
+    session = await db.table("chat_sessions").select("id").eq("id", chat_id).eq("user_id", user_id).execute_async()
+    if not session.data:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Delete messages first
-    db.table("chat_messages").delete().eq("chat_id", chat_id).execute()
+    await db.table("chat_messages").delete().eq("chat_id", chat_id).execute_async()
     
     # Delete session
-    db.table("chat_sessions").delete().eq("id", chat_id).execute()
+    await db.table("chat_sessions").delete().eq("id", chat_id).execute_async()
+    
+    # Drop any prefetched pages of the deleted chat
+    for key in [k for k in list(_prefetched_pages) if k[1] == chat_id]:
+        _prefetched_pages.pop(key, None)
     
     return {"message": "Chat session deleted"}
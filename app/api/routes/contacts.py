@@ -3,15 +3,19 @@ Contacts & User Discovery API
 Campus OS UNIGOM
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+import orjson
 from uuid import uuid4
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
+from app.core.db_wrapper import rows
 from loguru import logger
+from cachetools import TTLCache
+import re
 import urllib.parse
 
 router = APIRouter()
@@ -34,6 +38,14 @@ class UserSearchResult(BaseModel):
     is_blocked: bool = False
 
 
+# Columns the listings read; rows already have the UserSearchResult shape
+CONTACT_COLUMNS = "id, full_name, email, phone, avatar_url, faculty, academic_level, status"
+
+# sync_phone_contacts bounds: numbers accepted per request, numbers per IN (...) lookup
+MAX_SYNC_PHONES = 2000
+PHONE_LOOKUP_CHUNK = 500
+
+
 class ContactInvite(BaseModel):
     phone: str
     name: Optional[str] = None
@@ -50,34 +62,81 @@ class WhatsAppInviteResponse(BaseModel):
 # HELPER FUNCTIONS
 # ============================================
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
+# Blocked user ids per blocker, shared by the contact listings (invalidated on block/unblock)
+_blocked_cache: TTLCache = TTLCache(maxsize=10_000, ttl=15)
+
+
+async def get_blocked_ids(db, user_id: str) -> frozenset:
+    """Ids blocked by user_id, fetched once and reused across contact endpoints"""
+    blocked_ids = _blocked_cache.get(user_id)
+    if blocked_ids is None:
+        result = await db.table("blocked_users").select("blocked_id").eq("blocker_id", user_id).execute_async()
+        blocked_ids = frozenset(b["blocked_id"] for b in result.data)
+        _blocked_cache[user_id] = blocked_ids
+    return blocked_ids
+
+
+def invalidate_blocked_ids(user_id: str):
+    """Drop the cached block list of user_id"""
+    _blocked_cache.pop(user_id, None)
+
+
+# Typeahead results per (user_id, query, limit); rows only, block flags are merged per request
+_search_cache: TTLCache = TTLCache(maxsize=5_000, ttl=10)
+
+
+async def search_user_rows(db, user_id: str, query: str, limit: int) -> list:
+    """Users matching query on name, email or phone (case-insensitive), briefly cached"""
+    key = (user_id, query.lower(), limit)
+    users = _search_cache.get(key)
+    if users is None:
+        search_pattern = f"%{query}%"
+        result = await db.table("users").select(CONTACT_COLUMNS).or_(
+            f"full_name.ilike.{search_pattern},"
+            f"email.ilike.{search_pattern},"
+            f"phone.ilike.{search_pattern}"
+        ).neq("id", user_id).limit(limit).execute_async()
+        users = rows(result)
+        _search_cache[key] = users
+    return users
+
+
+_NON_DIGITS_RE = re.compile(r"\D+")
+
+
+def digits_only(phone: str) -> str:
+    """Strip everything but digits (spaces, dashes, +, parentheses...)"""
+    return _NON_DIGITS_RE.sub("", phone)
+
+
+def normalize_drc_phone(phone: str) -> str:
+    """Digits with the DRC country code (243) prefix"""
+    clean_phone = digits_only(phone)
+    if clean_phone.startswith('243'):
+        return clean_phone
+    if clean_phone.startswith('0'):
+        return '243' + clean_phone[1:]
+    return '243' + clean_phone
+
+
+# Default invitation message around the inviter's name, URL-encoded once at import
+INVITE_HEAD = "Salut! "
+INVITE_TAIL = (
+    " t'invite à rejoindre Campus OS UNIGOM. "
+    "C'est la plateforme de communication universitaire avec l'Intelligence Batera. "
+    "Télécharge l'app et connecte-toi avec tes camarades! 🎓"
+)
+_INVITE_HEAD_ENCODED = urllib.parse.quote(INVITE_HEAD)
+_INVITE_TAIL_ENCODED = urllib.parse.quote(INVITE_TAIL)
 
 
-def generate_whatsapp_invite_url(phone: str, message: str) -> str:
+def generate_whatsapp_invite_url(phone: str, message: str, encoded_message: Optional[str] = None) -> str:
     """Generate WhatsApp invitation URL"""
-    # Clean phone number (remove spaces, dashes, etc.)
-    clean_phone = ''.join(filter(str.isdigit, phone))
+    clean_phone = normalize_drc_phone(phone)
     
-    # Ensure phone starts with country code (243 for DRC)
-    if not clean_phone.startswith('243'):
-        if clean_phone.startswith('0'):
-            clean_phone = '243' + clean_phone[1:]
-        else:
-            clean_phone = '243' + clean_phone
-    
-    # Encode message for URL
-    encoded_message = urllib.parse.quote(message)
+    # Encode message for URL (unless the caller already has it encoded)
+    if encoded_message is None:
+        encoded_message = urllib.parse.quote(message)
     
     # Generate WhatsApp URL
     whatsapp_url = f"https://wa.me/{clean_phone}?text={encoded_message}"
@@ -102,37 +161,21 @@ async def search_users(
     """
     
     try:
-        # Search in database
-        # Using ilike for case-insensitive search
-        search_pattern = f"%{query}%"
-        
-        # Search by name, email, or phone
-        result = db.table("users").select(
-            "id, full_name, email, phone, avatar_url, faculty, academic_level, status"
-        ).or_(
-            f"full_name.ilike.{search_pattern},"
-            f"email.ilike.{search_pattern},"
-            f"phone.ilike.{search_pattern}"
-        ).neq("id", user_id).limit(limit).execute()
-        
-        users = result.data if hasattr(result, 'data') else (result if isinstance(result, list) else [])
+        # Repeated typeahead queries within a few seconds are served from memory;
+        # copies so the cached rows never carry another request's flags
+        users = [dict(u) for u in await search_user_rows(db, user_id, query, limit)]
         
         # Check if any users are blocked
         if users:
-            user_ids = [u["id"] for u in users]
-            blocked_result = db.table("blocked_users").select("blocked_id").eq(
-                "blocker_id", user_id
-            ).in_("blocked_id", user_ids).execute()
-            
-            blocked_data = blocked_result.data if hasattr(blocked_result, 'data') else []
-            blocked_ids = {b["blocked_id"] for b in blocked_data}
+            blocked_ids = await get_blocked_ids(db, user_id)
             
             # Mark blocked users
             for user in users:
                 user["is_blocked"] = user["id"] in blocked_ids
                 user["is_registered"] = True
         
-        return users
+        # Rows are DB-shaped already: serialize them directly, no per-row validation/encoding
+        return ORJSONResponse(users)
     
     except Exception as e:
         logger.error(f"Error searching users: {e}", exc_info=True)
@@ -157,15 +200,13 @@ async def get_faculty_contacts(
         # If faculty/level not provided, get from current user
         # Exception: admins (role == 'admin') may request broader results
         if (not faculty or not academic_level) and role != 'admin':
-            user = db.table("users").select("faculty, academic_level").eq("id", user_id).execute()
+            user = await db.table("users").select("faculty, academic_level").eq("id", user_id).execute_async()
             if user.data:
                 faculty = faculty or user.data[0].get("faculty")
                 academic_level = academic_level or user.data[0].get("academic_level")
         
         # Build query
-        query = db.table("users").select(
-            "id, full_name, email, phone, avatar_url, faculty, academic_level, status"
-        ).neq("id", user_id)
+        query = db.table("users").select(CONTACT_COLUMNS).neq("id", user_id)
         
         if faculty:
             query = query.eq("faculty", faculty)
@@ -174,25 +215,20 @@ async def get_faculty_contacts(
         # If role == 'admin' and no faculty/academic_level filters provided,
         # admin will receive a broader set (no additional filtering).
         
-        result = query.limit(limit).execute()
+        result = await query.limit(limit).execute_async()
         
-        users = result.data if hasattr(result, 'data') else (result if isinstance(result, list) else [])
+        users = rows(result)
         
         # Check blocked users
         if users:
-            user_ids = [u["id"] for u in users]
-            blocked_result = db.table("blocked_users").select("blocked_id").eq(
-                "blocker_id", user_id
-            ).in_("blocked_id", user_ids).execute()
-            
-            blocked_data = blocked_result.data if hasattr(blocked_result, 'data') else []
-            blocked_ids = {b["blocked_id"] for b in blocked_data}
+            blocked_ids = await get_blocked_ids(db, user_id)
             
             for user in users:
                 user["is_blocked"] = user["id"] in blocked_ids
                 user["is_registered"] = True
         
-        return users
+        # Rows are DB-shaped already: serialize them directly, no per-row validation/encoding
+        return ORJSONResponse(users)
     
     except Exception as e:
         logger.error(f"Error fetching faculty contacts: {e}", exc_info=True)
@@ -210,62 +246,23 @@ async def get_recent_contacts(
     """
     
     try:
-        # Get conversations user is part of
-        participant_result = db.table("conversation_participants").select(
-            "conversation_id"
-        ).eq("user_id", user_id).execute()
-        
-        participant_data = participant_result.data if hasattr(participant_result, 'data') else []
-        
-        if not participant_data:
-            return []
-        
-        conversation_ids = [p["conversation_id"] for p in participant_data]
+        # Direct-conversation partners, most recent first, in one round trip
+        result = await db.rpc(
+            "get_recent_direct_contacts", {"p_user_id": user_id, "p_limit": limit}
+        ).execute_async()
         
-        # Get direct conversations only
-        conv_result = db.table("conversations").select("id").eq(
-            "type", "direct"
-        ).in_("id", conversation_ids).order("last_message_at", desc=True).limit(limit).execute()
-        
-        direct_conv_ids = [c["id"] for c in (conv_result.data if hasattr(conv_result, 'data') else [])]
-        
-        if not direct_conv_ids:
-            return []
-        
-        # Get other participants in these conversations
-        other_participants_result = db.table("conversation_participants").select(
-            "user_id, conversation_id"
-        ).in_("conversation_id", direct_conv_ids).neq("user_id", user_id).execute()
-        
-        other_participants = other_participants_result.data if hasattr(other_participants_result, 'data') else []
-        
-        if not other_participants:
-            return []
-        
-        # Get unique user IDs
-        user_ids = list({p["user_id"] for p in other_participants})
-        
-        # Get user details
-        users_result = db.table("users").select(
-            "id, full_name, email, phone, avatar_url, faculty, academic_level, status"
-        ).in_("id", user_ids).execute()
-        
-        users = users_result.data if hasattr(users_result, 'data') else []
+        users = result.data or []
         
         # Check blocked users
         if users:
-            blocked_result = db.table("blocked_users").select("blocked_id").eq(
-                "blocker_id", user_id
-            ).in_("blocked_id", user_ids).execute()
-            
-            blocked_data = blocked_result.data if hasattr(blocked_result, 'data') else []
-            blocked_ids = {b["blocked_id"] for b in blocked_data}
+            blocked_ids = await get_blocked_ids(db, user_id)
             
             for user in users:
                 user["is_blocked"] = user["id"] in blocked_ids
                 user["is_registered"] = True
         
-        return users
+        # Rows are DB-shaped already: serialize them directly, no per-row validation/encoding
+        return ORJSONResponse(users)
     
     except Exception as e:
         logger.error(f"Error fetching recent contacts: {e}", exc_info=True)
@@ -284,19 +281,17 @@ async def generate_whatsapp_invite(
     
     try:
         # Get current user info
-        user = db.table("users").select("full_name").eq("id", user_id).execute()
+        user = await db.table("users").select("full_name").eq("id", user_id).execute_async()
         user_name = user.data[0]["full_name"] if user.data else "un étudiant"
         
-        # Default invitation message
+        # Default invitation message: only the name needs encoding
+        encoded_message = None
         if not invite.message:
-            invite.message = (
-                f"Salut! {user_name} t'invite à rejoindre Campus OS UNIGOM. "
-                f"C'est la plateforme de communication universitaire avec l'Intelligence Batera. "
-                f"Télécharge l'app et connecte-toi avec tes camarades! 🎓"
-            )
+            invite.message = INVITE_HEAD + user_name + INVITE_TAIL
+            encoded_message = _INVITE_HEAD_ENCODED + urllib.parse.quote(user_name) + _INVITE_TAIL_ENCODED
         
         # Generate WhatsApp URL
-        whatsapp_url = generate_whatsapp_invite_url(invite.phone, invite.message)
+        whatsapp_url = generate_whatsapp_invite_url(invite.phone, invite.message, encoded_message)
         
         # Log invitation attempt
         invite_log = {
@@ -304,11 +299,11 @@ async def generate_whatsapp_invite(
             "inviter_id": user_id,
             "phone": invite.phone,
             "name": invite.name,
-            "invited_at": datetime.utcnow().isoformat(),
+            "invited_at": datetime.now(timezone.utc).isoformat(),
             "invitation_type": "whatsapp"
         }
         
-        db.table("contact_invitations").insert(invite_log).execute()
+        await db.table("contact_invitations").insert(invite_log).execute_async()
         
         return WhatsAppInviteResponse(
             invite_url=whatsapp_url,
@@ -332,11 +327,11 @@ async def get_invited_contacts(
     """
     
     try:
-        result = db.table("contact_invitations").select(
+        result = await db.table("contact_invitations").select(
             "*"
-        ).eq("inviter_id", user_id).order("invited_at", desc=True).limit(limit).execute()
+        ).eq("inviter_id", user_id).order("invited_at", desc=True).limit(limit).execute_async()
         
-        return result.data if hasattr(result, 'data') else []
+        return rows(result)
     
     except Exception as e:
         logger.error(f"Error fetching invited contacts: {e}", exc_info=True)
@@ -364,17 +359,13 @@ async def sync_phone_contacts(
         if not raw:
             raise HTTPException(status_code=400, detail='Empty request body')
 
-        # Try to parse JSON safely (some clients may send plain text or list)
+        # Parse the raw bytes directly (no separate UTF-8 decode; request.json() would
+        # re-parse the same body with stdlib json)
         try:
-            body = json.loads(raw.decode('utf-8'))
-        except Exception as ex_json:
-            logger.debug(f"sync_phone_contacts: json.loads failed: {ex_json}")
-            # Last resort: try request.json() (may raise the same error)
-            try:
-                body = await request.json()
-            except Exception as ex_req:
-                logger.error(f"Error parsing request body for sync_phone_contacts: {ex_req}")
-                raise HTTPException(status_code=400, detail='Invalid JSON body')
+            body = orjson.loads(raw)
+        except orjson.JSONDecodeError as ex_json:
+            logger.error(f"Error parsing request body for sync_phone_contacts: {ex_json}")
+            raise HTTPException(status_code=400, detail='Invalid JSON body')
 
         if isinstance(body, list):
             phone_numbers = body
@@ -386,49 +377,28 @@ async def sync_phone_contacts(
         else:
             raise HTTPException(status_code=400, detail='Invalid request body format')
 
-        # Clean phone numbers to digits and normalize variants
-        clean_numbers = []
-        for phone in phone_numbers:
-            if not isinstance(phone, str):
-                continue
-            clean = ''.join(filter(str.isdigit, phone))
-            if not clean:
-                continue
-            clean_numbers.append(clean)
-
-        # Build a set of possible stored variants for robust matching
-        variants = set()
-        for num in clean_numbers:
-            # If starts with country code (243)
-            if num.startswith('243'):
-                variants.add(num)               # 243XXXXXXXXX
-                variants.add('+' + num)         # +243XXXXXXXXX
-                local = num[3:]
-                variants.add(local)             # XXXXXXXXX
-                variants.add('0' + local)       # 0XXXXXXXXX
-            elif num.startswith('0'):
-                variants.add(num)               # 0XXXXXXXXX
-                local = num[1:]
-                variants.add(local)             # XXXXXXXXX
-                variants.add('243' + local)     # 243XXXXXXXXX
-                variants.add('+243' + local)    # +243XXXXXXXXX
-            else:
-                # Unknown format - include multiple guesses
-                variants.add(num)
-                variants.add('243' + num)
-                variants.add('+243' + num)
-                if len(num) > 6:
-                    variants.add('0' + num)
-
-        # Reduce and limit variants to avoid large queries
-        variants_list = list(variants)[:1000]
-        
-        # Search for registered users
-        result = db.table("users").select(
-            "id, full_name, email, phone, avatar_url, faculty, academic_level, status"
-        ).in_("phone", clean_numbers).neq("id", user_id).execute()
-        
-        registered_users = result.data if hasattr(result, 'data') else []
+        if not isinstance(phone_numbers, list):
+            raise HTTPException(status_code=400, detail='Phone numbers must be a list')
+        if len(phone_numbers) > MAX_SYNC_PHONES:
+            raise HTTPException(status_code=413, detail=f'Too many phone numbers (max {MAX_SYNC_PHONES})')
+
+        # Clean phone numbers to digits, deduplicated in first seen order. The regex
+        # substitution and dict.fromkeys run in C; no per-character Python loop.
+        strip_non_digits = _NON_DIGITS_RE.sub
+        clean_numbers = list(dict.fromkeys(
+            clean
+            for clean in (strip_non_digits("", phone) for phone in phone_numbers if isinstance(phone, str))
+            if clean
+        ))
+        
+        # Search for registered users, in bounded IN (...) chunks run concurrently
+        results = await db.execute_concurrently(*(
+            db.table("users").select(CONTACT_COLUMNS)
+            .in_("phone", clean_numbers[i:i + PHONE_LOOKUP_CHUNK]).neq("id", user_id)
+            for i in range(0, len(clean_numbers), PHONE_LOOKUP_CHUNK)
+        ))
+        
+        registered_users = [user for result in results for user in rows(result)]
         
         # Find registered phone numbers
         registered_phones = {u.get("phone") for u in registered_users if u.get("phone")}
@@ -442,23 +412,19 @@ async def sync_phone_contacts(
         
         # Check blocked users
         if registered_users:
-            user_ids = [u["id"] for u in registered_users]
-            blocked_result = db.table("blocked_users").select("blocked_id").eq(
-                "blocker_id", user_id
-            ).in_("blocked_id", user_ids).execute()
-            
-            blocked_data = blocked_result.data if hasattr(blocked_result, 'data') else []
-            blocked_ids = {b["blocked_id"] for b in blocked_data}
+            blocked_ids = await get_blocked_ids(db, user_id)
             
             for user in registered_users:
                 user["is_blocked"] = user["id"] in blocked_ids
                 user["is_registered"] = True
         
-        return {
+        return ORJSONResponse({
             "registered": registered_users,
             "non_registered": non_registered
-        }
+        })
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error syncing phone contacts: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to sync contacts: {str(e)}")
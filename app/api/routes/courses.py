@@ -2,11 +2,10 @@
 Courses and syllabus routes
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from pydantic import BaseModel
 from app.core.database import get_db_session
-from app.core.security import decode_token
 
 router = APIRouter()
 
@@ -34,20 +33,6 @@ class SyllabusFile(BaseModel):
     uploaded_at: str
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 @router.get("", response_model=CoursesResponse)
 async def list_courses(
     db_session = Depends(get_db_session),
@@ -4,17 +4,34 @@ WhatsApp-Level Chat avec Contrôles Universitaires
 Campus OS UNIGOM
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
+import orjson
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
+from app.core.db_wrapper import rows
+from app.api.routes.contacts import get_blocked_ids, invalidate_blocked_ids
+from app.core.cache import cache_get, cache_set, cache_delete, cache_invalidate
+from app.core import log_queue
+from app.core.user_profiles import peek_user_mini, remember_user_mini
+from app.api.routes.notifications_fcm import invalidate_conversation_meta
 from loguru import logger
 
 router = APIRouter()
 
+# Redis cache-aside TTLs for near-static reads (see app.core.cache)
+AUDITORIUMS_TTL = 300
+BLOCKED_USERS_TTL = 600
+PARTICIPANTS_TTL = 60
+MESSAGE_PAGE_TTL = 30
+
+# Seconds after which a typing indicator is considered stale
+TYPING_INDICATOR_TTL = 5
+
 
 # ============================================
 # MODELS
@@ -73,25 +90,11 @@ class MessageReaction(BaseModel):
 # HELPER FUNCTIONS
 # ============================================
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 async def check_participant_permission(db, conversation_id: str, user_id: str, permission: str) -> bool:
     """Check if user has specific permission in conversation"""
-    result = db.table("conversation_participants").select(permission).eq(
+    result = await db.table("conversation_participants").select(permission).eq(
         "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
+    ).eq("user_id", user_id).execute_async()
     
     if not result.data:
         return False
@@ -99,35 +102,109 @@ async def check_participant_permission(db, conversation_id: str, user_id: str, p
     return result.data[0].get(permission, False)
 
 
+def membership_query(db, conversation_id: str, user_id: str):
+    """HEAD count of the user's participant row (no row payload)"""
+    return db.table("conversation_participants").select("id", count="exact", head=True).eq(
+        "conversation_id", conversation_id
+    ).eq("user_id", user_id)
+
+
+async def is_participant(db, conversation_id: str, user_id: str) -> bool:
+    """Check if user is a participant of the conversation"""
+    return (await membership_query(db, conversation_id, user_id).execute_async()).count > 0
+
+
 async def check_blocked(db, user_id: str, target_id: str) -> bool:
-    """Check if users have blocked each other"""
-    result = db.table("blocked_users").select("id").or_(
-        f"and(blocker_id.eq.{user_id},blocked_id.eq.{target_id}),"
-        f"and(blocker_id.eq.{target_id},blocked_id.eq.{user_id})"
-    ).execute()
-    
-    return len(result.data) > 0
+    """Check if users have blocked each other (set membership on the cached block lists)"""
+    if target_id in await get_blocked_ids(db, user_id):
+        return True
+    return user_id in await get_blocked_ids(db, target_id)
+
+
+# Rejection reasons returned by edit_own_message / delete_own_message
+MESSAGE_ERRORS = {
+    "not_found": (404, "Message not found"),
+    "not_sender": (403, "Can only {action} own messages"),
+    "not_text": (400, "Can only edit text messages"),
+    "not_participant": (403, "Not a participant"),
+}
+MESSAGE_TIME_LIMITS = {
+    "edit": "Can only edit messages within 15 minutes",
+    "delete": "Can only delete for everyone within 1 hour",
+}
+
+
+def raise_for_message_error(data, action: str):
+    """Map an {"error": reason} RPC result to the matching HTTPException"""
+    if not isinstance(data, dict) or "error" not in data:
+        return
+    
+    reason = data["error"]
+    if reason == "too_late":
+        raise HTTPException(status_code=400, detail=MESSAGE_TIME_LIMITS[action])
+    status_code, detail = MESSAGE_ERRORS.get(reason, (400, reason))
+    raise HTTPException(status_code=status_code, detail=detail.format(action=action))
+
+
+def message_page_keys(user_id: str, conversation_id: str, oldest: dict, limit: int) -> List[str]:
+    """Redis keys of the page older than oldest, by message id and by timestamp cursor"""
+    prefix = f"msgpage:{conversation_id}:{user_id}"
+    created_at = datetime.fromisoformat(str(oldest["created_at"])).isoformat()
+    return [f"{prefix}:id:{oldest['id']}:{limit}", f"{prefix}:ts:{created_at}:{limit}"]
+
+
+async def prefetch_older_messages(user_id: str, conversation_id: str, oldest: dict, limit: int):
+    """Load the page before oldest into Redis while the client renders the current one"""
+    try:
+        result = await get_db().rpc("get_messages_with_reactions", {
+            "p_conversation": conversation_id,
+            "p_before": str(oldest["created_at"]),
+            "p_limit": limit
+        }).execute_async()
+        for key in message_page_keys(user_id, conversation_id, oldest, limit):
+            await cache_set(key, result.data or [], MESSAGE_PAGE_TTL)
+    except Exception as e:
+        logger.warning(f"Message page prefetch failed for {conversation_id}: {e}")
 
 
-async def verify_auditorium_access(db, user_id: str, auditorium_id: str) -> bool:
-    """Verify user has access to auditorium (same faculty/level)"""
-    # Get user info
-    user = db.table("users").select("faculty, academic_level").eq("id", user_id).execute()
-    if not user.data:
-        return False
-    
-    user_data = user.data[0]
-    
-    # Get auditorium info
-    auditorium = db.table("auditoriums").select("faculty, academic_level").eq("id", auditorium_id).execute()
+def member_rows(conversation_id: str, user_ids, added_by: str, joined_at: str) -> List[dict]:
+    """conversation_participants rows for new members: shared fields built once, merged per row"""
+    base = {
+        "conversation_id": conversation_id,
+        "role": "member",
+        "can_send_messages": True,
+        "added_by": added_by,
+        "joined_at": joined_at
+    }
+    return [{**base, "id": str(uuid4()), "user_id": uid} for uid in user_ids]
+
+
+def participants_cache_key(conversation_id: str) -> str:
+    """Redis key of a conversation's participant list"""
+    return f"conversation:{conversation_id}:participants"
+
+
+async def users_without_auditorium_access(db, user_ids: List[str], auditorium_id: str) -> List[str]:
+    """Names of the users lacking access to the auditorium (same faculty/level), in request order"""
+    auditorium, users = await db.execute_concurrently(
+        db.table("auditoriums").select("faculty, academic_level").eq("id", auditorium_id),
+        db.table("users").select("id, full_name, faculty, academic_level").in_("id", user_ids)
+    )
     if not auditorium.data:
-        return False
+        return list(user_ids)
     
     aud_data = auditorium.data[0]
+    users_by_id = {u["id"]: u for u in rows(users)}
     
-    # Check match
-    return (user_data["faculty"] == aud_data["faculty"] and 
-            user_data["academic_level"] == aud_data["academic_level"])
+    denied = []
+    for uid in user_ids:
+        user_data = users_by_id.get(uid)
+        if not user_data:
+            denied.append(uid)
+        elif (user_data["faculty"] != aud_data["faculty"] or
+              user_data["academic_level"] != aud_data["academic_level"]):
+            denied.append(user_data["full_name"] or uid)
+    return denied
 
 
 # ============================================
@@ -143,11 +220,11 @@ async def get_conversations(
     
     try:
         # Get conversations user is part of
-        participant_result = db.table("conversation_participants").select(
+        participant_result = await db.table("conversation_participants").select(
             "conversation_id, role, is_muted, is_pinned, last_read_at"
-        ).eq("user_id", user_id).execute()
+        ).eq("user_id", user_id).execute_async()
         
-        participant_data = participant_result.data if hasattr(participant_result, 'data') else (participant_result if isinstance(participant_result, list) else [])
+        participant_data = rows(participant_result)
         
         if not participant_data:
             return []
@@ -156,8 +233,38 @@ async def get_conversations(
         participant_map = {p["conversation_id"]: p for p in participant_data}
         
         # Get conversation details
-        conv_result = db.table("conversations").select("*").in_("id", conversation_ids).eq("is_active", True).order("last_message_at", desc=True).execute()
-        conversations = conv_result.data if hasattr(conv_result, 'data') else (conv_result if isinstance(conv_result, list) else [])
+        conv_result = await db.table("conversations").select("*").in_("id", conversation_ids).eq("is_active", True).order("last_message_at", desc=True).execute_async()
+        conversations = rows(conv_result)
+        
+        if not conversations:
+            return []
+        
+        conversation_ids = [conv["id"] for conv in conversations]
+        direct_ids = [conv["id"] for conv in conversations if conv.get("type") == "direct"]
+        
+        # Fixed number of bulk queries, joined in memory below
+        last_msg_result, unread_result = await db.execute_concurrently(
+            db.rpc("get_last_messages_per_conversation", {"p_ids": conversation_ids}),
+            db.rpc("get_unread_counts", {"p_user_id": user_id, "p_ids": conversation_ids})
+        )
+        
+        last_messages = {m["conversation_id"]: m for m in rows(last_msg_result)}
+        unread_counts = {r["conversation_id"]: r["unread_count"] for r in rows(unread_result)}
+        
+        # Other participant of each direct chat, with their profiles in one lookup
+        other_ids = {}
+        if direct_ids:
+            others_result = await db.table("conversation_participants").select("conversation_id, user_id").in_(
+                "conversation_id", direct_ids
+            ).neq("user_id", user_id).execute_async()
+            for p in rows(others_result):
+                other_ids.setdefault(p["conversation_id"], p["user_id"])
+        other_users = {}
+        if other_ids:
+            users_result = await db.table("users").select("id, full_name, avatar_url, status").in_(
+                "id", list(set(other_ids.values()))
+            ).execute_async()
+            other_users = {u["id"]: u for u in rows(users_result)}
         
         # Enrich with participant info
         enriched = []
@@ -166,37 +273,23 @@ async def get_conversations(
             if conv_id not in participant_map:
                 continue
             
-            conv["user_role"] = participant_map[conv_id]["role"]
-            conv["is_muted"] = participant_map[conv_id]["is_muted"]
-            conv["is_pinned"] = participant_map[conv_id]["is_pinned"]
-            conv["last_read_at"] = participant_map[conv_id]["last_read_at"]
-            
-            # Get unread count
-            last_read = participant_map[conv_id]["last_read_at"] or "1970-01-01"
-            unread_result = db.table("chat_messages").select("id").eq("conversation_id", conv_id).gt("created_at", last_read).execute()
-            unread_msgs = unread_result.data if hasattr(unread_result, 'data') else (unread_result if isinstance(unread_result, list) else [])
-            conv["unread_count"] = len(unread_msgs)
+            participant = participant_map[conv_id]
+            conv["user_role"] = participant["role"]
+            conv["is_muted"] = participant["is_muted"]
+            conv["is_pinned"] = participant["is_pinned"]
+            conv["last_read_at"] = participant["last_read_at"]
+            conv["unread_count"] = unread_counts.get(conv_id, 0)
+            conv["last_message"] = last_messages.get(conv_id)
             
-            # Get last message
-            last_msg_result = db.table("chat_messages").select("*").eq("conversation_id", conv_id).order("created_at", desc=True).limit(1).execute()
-            last_msgs = last_msg_result.data if hasattr(last_msg_result, 'data') else (last_msg_result if isinstance(last_msg_result, list) else [])
-            conv["last_message"] = last_msgs[0] if last_msgs else None
-            
-            # For direct chats, get other participant info
-            if conv.get("type") == "direct":
-                other_result = db.table("conversation_participants").select("user_id").eq("conversation_id", conv_id).neq("user_id", user_id).execute()
-                others = other_result.data if hasattr(other_result, 'data') else (other_result if isinstance(other_result, list) else [])
-                
-                if others:
-                    other_user_result = db.table("users").select("id, full_name, avatar_url, status").eq("id", others[0]["user_id"]).execute()
-                    other_users = other_user_result.data if hasattr(other_user_result, 'data') else (other_user_result if isinstance(other_user_result, list) else [])
-                    
-                    if other_users:
-                        conv["other_participant"] = other_users[0]
+            # For direct chats, other participant info
+            other_user = other_users.get(other_ids.get(conv_id))
+            if other_user:
+                conv["other_participant"] = other_user
             
             enriched.append(conv)
         
-        return enriched
+        # Straight to orjson: no jsonable_encoder pass over every conversation dict
+        return ORJSONResponse(enriched)
     
     except Exception as e:
         logger.error(f"Error fetching conversations: {e}", exc_info=True)
@@ -220,31 +313,31 @@ async def create_conversation(
         if len(conversation.participant_ids) != 1:
             raise HTTPException(status_code=400, detail="Direct chat requires exactly 1 other participant")
         
-        other_user_id = conversation.participant_ids[0]
+        # Block check, lookup and creation in one transaction (see create_or_get_direct)
+        result = await db.rpc("create_or_get_direct", {
+            "p_user": user_id,
+            "p_other": conversation.participant_ids[0]
+        }).execute_async()
         
-        # Check if blocked
-        if await check_blocked(db, user_id, other_user_id):
+        if result.data is None:
+            raise HTTPException(status_code=500, detail="Failed to create conversation")
+        if result.data.get("error") == "blocked":
             raise HTTPException(status_code=403, detail="Cannot create conversation with blocked user")
         
-        # Check if conversation exists
-        existing = db.rpc("get_direct_conversation", {
-            "user1": user_id,
-            "user2": other_user_id
-        }).execute()
-        
-        if existing.data:
-            return existing.data[0]
+        return result.data
     
     # For groups, validate participants can access auditorium
-    if conversation.type == 'group' and conversation.auditorium_id:
-        for participant_id in conversation.participant_ids:
-            if not await verify_auditorium_access(db, participant_id, conversation.auditorium_id):
-                user_info = db.table("users").select("full_name").eq("id", participant_id).execute()
-                user_name = user_info.data[0]["full_name"] if user_info.data else participant_id
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"User {user_name} n'a pas accès à cet auditoire"
-                )
+    if conversation.type == 'group' and conversation.auditorium_id and conversation.participant_ids:
+        denied = await users_without_auditorium_access(db, conversation.participant_ids, conversation.auditorium_id)
+        if denied:
+            raise HTTPException(
+                status_code=403,
+                detail=f"User {denied[0]} n'a pas accès à cet auditoire"
+            )
+    
+    # One timestamp for every row this request writes
+    now = datetime.now(timezone.utc).isoformat()
+    is_group = conversation.type in ['group', 'broadcast']
     
     # Create conversation
     conv_id = str(uuid4())
@@ -258,53 +351,48 @@ async def create_conversation(
         "auditorium_id": conversation.auditorium_id,
         "course_code": conversation.course_code,
         "created_by": user_id,
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat()
+        "created_at": now,
+        "updated_at": now
     }
     
-    db.table("conversations").insert(conv_data).execute()
+    await db.table("conversations").insert(conv_data).execute_async()
     
     # Add creator as super_admin (for groups)
     participant_data = {
         "id": str(uuid4()),
         "conversation_id": conv_id,
         "user_id": user_id,
-        "role": "super_admin" if conversation.type in ['group', 'broadcast'] else "member",
+        "role": "super_admin" if is_group else "member",
         "can_send_messages": True,
-        "can_add_members": True if conversation.type in ['group', 'broadcast'] else False,
-        "can_remove_members": True if conversation.type in ['group', 'broadcast'] else False,
-        "can_edit_group_info": True if conversation.type in ['group', 'broadcast'] else False,
-        "can_delete_messages": True if conversation.type in ['group', 'broadcast'] else False,
-        "joined_at": datetime.utcnow().isoformat()
+        "can_add_members": is_group,
+        "can_remove_members": is_group,
+        "can_edit_group_info": is_group,
+        "can_delete_messages": is_group,
+        "joined_at": now
     }
     
-    db.table("conversation_participants").insert(participant_data).execute()
+    await db.table("conversation_participants").insert(participant_data).execute_async()
     
-    # Add other participants
-    for participant_id in conversation.participant_ids:
-        if participant_id != user_id:
-            p_data = {
-                "id": str(uuid4()),
-                "conversation_id": conv_id,
-                "user_id": participant_id,
-                "role": "member",
-                "can_send_messages": True,
-                "added_by": user_id,
-                "joined_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversation_participants").insert(p_data).execute()
+    # Add other participants in one insert
+    other_participants = member_rows(
+        conv_id,
+        (pid for pid in dict.fromkeys(conversation.participant_ids) if pid != user_id),
+        user_id,
+        now
+    )
+    if other_participants:
+        await db.table("conversation_participants").insert(other_participants).execute_async()
     
     # Create system message for group creation
-    if conversation.type in ['group', 'broadcast']:
+    if is_group:
         system_msg = {
             "id": str(uuid4()),
             "conversation_id": conv_id,
             "sender_id": user_id,
             "content": f"Groupe créé par {user_id}",
-            "message_type": "system",
-            "created_at": datetime.utcnow().isoformat()
+            "message_type": "system"
         }
-        db.table("chat_messages").insert(system_msg).execute()
+        await db.table("chat_messages").insert(system_msg).execute_async()
     
     return conv_data
 
@@ -317,17 +405,25 @@ async def get_conversation(
 ):
     """Get conversation details"""
     
-    # Verify user is participant
-    participant = db.table("conversation_participants").select("*").eq(
-        "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
+    # Membership, conversation and participant list are independent reads
+    # (the participant list is served from Redis when cached)
+    cached_participants = await cache_get(participants_cache_key(conversation_id))
+    queries = [
+        db.table("conversation_participants").select("*").eq(
+            "conversation_id", conversation_id
+        ).eq("user_id", user_id),
+        db.table("conversations").select("*").eq("id", conversation_id)
+    ]
+    if cached_participants is None:
+        queries.append(db.table("conversation_participants").select(
+            "*, users!conversation_participants_user_id_fkey(id, full_name, avatar_url, faculty, academic_level)"
+        ).eq("conversation_id", conversation_id))
+    participant, conversation, *participants = await db.execute_concurrently(*queries)
     
+    # Verify user is participant
     if not participant.data:
         raise HTTPException(status_code=403, detail="Not a participant of this conversation")
     
-    # Get conversation
-    conversation = db.table("conversations").select("*").eq("id", conversation_id).execute()
-    
     if not conversation.data:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -335,18 +431,16 @@ async def get_conversation(
     conv["user_role"] = participant.data[0]["role"]
     conv["user_permissions"] = participant.data[0]
     
-    # Get creator info
+    # Get creator info (only once access is validated)
     if conv.get("created_by"):
-        creator_info = db.table("users").select("id, full_name, avatar_url").eq("id", conv["created_by"]).execute()
+        creator_info = await db.table("users").select("id, full_name, avatar_url").eq("id", conv["created_by"]).execute_async()
         if creator_info.data:
             conv["creator"] = creator_info.data[0]
     
-    # Get all participants
-    participants = db.table("conversation_participants").select(
-        "*, users!conversation_participants_user_id_fkey(id, full_name, avatar_url, faculty, academic_level)"
-    ).eq("conversation_id", conversation_id).execute()
-    
-    conv["participants"] = participants.data
+    if cached_participants is None:
+        cached_participants = participants[0].data
+        await cache_set(participants_cache_key(conversation_id), cached_participants, PARTICIPANTS_TTL)
+    conv["participants"] = cached_participants
     
     return conv
 
@@ -365,9 +459,10 @@ async def update_conversation(
         raise HTTPException(status_code=403, detail="No permission to edit group info")
     
     update_data = updates.dict(exclude_unset=True)
-    update_data["updated_at"] = datetime.utcnow().isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    result = db.table("conversations").update(update_data).eq("id", conversation_id).execute()
+    result = await db.table("conversations").update(update_data).eq("id", conversation_id).execute_async()
+    invalidate_conversation_meta(conversation_id)
     
     return result.data[0] if result.data else None
 
@@ -381,15 +476,11 @@ async def delete_conversation(
     """Delete/leave conversation"""
     
     # Check if user is participant
-    participant = db.table("conversation_participants").select("role").eq(
-        "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
-    
-    if not participant.data:
+    if not await is_participant(db, conversation_id, user_id):
         raise HTTPException(status_code=403, detail="Not a participant")
     
     # Get conversation type
-    conversation = db.table("conversations").select("type, created_by").eq("id", conversation_id).execute()
+    conversation = await db.table("conversations").select("type, created_by").eq("id", conversation_id).execute_async()
     
     if not conversation.data:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -399,12 +490,15 @@ async def delete_conversation(
     
     # For direct chats or if user is creator, mark as inactive
     if conv_type == 'direct' or created_by == user_id:
-        db.table("conversations").update({"is_active": False}).eq("id", conversation_id).execute()
+        await db.table("conversations").update({"is_active": False}).eq("id", conversation_id).execute_async()
+        await cache_invalidate(f"msgpage:{conversation_id}:")
     else:
-        # For groups, just remove user
-        db.table("conversation_participants").update({
-            "left_at": datetime.utcnow().isoformat()
-        }).eq("conversation_id", conversation_id).eq("user_id", user_id).execute()
+        # For groups, just remove user (and the history pages prefetched for them)
+        await db.table("conversation_participants").update({
+            "left_at": datetime.now(timezone.utc).isoformat()
+        }).eq("conversation_id", conversation_id).eq("user_id", user_id).execute_async()
+        await cache_delete(participants_cache_key(conversation_id))
+        await cache_invalidate(f"msgpage:{conversation_id}:{user_id}:")
     
     return {"message": "Conversation deleted/left successfully"}
 
@@ -416,56 +510,56 @@ async def delete_conversation(
 @router.get("/conversations/{conversation_id}/messages")
 async def get_messages(
     conversation_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
     limit: int = 50,
     before: Optional[str] = None,  # message_id for pagination
+    before_created_at: Optional[datetime] = None,  # timestamp cursor (created_at of the oldest shown message)
     db=Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get messages in conversation with pagination"""
-    
-    # Verify user is participant
-    participant = db.table("conversation_participants").select("id").eq(
-        "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
-    
-    if not participant.data:
-        raise HTTPException(status_code=403, detail="Not a participant")
-    
-    # Build query
-    query = db.table("chat_messages").select(
-        "*, sender:users(id, full_name, avatar_url)"
-    ).eq("conversation_id", conversation_id).eq("is_deleted", False)
-    
-    if before:
-        # Get timestamp of 'before' message
-        before_msg = db.table("chat_messages").select("created_at").eq("id", before).execute()
-        if before_msg.data:
-            query = query.lt("created_at", before_msg.data[0]["created_at"])
-    
-    result = query.order("created_at", desc=True).limit(limit).execute()
-    
-    messages = result.data[::-1]  # Reverse to chronological order
-    
-    # Get reactions for each message
-    if messages:
-        message_ids = [msg["id"] for msg in messages]
-        reactions = db.table("message_reactions").select(
-            "message_id, reaction, user_id, users(full_name)"
-        ).in_("message_id", message_ids).execute()
+    """Get messages in conversation with pagination (NDJSON stream when requested via Accept)"""
+    
+    # Older pages prefetched for this user by the previous scroll step (membership was
+    # checked when they were loaded, leaving or being removed drops them)
+    messages = None
+    if before_created_at:
+        messages = await cache_get(f"msgpage:{conversation_id}:{user_id}:ts:{before_created_at.isoformat()}:{limit}")
+    elif before:
+        messages = await cache_get(f"msgpage:{conversation_id}:{user_id}:id:{before}:{limit}")
+    
+    if messages is None:
+        # Membership check and the page load overlap; the page is only returned to participants.
+        # Page, senders and reactions come grouped per message in one round trip (oldest first),
+        # a message id cursor is resolved to its created_at inside the same statement.
+        participant, result = await db.execute_concurrently(
+            membership_query(db, conversation_id, user_id),
+            db.rpc("get_messages_with_reactions", {
+                "p_conversation": conversation_id,
+                "p_before": before_created_at.isoformat() if before_created_at else None,
+                "p_limit": limit,
+                "p_before_id": before if not before_created_at else None
+            })
+        )
         
-        # Group reactions by message
-        reactions_by_message = {}
-        for reaction in reactions.data:
-            msg_id = reaction["message_id"]
-            if msg_id not in reactions_by_message:
-                reactions_by_message[msg_id] = []
-            reactions_by_message[msg_id].append(reaction)
+        if not participant.count:
+            raise HTTPException(status_code=403, detail="Not a participant")
         
-        # Add reactions to messages
-        for msg in messages:
-            msg["reactions"] = reactions_by_message.get(msg["id"], [])
+        messages = result.data or []
+    
+    # A full page: warm the next older one after the response is sent
+    if len(messages) == limit:
+        background_tasks.add_task(prefetch_older_messages, user_id, conversation_id, messages[0], limit)
     
-    return messages
+    # One message per line: clients can render the first messages while the rest arrives
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            (orjson.dumps(m) + b"\n" for m in messages),
+            media_type="application/x-ndjson"
+        )
+    
+    # Straight to orjson: no jsonable_encoder pass over every message dict
+    return ORJSONResponse(messages)
 
 
 @router.post("/conversations/{conversation_id}/messages")
@@ -477,35 +571,24 @@ async def send_message(
 ):
     """Send message in conversation"""
     
-    # Check if user can send messages
-    if not await check_participant_permission(db, conversation_id, user_id, "can_send_messages"):
+    # Permission check, insert and embedded sender profile in one round trip
+    # (see insert_message, NULL when the user may not send)
+    result = await db.rpc("insert_message", {
+        "p_conversation": conversation_id,
+        "p_sender": user_id,
+        "p_content": message.content,
+        "p_message_type": message.message_type,
+        "p_media_url": message.media_url,
+        "p_reply_to": message.reply_to_message_id,
+        "p_latitude": message.latitude,
+        "p_longitude": message.longitude,
+        "p_location_name": message.location_name
+    }).execute_async()
+    
+    if result.data is None:
         raise HTTPException(status_code=403, detail="No permission to send messages")
     
-    # Create message
-    msg_id = str(uuid4())
-    msg_data = {
-        "id": msg_id,
-        "conversation_id": conversation_id,
-        "sender_id": user_id,
-        "content": message.content,
-        "message_type": message.message_type,
-        "media_url": message.media_url,
-        "reply_to_message_id": message.reply_to_message_id,
-        "latitude": message.latitude,
-        "longitude": message.longitude,
-        "location_name": message.location_name,
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    result = db.table("chat_messages").insert(msg_data).execute()
-    
-    if result:
-        # Fetch sender info to include in response
-        sender_info = db.table("users").select("id, full_name, avatar_url").eq("id", user_id).execute()
-        if sender_info.data:
-            result["sender"] = sender_info.data[0]
-    
-    return result
+    return result.data
 
 
 @router.put("/messages/{message_id}")
@@ -517,35 +600,16 @@ async def edit_message(
 ):
     """Edit message (only text messages, within 15 minutes)"""
     
-    # Get message
-    message = db.table("chat_messages").select("*").eq("id", message_id).execute()
+    # Ownership, type and time checks happen in the UPDATE itself (see edit_own_message)
+    result = await db.rpc("edit_own_message", {
+        "p_message": message_id,
+        "p_user": user_id,
+        "p_content": update.content
+    }).execute_async()
     
-    if not message.data:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    msg = message.data[0]
-    
-    # Check if user is sender
-    if msg["sender_id"] != user_id:
-        raise HTTPException(status_code=403, detail="Can only edit own messages")
-    
-    # Check if message type is text
-    if msg["message_type"] != "text":
-        raise HTTPException(status_code=400, detail="Can only edit text messages")
-    
-    # Check time limit (15 minutes)
-    created_at = datetime.fromisoformat(msg["created_at"].replace('Z', '+00:00'))
-    if (datetime.utcnow() - created_at).total_seconds() > 900:  # 15 minutes
-        raise HTTPException(status_code=400, detail="Can only edit messages within 15 minutes")
-    
-    # Update message
-    result = db.table("chat_messages").update({
-        "content": update.content,
-        "is_edited": True,
-        "edited_at": datetime.utcnow().isoformat()
-    }).eq("id", message_id).execute()
-    
-    return result.data[0] if result.data else None
+    raise_for_message_error(result.data, "edit")
+    await cache_invalidate(f"msgpage:{result.data['conversation_id']}:")
+    return result.data
 
 
 @router.delete("/messages/{message_id}")
@@ -557,37 +621,15 @@ async def delete_message(
 ):
     """Delete message (for self or for everyone)"""
     
-    # Get message
-    message = db.table("chat_messages").select("*, conversation_id").eq("id", message_id).execute()
-    
-    if not message.data:
-        raise HTTPException(status_code=404, detail="Message not found")
+    # Ownership and time checks happen in the UPDATE itself (see delete_own_message)
+    result = await db.rpc("delete_own_message", {
+        "p_message": message_id,
+        "p_user": user_id,
+        "p_for_everyone": for_everyone
+    }).execute_async()
     
-    msg = message.data[0]
-    
-    # Check if user is sender
-    if msg["sender_id"] != user_id:
-        raise HTTPException(status_code=403, detail="Can only delete own messages")
-    
-    if for_everyone:
-        # Check if within time limit (1 hour)
-        created_at = datetime.fromisoformat(msg["created_at"].replace('Z', '+00:00'))
-        if (datetime.utcnow() - created_at).total_seconds() > 3600:  # 1 hour
-            raise HTTPException(status_code=400, detail="Can only delete for everyone within 1 hour")
-        
-        # Mark as deleted for everyone
-        result = db.table("chat_messages").update({
-            "is_deleted": True,
-            "deleted_at": datetime.utcnow().isoformat(),
-            "deleted_for_everyone": True,
-            "content": "Ce message a été supprimé"
-        }).eq("id", message_id).execute()
-    else:
-        # Just mark as deleted for user (soft delete)
-        result = db.table("chat_messages").update({
-            "is_deleted": True,
-            "deleted_at": datetime.utcnow().isoformat()
-        }).eq("id", message_id).execute()
+    raise_for_message_error(result.data, "delete")
+    await cache_invalidate(f"msgpage:{result.data['conversation_id']}:")
     
     return {"message": "Message deleted"}
 
@@ -599,34 +641,20 @@ async def add_reaction(
     db=Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Add reaction to message"""
-    
-    # Verify message exists and user has access
-    message = db.table("chat_messages").select("conversation_id").eq("id", message_id).execute()
+    """Toggle a reaction on a message (adds it, or removes it when already there)"""
     
-    if not message.data:
-        raise HTTPException(status_code=404, detail="Message not found")
+    # Access check and insert-or-delete in one atomic call (see toggle_reaction)
+    result = await db.rpc("toggle_reaction", {
+        "p_message": message_id,
+        "p_user": user_id,
+        "p_reaction": reaction_data.reaction
+    }).execute_async()
     
-    # Verify user is participant
-    participant = db.table("conversation_participants").select("id").eq(
-        "conversation_id", message.data[0]["conversation_id"]
-    ).eq("user_id", user_id).execute()
-    
-    if not participant.data:
-        raise HTTPException(status_code=403, detail="Not a participant")
+    raise_for_message_error(result.data, "react to")
     
-    # Add reaction (upsert)
-    reaction_entry = {
-        "id": str(uuid4()),
-        "message_id": message_id,
-        "user_id": user_id,
-        "reaction": reaction_data.reaction,
-        "created_at": datetime.utcnow().isoformat()
-    }
-    
-    result = db.table("message_reactions").upsert(reaction_entry).execute()
-    
-    return result.data[0] if result.data else None
+    if result.data["action"] == "removed":
+        return {"message": "Reaction removed"}
+    return result.data["reaction"]
 
 
 @router.delete("/messages/{message_id}/reactions")
@@ -638,46 +666,47 @@ async def remove_reaction(
 ):
     """Remove reaction from message"""
     
-    result = db.table("message_reactions").delete().eq(
+    result = await db.table("message_reactions").delete().eq(
         "message_id", message_id
-    ).eq("user_id", user_id).eq("reaction", reaction).execute()
+    ).eq("user_id", user_id).eq("reaction", reaction).execute_async()
     
     return {"message": "Reaction removed"}
 
 
-@router.post("/messages/{message_id}/status")
+async def mark_message_read(message_id: str, user_id: str):
+    """Move the reader's last_read_at to message_id (background task, errors only logged)"""
+    try:
+        await get_db().rpc("mark_message_read", {"p_message": message_id, "p_user": user_id}).execute_async()
+    except Exception as e:
+        logger.error(f"Failed to mark message {message_id} read for {user_id}: {e}")
+
+
+@router.post("/messages/{message_id}/status", status_code=202)
 async def update_message_status(
     message_id: str,
     status: str,  # 'delivered' or 'read'
-    db=Depends(get_db),
+    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Update message status (delivered/read)"""
+    """Update message status (delivered/read), written behind the response"""
     
     if status not in ['delivered', 'read']:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    # Update or insert status
-    status_entry = {
+    # Receipts are batched with the other deferred rows (one multi-row insert per flush)
+    log_queue.enqueue("message_status", {
         "id": str(uuid4()),
         "message_id": message_id,
         "user_id": user_id,
         "status": status,
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    
-    result = db.table("message_status").upsert(status_entry).execute()
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
     
-    # If status is 'read', update participant's last_read_at
+    # If status is 'read', update participant's last_read_at after responding
     if status == 'read':
-        message = db.table("chat_messages").select("conversation_id").eq("id", message_id).execute()
-        if message.data:
-            db.table("conversation_participants").update({
-                "last_read_at": datetime.utcnow().isoformat(),
-                "last_read_message_id": message_id
-            }).eq("conversation_id", message.data[0]["conversation_id"]).eq("user_id", user_id).execute()
+        background_tasks.add_task(mark_message_read, message_id, user_id)
     
-    return result.data[0] if result.data else None
+    return {"accepted": True}
 
 
 # ============================================
@@ -698,7 +727,7 @@ async def add_participants(
         raise HTTPException(status_code=403, detail="No permission to add members")
     
     # Get conversation details for auditorium validation
-    conversation = db.table("conversations").select("auditorium_id, type").eq("id", conversation_id).execute()
+    conversation = await db.table("conversations").select("auditorium_id, type").eq("id", conversation_id).execute_async()
     
     if not conversation.data:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -706,50 +735,44 @@ async def add_participants(
     conv = conversation.data[0]
     
     # Validate auditorium access for new participants
-    if conv["auditorium_id"]:
-        for new_user_id in request.user_ids:
-            if not await verify_auditorium_access(db, new_user_id, conv["auditorium_id"]):
-                user_info = db.table("users").select("full_name").eq("id", new_user_id).execute()
-                user_name = user_info.data[0]["full_name"] if user_info.data else new_user_id
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"User {user_name} n'a pas accès à cet auditoire"
-                )
-    
-    # Add participants
-    added_users = []
-    for new_user_id in request.user_ids:
-        # Check if already participant
-        existing = db.table("conversation_participants").select("id").eq(
+    if conv["auditorium_id"] and request.user_ids:
+        denied = await users_without_auditorium_access(db, request.user_ids, conv["auditorium_id"])
+        if denied:
+            raise HTTPException(
+                status_code=403,
+                detail=f"User {denied[0]} n'a pas accès à cet auditoire"
+            )
+    
+    # Existing memberships and names of the candidates, one query each
+    candidate_ids = list(dict.fromkeys(request.user_ids))
+    existing, user_info = await db.execute_concurrently(
+        db.table("conversation_participants").select("user_id").eq(
             "conversation_id", conversation_id
-        ).eq("user_id", new_user_id).execute()
+        ).in_("user_id", candidate_ids),
+        db.table("users").select("id, full_name").in_("id", candidate_ids)
+    )
+    already_in = {p["user_id"] for p in rows(existing)}
+    names = {u["id"]: u["full_name"] for u in rows(user_info)}
+    
+    added_users = [uid for uid in candidate_ids if uid not in already_in]
+    
+    # Participants and their system messages, one bulk insert each
+    if added_users:
+        joined_at = datetime.now(timezone.utc).isoformat()
+        await db.table("conversation_participants").insert(
+            member_rows(conversation_id, added_users, user_id, joined_at)
+        ).execute_async()
         
-        if not existing.data:
-            participant_data = {
-                "id": str(uuid4()),
-                "conversation_id": conversation_id,
-                "user_id": new_user_id,
-                "role": "member",
-                "can_send_messages": True,
-                "added_by": user_id,
-                "joined_at": datetime.utcnow().isoformat()
-            }
-            db.table("conversation_participants").insert(participant_data).execute()
-            added_users.append(new_user_id)
-            
-            # Create system message
-            user_info = db.table("users").select("full_name").eq("id", new_user_id).execute()
-            user_name = user_info.data[0]["full_name"] if user_info.data else "Utilisateur"
-            
-            system_msg = {
+        system_base = {"conversation_id": conversation_id, "sender_id": user_id, "message_type": "system"}
+        await db.table("chat_messages").insert([
+            {
+                **system_base,
                 "id": str(uuid4()),
-                "conversation_id": conversation_id,
-                "sender_id": user_id,
-                "content": f"{user_name} a été ajouté au groupe",
-                "message_type": "system",
-                "created_at": datetime.utcnow().isoformat()
+                "content": f"{names.get(new_user_id, 'Utilisateur')} a été ajouté au groupe"
             }
-            db.table("chat_messages").insert(system_msg).execute()
+            for new_user_id in added_users
+        ]).execute_async()
+        await cache_delete(participants_cache_key(conversation_id))
     
     return {"added_users": added_users}
 
@@ -768,24 +791,38 @@ async def remove_participant(
         if not await check_participant_permission(db, conversation_id, user_id, "can_remove_members"):
             raise HTTPException(status_code=403, detail="No permission to remove members")
     
-    # Remove participant
-    db.table("conversation_participants").update({
-        "left_at": datetime.utcnow().isoformat()
-    }).eq("conversation_id", conversation_id).eq("user_id", participant_id).execute()
+    # Remove participant, looking up the name for the system message meanwhile
+    # (unless the profile cache already has it)
+    leave = db.table("conversation_participants").update({
+        "left_at": datetime.now(timezone.utc).isoformat()
+    }).eq("conversation_id", conversation_id).eq("user_id", participant_id)
+    user = peek_user_mini(participant_id)
+    if user is None:
+        _, user_info = await db.execute_concurrently(
+            leave,
+            db.table("users").select("id, full_name, avatar_url").eq("id", participant_id)
+        )
+        if user_info.data:
+            user = user_info.data[0]
+            remember_user_mini(participant_id, user)
+    else:
+        await leave.execute_async()
     
     # Create system message
-    user_info = db.table("users").select("full_name").eq("id", participant_id).execute()
-    user_name = user_info.data[0]["full_name"] if user_info.data else "Utilisateur"
+    user_name = user["full_name"] if user else "Utilisateur"
     
     system_msg = {
         "id": str(uuid4()),
         "conversation_id": conversation_id,
         "sender_id": user_id,
         "content": f"{user_name} a quitté le groupe",
-        "message_type": "system",
-        "created_at": datetime.utcnow().isoformat()
+        "message_type": "system"
     }
-    db.table("chat_messages").insert(system_msg).execute()
+    await db.table("chat_messages").insert(system_msg).execute_async()
+    
+    await cache_delete(participants_cache_key(conversation_id))
+    # Prefetched pages are served without a membership check
+    await cache_invalidate(f"msgpage:{conversation_id}:{participant_id}:")
     
     return {"message": "Participant removed"}
 
@@ -801,18 +838,19 @@ async def update_participant(
     """Update participant role/permissions"""
     
     # Check if user is admin
-    current_participant = db.table("conversation_participants").select("role").eq(
+    current_participant = await db.table("conversation_participants").select("role").eq(
         "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
+    ).eq("user_id", user_id).execute_async()
     
     if not current_participant.data or current_participant.data[0]["role"] not in ['admin', 'super_admin']:
         raise HTTPException(status_code=403, detail="Only admins can update participant roles")
     
     # Update participant
     update_data = update.dict(exclude_unset=True)
-    result = db.table("conversation_participants").update(update_data).eq(
+    result = await db.table("conversation_participants").update(update_data).eq(
         "conversation_id", conversation_id
-    ).eq("user_id", participant_id).execute()
+    ).eq("user_id", participant_id).execute_async()
+    await cache_delete(participants_cache_key(conversation_id))
     
     return result.data[0] if result.data else None
 
@@ -837,10 +875,12 @@ async def block_user(
         "id": str(uuid4()),
         "blocker_id": user_id,
         "blocked_id": target_id,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    result = db.table("blocked_users").upsert(block_data).execute()
+    result = await db.table("blocked_users").upsert(block_data).execute_async()
+    invalidate_blocked_ids(user_id)
+    await cache_delete(f"blocked:{user_id}")
     
     return {"message": "User blocked"}
 
@@ -853,7 +893,9 @@ async def unblock_user(
 ):
     """Unblock a user"""
     
-    db.table("blocked_users").delete().eq("blocker_id", user_id).eq("blocked_id", target_id).execute()
+    await db.table("blocked_users").delete().eq("blocker_id", user_id).eq("blocked_id", target_id).execute_async()
+    invalidate_blocked_ids(user_id)
+    await cache_delete(f"blocked:{user_id}")
     
     return {"message": "User unblocked"}
 
@@ -865,10 +907,16 @@ async def get_blocked_users(
 ):
     """Get list of blocked users"""
     
-    result = db.table("blocked_users").select(
+    cache_key = f"blocked:{user_id}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
+    result = await db.table("blocked_users").select(
         "*, blocked_user:users(id, full_name, avatar_url)"
-    ).eq("blocker_id", user_id).execute()
+    ).eq("blocker_id", user_id).execute_async()
     
+    await cache_set(cache_key, result.data, BLOCKED_USERS_TTL)
     return result.data
 
 
@@ -885,6 +933,11 @@ async def get_auditoriums(
 ):
     """Get available auditoriums"""
     
+    cache_key = f"auditoriums:{faculty or ''}:{academic_level or ''}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
     query = db.table("auditoriums").select("*")
     
     if faculty:
@@ -892,8 +945,9 @@ async def get_auditoriums(
     if academic_level:
         query = query.eq("academic_level", academic_level)
     
-    result = query.execute()
+    result = await query.execute_async()
     
+    await cache_set(cache_key, result.data, AUDITORIUMS_TTL)
     return result.data
 
 
@@ -914,11 +968,7 @@ async def set_typing_indicator(
     """
     
     # Verify user is participant
-    participant = db.table("conversation_participants").select("id").eq(
-        "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
-    
-    if not participant.data:
+    if not await is_participant(db, conversation_id, user_id):
         raise HTTPException(status_code=403, detail="Not a participant")
     
     # Upsert typing indicator
@@ -926,17 +976,17 @@ async def set_typing_indicator(
         "conversation_id": conversation_id,
         "user_id": user_id,
         "is_typing": is_typing,
-        "updated_at": datetime.utcnow().isoformat()
+        "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
     if is_typing:
         # Insert/update typing indicator
-        result = db.table("typing_indicators").upsert(typing_data).execute()
+        result = await db.table("typing_indicators").upsert(typing_data).execute_async()
     else:
         # Remove typing indicator
-        result = db.table("typing_indicators").delete().eq(
+        result = await db.table("typing_indicators").delete().eq(
             "conversation_id", conversation_id
-        ).eq("user_id", user_id).execute()
+        ).eq("user_id", user_id).execute_async()
     
     return {"is_typing": is_typing}
 
@@ -952,30 +1002,18 @@ async def get_typing_indicators(
     """
     
     # Verify user is participant
-    participant = db.table("conversation_participants").select("id").eq(
-        "conversation_id", conversation_id
-    ).eq("user_id", user_id).execute()
-    
-    if not participant.data:
+    if not await is_participant(db, conversation_id, user_id):
         raise HTTPException(status_code=403, detail="Not a participant")
     
-    # Get typing indicators (excluding current user)
-    result = db.table("typing_indicators").select(
+    # Fresh indicators only (updated in the last 5 seconds), excluding current user
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=TYPING_INDICATOR_TTL)).isoformat()
+    result = await db.table("typing_indicators").select(
         "*, user:users(full_name, avatar_url)"
     ).eq("conversation_id", conversation_id).eq("is_typing", True).neq(
         "user_id", user_id
-    ).execute()
-    
-    # Filter out stale indicators (older than 5 seconds)
-    from datetime import timedelta
-    cutoff = (datetime.utcnow() - timedelta(seconds=5)).isoformat()
-    
-    typing_users = []
-    for indicator in (result.data if hasattr(result, 'data') else []):
-        if indicator.get("updated_at", "") > cutoff:
-            typing_users.append(indicator)
+    ).gt("updated_at", cutoff).execute_async()
     
-    return typing_users
+    return rows(result)
 
 
 # ============================================
@@ -1010,13 +1048,13 @@ async def update_messaging_settings(
     if not settings_data:
         raise HTTPException(status_code=400, detail="No settings to update")
     
-    settings_data["updated_at"] = datetime.utcnow().isoformat()
+    settings_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     # Upsert user settings
-    result = db.table("user_messaging_settings").upsert({
+    result = await db.table("user_messaging_settings").upsert({
         "user_id": user_id,
         **settings_data
-    }).execute()
+    }).execute_async()
     
     return result.data[0] if result.data else settings_data
 
@@ -1028,7 +1066,7 @@ async def get_messaging_settings(
 ):
     """Get user's messaging settings"""
     
-    result = db.table("user_messaging_settings").select("*").eq("user_id", user_id).execute()
+    result = await db.table("user_messaging_settings").select("*").eq("user_id", user_id).execute_async()
     
     if result.data:
         return result.data[0]
@@ -2,12 +2,14 @@
 Notifications routes
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+from uuid import UUID
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
+from app.core.db_wrapper import keyset_before
 
 router = APIRouter()
 
@@ -28,27 +30,17 @@ class NotificationCreate(BaseModel):
     type: str = "info"
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 @router.get("/", response_model=List[Notification])
 async def get_notifications(
+    request: Request,
+    response: Response,
     unread_only: bool = False,
+    before: Optional[datetime] = Query(None),
+    before_id: Optional[UUID] = Query(None),
     limit: int = 50,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get user notifications"""
+    """Get user notifications (newest first, older pages via before)"""
     db = get_db()
     
     query = db.table("notifications").select("*").eq("user_id", user_id)
@@ -56,7 +48,22 @@ async def get_notifications(
     if unread_only:
         query = query.eq("read", False)
     
-    notifications = query.order("created_at", desc=True).limit(limit).execute()
+    # Keyset cursor: index range scan from the last seen (created_at, id), no offset
+    if before and before_id:
+        query = query.or_(keyset_before(before.isoformat(), str(before_id)))
+    elif before:
+        query = query.lt("created_at", before.isoformat())
+    
+    notifications = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+    
+    if len(notifications.data) == limit:
+        # A full page: there may be older notifications, point to them
+        last = notifications.data[-1]
+        next_before = datetime.fromisoformat(str(last["created_at"]))
+        next_url = request.url.include_query_params(
+            before=next_before.isoformat(), before_id=str(last["id"]), limit=limit
+        )
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
     
     return notifications.data
 
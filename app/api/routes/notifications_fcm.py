@@ -3,17 +3,34 @@ Push Notifications API (Firebase Cloud Messaging)
 Campus OS UNIGOM
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, Request, Response
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 from datetime import datetime
-from uuid import uuid4
+import asyncio
+from uuid import UUID, uuid4
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
+from app.core.db_wrapper import rows, keyset_before
+from app.core.user_profiles import peek_user_mini, remember_user_mini
+from cachetools import TTLCache
 from loguru import logger
 
 router = APIRouter()
 
+# Rows per notification_queue insert (keeps large fan-outs under request size limits)
+NOTIFICATION_INSERT_CHUNK = 500
+
+# Tokens per FCM multicast request
+FCM_MULTICAST_LIMIT = 500
+
+# Conversation type/name for notification titles (invalidated on conversation updates)
+_conversation_meta: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+# firebase_admin.messaging once init_firebase() succeeded at startup, None otherwise
+_fcm_messaging = None
+
 
 # ============================================
 # MODELS
@@ -37,18 +54,31 @@ class PushNotification(BaseModel):
 # HELPER FUNCTIONS
 # ============================================
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
+def invalidate_conversation_meta(conversation_id: str):
+    """Drop the cached type/name of a conversation"""
+    _conversation_meta.pop(conversation_id, None)
+
+
+def init_firebase():
+    """Initialize the Firebase Admin app once (called at startup)"""
+    global _fcm_messaging
     
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    try:
+        import firebase_admin
+        from firebase_admin import messaging, credentials
+    except ImportError:
+        logger.warning("Firebase Admin SDK not installed, push notifications disabled")
+        return
     
-    return payload.get("sub")
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(
+                settings.FIREBASE_SERVICE_ACCOUNT_KEY_PATH or "firebase-credentials.json"
+            )
+            firebase_admin.initialize_app(cred)
+        _fcm_messaging = messaging
+    except Exception as e:
+        logger.error(f"Failed to initialize Firebase: {e}")
 
 
 async def send_fcm_notification(
@@ -59,52 +89,43 @@ async def send_fcm_notification(
 ) -> Dict[str, Any]:
     """
     Send push notification using Firebase Cloud Messaging
-    Note: You need to set up Firebase Admin SDK and credentials
+    Note: Firebase Admin is initialized once at startup (see init_firebase)
     """
+    if _fcm_messaging is None:
+        return {"success": False, "error": "Firebase not configured"}
+    
+    messaging = _fcm_messaging
+    
     try:
-        # Import Firebase Admin
-        try:
-            import firebase_admin
-            from firebase_admin import messaging, credentials
-        except ImportError:
-            logger.error("Firebase Admin SDK not installed")
-            return {"success": False, "error": "Firebase not configured"}
-        
-        # Initialize Firebase Admin if not already initialized
-        if not firebase_admin._apps:
-            # Load Firebase credentials (configure path in env)
-            try:
-                cred = credentials.Certificate("firebase-credentials.json")
-                firebase_admin.initialize_app(cred)
-            except Exception as e:
-                logger.error(f"Failed to initialize Firebase: {e}")
-                return {"success": False, "error": "Firebase initialization failed"}
-        
         # Prepare notification
         notification = messaging.Notification(
             title=title,
             body=body
         )
         
-        # Send to multiple tokens
+        # One multicast message per chunk of tokens (FCM accepts up to 500)
         messages = [
-            messaging.Message(
+            messaging.MulticastMessage(
+                tokens=fcm_tokens[i:i + FCM_MULTICAST_LIMIT],
                 notification=notification,
-                data=data or {},
-                token=token
+                data=data or {}
             )
-            for token in fcm_tokens
+            for i in range(0, len(fcm_tokens), FCM_MULTICAST_LIMIT)
         ]
         
-        # Send batch
-        response = messaging.send_all(messages)
+        # The SDK call is blocking: send the chunks from worker threads, side by side
+        responses = await asyncio.gather(*(
+            asyncio.to_thread(messaging.send_each_for_multicast, message) for message in messages
+        ))
+        success_count = sum(r.success_count for r in responses)
+        failure_count = sum(r.failure_count for r in responses)
         
-        logger.info(f"FCM sent: {response.success_count} successful, {response.failure_count} failed")
+        logger.info(f"FCM sent: {success_count} successful, {failure_count} failed")
         
         return {
             "success": True,
-            "success_count": response.success_count,
-            "failure_count": response.failure_count
+            "success_count": success_count,
+            "failure_count": failure_count
         }
     
     except Exception as e:
@@ -120,21 +141,19 @@ async def queue_notification(
     notification_type: str,
     data: Optional[Dict[str, Any]] = None
 ):
-    """Queue notifications for later delivery"""
+    """Queue notifications for later delivery (one bulk insert per chunk of recipients)"""
     
-    for user_id in user_ids:
-        notification = {
-            "id": str(uuid4()),
-            "user_id": user_id,
-            "notification_type": notification_type,
-            "title": title,
-            "body": body,
-            "data": data,
-            "status": "pending",
-            "created_at": datetime.utcnow().isoformat()
-        }
-        
-        db.table("notification_queue").insert(notification).execute()
+    base = {
+        "notification_type": notification_type,
+        "title": title,
+        "body": body,
+        "data": data,
+        "status": "pending"
+    }
+    queued = [{**base, "id": str(uuid4()), "user_id": user_id} for user_id in user_ids]
+    
+    for i in range(0, len(queued), NOTIFICATION_INSERT_CHUNK):
+        db.table("notification_queue").insert(queued[i:i + NOTIFICATION_INSERT_CHUNK]).execute()
 
 
 async def send_message_notification(
@@ -149,25 +168,35 @@ async def send_message_notification(
     This should be called from messaging routes when a new message is sent
     """
     
-    # Get conversation participants (except sender)
-    participants_result = db.table("conversation_participants").select(
-        "user_id"
-    ).eq("conversation_id", conversation_id).neq("user_id", sender_id).eq(
-        "is_muted", False
-    ).execute()
+    # Get conversation info (cached per conversation)
+    conv = _conversation_meta.get(conversation_id)
+    if conv is None:
+        conv_result = db.table("conversations").select("type, name").eq("id", conversation_id).execute()
+        conv = conv_result.data[0] if conv_result.data else {}
+        if conv:
+            _conversation_meta[conversation_id] = conv
     
-    participants = participants_result.data if hasattr(participants_result, 'data') else []
+    # Active tokens of unmuted recipients with notifications on, joined server-side
+    # (see get_notifiable_tokens)
+    tokens_result = db.rpc("get_notifiable_tokens", {
+        "p_conversation": conversation_id,
+        "p_sender": sender_id,
+        "p_is_group": conv.get("type") == "group"
+    }).execute()
     
-    if not participants:
-        return
+    tokens = [t["fcm_token"] for t in rows(tokens_result)]
     
-    # Get sender info
-    sender_result = db.table("users").select("full_name, avatar_url").eq("id", sender_id).execute()
-    sender_name = sender_result.data[0]["full_name"] if sender_result.data else "Someone"
+    if not tokens:
+        return
     
-    # Get conversation info
-    conv_result = db.table("conversations").select("type, name").eq("id", conversation_id).execute()
-    conv = conv_result.data[0] if conv_result.data else {}
+    # Get sender info (profile cache first)
+    sender = peek_user_mini(sender_id)
+    if sender is None:
+        sender_result = db.table("users").select("id, full_name, avatar_url").eq("id", sender_id).execute()
+        if sender_result.data:
+            sender = sender_result.data[0]
+            remember_user_mini(sender_id, sender)
+    sender_name = sender["full_name"] if sender else "Someone"
     
     # Prepare notification title/body
     if conv.get("type") == "group":
@@ -177,53 +206,18 @@ async def send_message_notification(
         title = sender_name
         body = message_content[:100]
     
-    # Get FCM tokens for participants
-    recipient_ids = [p["user_id"] for p in participants]
-    
-    # Check user settings for notifications
-    settings_result = db.table("user_messaging_settings").select(
-        "user_id, enable_message_notifications, enable_group_notifications"
-    ).in_("user_id", recipient_ids).execute()
-    
-    settings_map = {
-        s["user_id"]: s
-        for s in (settings_result.data if hasattr(settings_result, 'data') else [])
-    }
-    
-    # Filter recipients based on notification settings
-    enabled_recipients = []
-    for user_id in recipient_ids:
-        settings = settings_map.get(user_id, {})
-        if conv.get("type") == "group":
-            if settings.get("enable_group_notifications", True):
-                enabled_recipients.append(user_id)
-        else:
-            if settings.get("enable_message_notifications", True):
-                enabled_recipients.append(user_id)
-    
-    if not enabled_recipients:
-        return
-    
-    # Get FCM tokens
-    tokens_result = db.table("push_notification_tokens").select(
-        "fcm_token"
-    ).in_("user_id", enabled_recipients).eq("is_active", True).execute()
-    
-    tokens = [t["fcm_token"] for t in (tokens_result.data if hasattr(tokens_result, 'data') else [])]
-    
-    if tokens:
-        # Send notification in background
-        background_tasks.add_task(
-            send_fcm_notification,
-            fcm_tokens=tokens,
-            title=title,
-            body=body,
-            data={
-                "type": "message",
-                "conversation_id": conversation_id,
-                "sender_id": sender_id
-            }
-        )
+    # Send notification in background
+    background_tasks.add_task(
+        send_fcm_notification,
+        fcm_tokens=tokens,
+        title=title,
+        body=body,
+        data={
+            "type": "message",
+            "conversation_id": conversation_id,
+            "sender_id": sender_id
+        }
+    )
 
 
 # ============================================
@@ -243,9 +237,8 @@ async def register_fcm_token(
         if token_data.platform not in ['android', 'ios', 'web']:
             raise HTTPException(status_code=400, detail="Invalid platform")
         
-        # Upsert token
+        # Upsert token (one row per device, the id defaults on first registration)
         token_entry = {
-            "id": str(uuid4()),
             "user_id": user_id,
             "device_id": token_data.device_id,
             "fcm_token": token_data.fcm_token,
@@ -254,7 +247,7 @@ async def register_fcm_token(
             "last_used_at": datetime.utcnow().isoformat()
         }
         
-        result = db.table("push_notification_tokens").upsert(token_entry).execute()
+        result = db.table("push_notification_tokens").upsert(token_entry, on_conflict="user_id,device_id").execute()
         
         return {"message": "Token registered successfully"}
     
@@ -314,7 +307,7 @@ async def send_push_notification(
             "fcm_token"
         ).in_("user_id", notification.user_ids).eq("is_active", True).execute()
         
-        tokens = [t["fcm_token"] for t in (tokens_result.data if hasattr(tokens_result, 'data') else [])]
+        tokens = [t["fcm_token"] for t in rows(tokens_result)]
         
         if tokens:
             # Send in background
@@ -339,18 +332,35 @@ async def send_push_notification(
 
 @router.get("/history")
 async def get_notification_history(
+    request: Request,
+    response: Response,
+    before: Optional[datetime] = Query(None),
+    before_id: Optional[UUID] = Query(None),
     limit: int = 50,
     db=Depends(get_db),
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get notification history for user"""
+    """Get notification history for user (newest first, older pages via before)"""
     
     try:
-        result = db.table("notification_queue").select(
-            "*"
-        ).eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
+        query = db.table("notification_queue").select("*").eq("user_id", user_id)
+        if before and before_id:
+            query = query.or_(keyset_before(before.isoformat(), str(before_id)))
+        elif before:
+            query = query.lt("created_at", before.isoformat())
+        
+        history = rows(query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute())
+        
+        if len(history) == limit:
+            # A full page: there may be older notifications, point to them
+            last = history[-1]
+            next_before = datetime.fromisoformat(str(last["created_at"]))
+            next_url = request.url.include_query_params(
+                before=next_before.isoformat(), before_id=str(last["id"]), limit=limit
+            )
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
         
-        return result.data if hasattr(result, 'data') else []
+        return history
     
     except Exception as e:
         logger.error(f"Error fetching notification history: {e}", exc_info=True)
@@ -258,9 +258,7 @@ async def complete_google_registration(
             "status": UserStatus.ACTIVE.value,
             "batera_coins": 10.0,  # Bonus for Google sign-up
             "avatar_url": picture,
-            "device_id": encrypted_device_id,
-            "created_at": datetime.utcnow().isoformat(),
-            "last_login": datetime.utcnow().isoformat()
+            "device_id": encrypted_device_id
         }
         
         created_user = db.insert("users", user_insert)
@@ -2,12 +2,11 @@
 Payments and Batera Coins routes
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from pydantic import BaseModel
-from datetime import datetime
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
 from loguru import logger
 
 router = APIRouter()
@@ -36,20 +35,6 @@ class Transaction(BaseModel):
     created_at: str
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 @router.get("/packages", response_model=List[CoinPackage])
 async def get_coin_packages():
     """Get available Batera Coins packages"""
@@ -84,8 +69,7 @@ async def purchase_coins(
         "amount_usd": package_data["price_usd"],
         "payment_method": purchase.payment_method,
         "phone_number": purchase.phone_number,
-        "status": "pending",
-        "created_at": datetime.utcnow().isoformat()
+        "status": "pending"
     }
     
     result = db.table("purchase_transactions").insert(transaction).execute()
@@ -2,10 +2,10 @@
 Radar alerts routes - Campus notifications system
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, Header, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from typing import List, Optional
-from app.core.database import get_db_session
-from app.core.security import decode_token
+from app.core.database import get_db, get_db_session
+from app.core.auth import get_current_user_id
 from datetime import datetime
 from pydantic import BaseModel
 from enum import Enum
@@ -58,20 +58,6 @@ class RadarAlertResponse(BaseModel):
     views_count: int
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 @router.get("/alerts", response_model=List[RadarAlertResponse])
 async def get_radar_alerts(
     db_session = Depends(get_db_session),
@@ -153,22 +139,8 @@ async def mark_alert_viewed(
     """Mark alert as viewed by user"""
     db = get_db()
     
-    # Check if already viewed
-    existing = db.select("radar_views", columns="*", filters={"alert_id": alert_id, "user_id": user_id})
-    
-    if not existing:
-        # Create view record
-        db.insert("radar_views", {
-            "user_id": user_id,
-            "alert_id": alert_id,
-            "viewed_at": datetime.utcnow().isoformat()
-        })
-        
-        # Increment view count
-        alert = db.select("radar_alerts", columns="views_count", filters={"id": alert_id})
-        current_count = alert[0].get("views_count", 0) if alert else 0
-        
-        db.update("radar_alerts", {"views_count": current_count + 1}, {"id": alert_id})
+    # View row and views_count bump in one transaction, first view only (see record_radar_view)
+    db.rpc("record_radar_view", {"p_alert": alert_id, "p_user": user_id}).execute()
     
     return {"message": "Alert marked as viewed"}
 
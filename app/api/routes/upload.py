@@ -3,7 +3,7 @@ File Upload API for Messaging
 Campus OS UNIGOM
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from typing import Optional
 from datetime import datetime
 from uuid import uuid4
@@ -11,7 +11,8 @@ import os
 import shutil
 from pathlib import Path
 from app.core.database import get_db
-from app.core.security import decode_token
+from app.core.auth import get_current_user_id
+from app.core.user_profiles import invalidate_user_mini
 from loguru import logger
 
 router = APIRouter()
@@ -45,20 +46,6 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 # HELPER FUNCTIONS
 # ============================================
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 def validate_file_type(content_type: str, allowed_types: set) -> bool:
     """Validate file MIME type"""
     return content_type in allowed_types
@@ -431,6 +418,7 @@ async def upload_avatar(
             "avatar_url": file_url,
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
+        invalidate_user_mini(user_id)
         
         # Save metadata
         file_metadata = {
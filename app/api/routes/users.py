@@ -2,33 +2,20 @@
 User management routes
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Header
-from app.models.user import UserUpdate, UserResponse
+from fastapi import APIRouter, HTTPException, Depends
+from app.models.user import UserUpdate, UserResponse, USER_RESPONSE_COLUMNS
 from app.core.database import get_db_session, get_db
+from app.core.auth import get_current_user_id
 from app.core.db_wrapper import DatabaseWrapper
-from app.core.security import decode_token
+from app.core.user_profiles import invalidate_user_mini
 
 router = APIRouter()
 
 
-def get_current_user_id(authorization: str = Header(...)) -> str:
-    """Extract user ID from token"""
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid authorization format")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_token(token)
-    
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return payload.get("sub")
-
-
 @router.get("/profile", response_model=UserResponse)
 async def get_profile(db: DatabaseWrapper = Depends(get_db), user_id: str = Depends(get_current_user_id)):
     """Get user profile"""
-    user = db.table("users").select("*").eq("id", user_id).execute()
+    user = db.table("users").select(USER_RESPONSE_COLUMNS).eq("id", user_id).execute()
     
     if not user.data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -36,7 +23,7 @@ async def get_profile(db: DatabaseWrapper = Depends(get_db), user_id: str = Depe
     user_data = user.data[0]
     # Convert UUID to string for Pydantic validation
     user_data["id"] = str(user_data["id"])
-    return UserResponse(**user_data)
+    return UserResponse.model_validate(user_data)
 
 
 @router.put("/profile", response_model=UserResponse)
@@ -53,6 +40,7 @@ async def update_profile(
         raise HTTPException(status_code=400, detail="No fields to update")
     
     result = db.table("users").update(update_data).eq("id", user_id).execute()
+    invalidate_user_mini(user_id)
     
     if not result.data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -60,7 +48,7 @@ async def update_profile(
     user_data = result.data[0]
     # Convert UUID to string for Pydantic validation
     user_data["id"] = str(user_data["id"])
-    return UserResponse(**user_data)
+    return UserResponse.model_validate(user_data)
 
 
 @router.get("/balance")
@@ -0,0 +1,114 @@
+"""
+Announcement change events
+Fan-out of announcement changes to the SSE stream. With a direct PostgreSQL
+connection the events come from LISTEN announcements_changed (fired by the
+announcements_notify trigger, so every worker sees every change); on Supabase
+the routes publish their own changes in-process.
+"""
+
+import asyncio
+import select
+import threading
+from typing import Any, Dict, Optional, Set
+import orjson
+from loguru import logger
+
+from app.core.config import settings
+
+CHANNEL = "announcements_changed"
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_subscribers: Set[asyncio.Queue] = set()
+_listener: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def subscribe() -> asyncio.Queue:
+    """Register a new stream subscriber"""
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    """Remove a stream subscriber"""
+    _subscribers.discard(queue)
+
+
+def publish(event: Dict[str, Any]):
+    """Push an event to every subscriber (slow subscribers drop events)"""
+    for queue in _subscribers:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+
+def announcement_changed(event: Dict[str, Any]):
+    """Called by the routes after a mutation; a no-op when the DB trigger reports changes"""
+    if _listener is None:
+        publish(event)
+
+
+def is_visible_to(event: Dict[str, Any], faculty: Optional[str], academic_level: Optional[str]) -> bool:
+    """Audience check for a change event"""
+    if event.get("action") == "delete":
+        return True
+    if event.get("status") != "published":
+        # Unpublished or archived: an update may remove a listed announcement, forward it like a delete
+        return event.get("action") == "update"
+    if event.get("target_all_users", True):
+        return True
+    
+    faculties = event.get("target_faculties")
+    levels = event.get("target_academic_levels")
+    return (not faculties or faculty in faculties) and (not levels or academic_level in levels)
+
+
+def _listen(loop: asyncio.AbstractEventLoop):
+    """LISTEN loop running in a daemon thread, reconnects on failure"""
+    import psycopg2
+    import psycopg2.extensions
+    
+    while not _stop.is_set():
+        try:
+            conn = psycopg2.connect(settings.DATABASE_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            logger.info(f"Listening on {CHANNEL}")
+            
+            while not _stop.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    loop.call_soon_threadsafe(publish, orjson.loads(notify.payload))
+            
+            conn.close()
+        
+        except Exception as e:
+            logger.warning(f"Announcement listener error, retrying: {e}")
+            _stop.wait(5)
+
+
+def start_announcement_listener():
+    """Start the LISTEN thread when a direct PostgreSQL connection is configured"""
+    global _listener
+    if _listener is not None:
+        return
+    if not (settings.DATABASE_URL and "postgresql" in settings.DATABASE_URL):
+        return
+    
+    _stop.clear()
+    _listener = threading.Thread(
+        target=_listen, args=(asyncio.get_running_loop(),), name="announcement-listener", daemon=True
+    )
+    _listener.start()
+
+
+def stop_announcement_listener():
+    """Stop the LISTEN thread (it exits within one poll interval)"""
+    global _listener
+    _stop.set()
+    _listener = None
@@ -0,0 +1,38 @@
+"""
+Authentication dependencies shared by the API routes
+"""
+
+from typing import Dict
+from fastapi import Depends, Header, HTTPException
+from app.core.security import decode_token_cached
+from app.models.user import UserRole
+
+
+async def get_bearer_payload(authorization: str = Header(...)) -> Dict:
+    """Decode the bearer token (resolved once per request by FastAPI's dependency cache)"""
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization format")
+    
+    token = authorization.split(" ")[1]
+    payload = decode_token_cached(token)
+    
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    return payload
+
+
+async def get_current_user_id(payload: Dict = Depends(get_bearer_payload)) -> str:
+    """Extract user ID from token"""
+    return payload.get("sub")
+
+
+async def get_current_admin_id(payload: Dict = Depends(get_bearer_payload)) -> str:
+    """Verify admin access"""
+    if payload.get("role") != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=403,
+            detail="Accès refusé. Seul Nathanael Batera peut accéder au panneau Batera Command."
+        )
+    
+    return payload.get("sub")
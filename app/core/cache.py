@@ -0,0 +1,100 @@
+"""
+Redis response cache
+All helpers are no-ops when ENABLE_REDIS_CACHE is off or Redis is unreachable
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import orjson
+import redis.asyncio as redis
+from loguru import logger
+
+from app.core.config import settings
+
+_client: Optional[redis.Redis] = None
+
+# In-flight loads by key (single event loop: check-and-set needs no lock)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """Return the shared Redis client, None when caching is disabled"""
+    global _client
+    if not settings.ENABLE_REDIS_CACHE:
+        return None
+    if _client is None:
+        _client = redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+async def cache_get(key: str) -> Optional[Any]:
+    """Get a cached JSON value"""
+    client = get_redis()
+    if client is None:
+        return None
+    
+    try:
+        raw = await client.get(key)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+        return None
+    
+    return orjson.loads(raw) if raw is not None else None
+
+
+async def cache_set(key: str, value: Any, ttl_seconds: int):
+    """Cache a JSON-serializable value"""
+    client = get_redis()
+    if client is None:
+        return
+    
+    try:
+        await client.set(key, orjson.dumps(value), ex=ttl_seconds)
+    except Exception as e:
+        logger.warning(f"Cache write failed for {key}: {e}")
+
+
+async def cache_invalidate(prefix: str):
+    """Delete every cached key starting with prefix"""
+    client = get_redis()
+    if client is None:
+        return
+    
+    try:
+        keys = [key async for key in client.scan_iter(match=f"{prefix}*", count=500)]
+        if keys:
+            await client.unlink(*keys)
+    except Exception as e:
+        logger.warning(f"Cache invalidation failed for {prefix}: {e}")
+
+
+async def cache_delete(*keys: str):
+    """Delete exact cached keys (no SCAN, for keys known up front)"""
+    client = get_redis()
+    if client is None or not keys:
+        return
+    
+    try:
+        await client.unlink(*keys)
+    except Exception as e:
+        logger.warning(f"Cache delete failed for {keys}: {e}")
+
+
+async def close_cache():
+    """Close the shared Redis client"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def singleflight(key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+    """Run load() once for concurrent callers of the same key, sharing its result"""
+    task = _inflight.get(key)
+    if task is None:
+        # Own task: a caller disconnecting doesn't cancel the load for the others
+        task = asyncio.ensure_future(load())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    return await asyncio.shield(task)
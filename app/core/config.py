@@ -33,6 +33,14 @@ class Settings(BaseSettings):
     POSTGRES_PORT: Optional[int] = None
     POSTGRES_DB: Optional[str] = None
     
+    # Connection pool (local PostgreSQL / SQLAlchemy)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 15
+    DB_POOL_RECYCLE_SECONDS: int = 600
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    DB_USE_NULL_POOL: bool = False  # Behind PgBouncer/Supavisor in transaction mode
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    
     # Google AI
     GOOGLE_AI_API_KEY: str
     
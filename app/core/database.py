@@ -5,6 +5,7 @@ Supports both Supabase (cloud) and local PostgreSQL (development)
 
 from supabase import create_client, Client
 from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, Session
 from app.core.config import settings
 from app.core.db_wrapper import DatabaseWrapper
@@ -12,25 +13,45 @@ from loguru import logger
 
 # Database instances
 supabase: Client = None
+supabase_db: DatabaseWrapper = None  # Shared wrapper, the Supabase client is thread-safe
 engine = None
 SessionLocal = None
 
 
 async def init_db():
     """Initialize database connection"""
-    global supabase, engine, SessionLocal
+    global supabase, supabase_db, engine, SessionLocal
     
     try:
         # Check if using local PostgreSQL
         if settings.DATABASE_URL and "postgresql" in settings.DATABASE_URL:
             logger.info("🔄 Using local PostgreSQL database")
             
-            # Create SQLAlchemy engine
-            engine = create_engine(
-                settings.DATABASE_URL,
-                echo=settings.DEBUG,
-                future=True
-            )
+            # Create SQLAlchemy engine (pooled, connections primed once on connect)
+            connect_args = {
+                "options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS} -c timezone=UTC"
+            }
+            if settings.DB_USE_NULL_POOL:
+                # An external pooler owns the connections, don't keep our own
+                engine = create_engine(
+                    settings.DATABASE_URL,
+                    echo=settings.DEBUG,
+                    future=True,
+                    poolclass=NullPool,
+                    connect_args=connect_args
+                )
+            else:
+                engine = create_engine(
+                    settings.DATABASE_URL,
+                    echo=settings.DEBUG,
+                    future=True,
+                    pool_size=settings.DB_POOL_SIZE,
+                    max_overflow=settings.DB_MAX_OVERFLOW,
+                    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+                    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+                    pool_pre_ping=True,
+                    connect_args=connect_args
+                )
             
             # Create session factory
             SessionLocal = sessionmaker(
@@ -48,6 +69,7 @@ async def init_db():
                 settings.SUPABASE_URL,
                 settings.SUPABASE_SERVICE_KEY
             )
+            supabase_db = DatabaseWrapper(supabase)
             logger.info("✅ Supabase client initialized")
             
     except Exception as e:
@@ -61,18 +83,18 @@ def get_db():
         # Return wrapped SQLAlchemy session for local DB
         return DatabaseWrapper(SessionLocal())
     else:
-        # Return wrapped Supabase client
-        return DatabaseWrapper(supabase)
+        # Return the shared Supabase wrapper
+        return supabase_db
 
 
 def get_db_session():
     """Get SQLAlchemy session with proper lifecycle management, fallback to Supabase"""
     # Always implemented as a generator so FastAPI can use it as a yield-based dependency.
     if not engine:
-        # If no local engine, fallback to Supabase wrapper
+        # If no local engine, fallback to the shared Supabase wrapper
         if supabase:
             try:
-                yield DatabaseWrapper(supabase)
+                yield supabase_db
             finally:
                 # supabase client doesn't require explicit close
                 return
@@ -3,8 +3,11 @@ Database wrapper for unified Supabase and SQLAlchemy interface
 Handles both cloud (Supabase) and local (PostgreSQL) databases transparently
 """
 
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
+from functools import lru_cache
+import re
 from sqlalchemy.orm import Session
+import asyncio
 from supabase import Client
 from loguru import logger
 
@@ -12,10 +15,84 @@ from loguru import logger
 class QueryResult:
     """Unified result object for query operations"""
     def __init__(self, data=None, count=None):
-        self.data = data or []
+        self.data = data if data is not None else []
         self.count = count or 0
 
 
+def rows(resp) -> List[Dict[str, Any]]:
+    """Rows of a query response (QueryResult, raw Supabase response or bare list)"""
+    data = getattr(resp, "data", None)
+    if data is not None:
+        return data
+    return resp if isinstance(resp, list) else []
+
+
+# SQL operators of the comparison filters (gt, lt, gte, lte)
+SQL_COMPARISONS = {"gt": ">", "lt": "<", "gte": ">=", "lte": "<="}
+
+# Operators accepted in or_() filter strings on the SQLAlchemy path
+SQL_FILTER_OPERATORS = {**SQL_COMPARISONS, "eq": "=", "neq": "!=", "like": "LIKE", "ilike": "ILIKE"}
+_FILTER_COLUMN_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def keyset_before(created_at: str, row_id: str, column: str = "created_at") -> str:
+    """or_() filter for rows strictly before the (created_at, id) cursor, newest-first pages"""
+    return f'{column}.lt."{created_at}",and({column}.eq."{created_at}",id.lt."{row_id}")'
+
+
+def split_filter_terms(expr: str) -> List[str]:
+    """Split a PostgREST logic filter on its top-level commas (parentheses and quotes respected)"""
+    terms, current = [], []
+    depth, quoted = 0, False
+    for ch in expr:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ',':
+            terms.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    terms.append("".join(current))
+    return [t.strip() for t in terms if t.strip()]
+
+
+def logic_filter_sql(expr: str, params: Dict[str, Any], joiner: str = "OR") -> str:
+    """SQL condition of a PostgREST logic filter ("a.ilike.%x%,and(b.eq.1,c.lt.2)"), values bound in params"""
+    conditions = []
+    for term in split_filter_terms(expr):
+        nested = next((logic for logic in ("and", "or") if term.startswith(f"{logic}(") and term.endswith(")")), None)
+        if nested:
+            conditions.append(logic_filter_sql(term[len(nested) + 1:-1], params, nested.upper()))
+            continue
+        
+        column, op, value = term.split(".", 2)
+        if not _FILTER_COLUMN_RE.match(column) or op not in SQL_FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter: {term}")
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        if op in ("like", "ilike"):
+            value = value.replace("*", "%")
+        
+        param_name = f"param_{len(params)}"
+        params[param_name] = value
+        conditions.append(f"{column} {SQL_FILTER_OPERATORS[op]} :{param_name}")
+    return "(" + f" {joiner} ".join(conditions) + ")"
+
+
+@lru_cache(maxsize=256)
+def rpc_statement(function: str, arg_names: Tuple[str, ...]):
+    """SELECT * FROM function(name => :name, ...), built and parsed once per call shape"""
+    from sqlalchemy import text
+    
+    # Named arguments so parameter order doesn't matter
+    args = ", ".join([f"{key} => :{key}" for key in arg_names])
+    return text(f"SELECT * FROM {function}({args})")
+
+
 class QueryBuilder:
     """Query builder for chaining database operations"""
     
@@ -26,18 +103,24 @@ class QueryBuilder:
         self._filters = {}
         self._order_by = None
         self._order_desc = False
+        self._then_order = []  # Tie-breaker (column, desc) pairs after the first order()
         self._limit_count = None
         self._insert_data = None
         self._update_data = None  # For UPDATE operations
+        self._upsert_data = None  # For INSERT ... ON CONFLICT operations
+        self._delete = False  # For DELETE operations
         self._in_filters = {}  # For IN list filters
         self._comparison_filters = {}  # For gt, lt, gte, lte
+        self._or_filters = []  # PostgREST logic strings, e.g. "a.eq.1,b.eq.2"
         
-    def select(self, columns: str = "*", count: str = None):
+    def select(self, columns: str = "*", count: str = None, head: bool = False):
         self._select_columns = columns
         self._count_mode = count  # 'exact' for row count
+        self._head = head  # count only, no rows in the response
         return self
         
-    def insert(self, data: Dict[str, Any]):
+    def insert(self, data):
+        """Set a record (dict) or several records (list of dicts) to insert"""
         self._insert_data = data
         return self
     
@@ -45,6 +128,18 @@ class QueryBuilder:
         """Set data to update (for chained updates like .table().update().eq().execute())"""
         self._update_data = data
         return self
+    
+    def delete(self):
+        """Delete the rows matched by the filters (returns the deleted rows)"""
+        self._delete = True
+        return self
+    
+    def upsert(self, data, on_conflict: Optional[str] = None, ignore_duplicates: bool = False):
+        """Insert or update on conflict (on_conflict: comma-separated unique columns, default primary key)"""
+        self._upsert_data = data
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
         
     def eq(self, column: str, value: Any):
         self._filters[column] = value
@@ -60,6 +155,11 @@ class QueryBuilder:
         self._in_filters[column] = values
         return self
     
+    def or_(self, filters: str):
+        """OR filter in PostgREST syntax: "full_name.ilike.%a%,email.ilike.%a%" (and(...) may be nested)"""
+        self._or_filters.append(filters)
+        return self
+    
     def gt(self, column: str, value: Any):
         """Greater than filter"""
         self._comparison_filters[column] = ('gt', value)
@@ -81,8 +181,12 @@ class QueryBuilder:
         return self
         
     def order(self, column: str, desc: bool = False):
-        self._order_by = column
-        self._order_desc = desc
+        """Order by column; further calls add tie-breakers"""
+        if self._order_by is None:
+            self._order_by = column
+            self._order_desc = desc
+        else:
+            self._then_order.append((column, desc))
         return self
         
     def limit(self, count: int):
@@ -90,6 +194,19 @@ class QueryBuilder:
         return self
     
     def execute(self):
+        # Handle UPSERT operations
+        if self._upsert_data is not None:
+            return self.db_wrapper._execute_upsert(
+                table=self.table,
+                data=self._upsert_data,
+                on_conflict=self._on_conflict,
+                ignore_duplicates=self._ignore_duplicates
+            )
+        
+        # Handle DELETE operations
+        if self._delete:
+            return self.db_wrapper._execute_delete(table=self.table, filters=self._filters)
+        
         # Handle UPDATE operations
         if self._update_data is not None:
             return self.db_wrapper._execute_update(
@@ -104,7 +221,7 @@ class QueryBuilder:
                 try:
                     import json
                     query = self.db_wrapper.client.table(self.table).select(
-                        self._select_columns, count=self._count_mode
+                        self._select_columns, count=self._count_mode, head=self._head
                     )
                     for col, val in self._filters.items():
                         if isinstance(val, tuple) and val[0] == 'neq':
@@ -126,8 +243,13 @@ class QueryBuilder:
                         elif op == 'lte':
                             query = query.lte(col, val)
                     
+                    for expr in self._or_filters:
+                        query = query.or_(expr)
+                    
                     if self._order_by:
                         query = query.order(self._order_by, desc=self._order_desc)
+                    for col, desc in self._then_order:
+                        query = query.order(col, desc=desc)
                     
                     if self._limit_count:
                         query = query.limit(self._limit_count)
@@ -150,24 +272,61 @@ class QueryBuilder:
                     return r
         
         if self._insert_data is not None:
-            return self.db_wrapper._execute_insert(self.table, self._insert_data)
+            # Always a QueryResult, like select/update/upsert (db.insert() keeps returning the dict)
+            rows = self._insert_data if isinstance(self._insert_data, list) else [self._insert_data]
+            return self.db_wrapper._execute_insert_rows(self.table, rows)
         else:
-            return self.db_wrapper._execute_query(
+            result = self.db_wrapper._execute_query(
                 table=self.table,
                 columns=self._select_columns,
                 filters=self._filters,
                 in_filters=self._in_filters,
                 comparison_filters=self._comparison_filters,
+                or_filters=self._or_filters,
                 order_by=self._order_by,
                 order_desc=self._order_desc,
+                then_order=self._then_order,
                 limit_count=self._limit_count
             )
+            # Count requests on SQLAlchemy: count the fetched rows
+            if getattr(self, '_count_mode', None) == 'exact':
+                result.count = len(result.data)
+                if self._head:
+                    result.data = []
+            return result
+    
+    async def execute_async(self):
+        """Execute in a worker thread so the sync client doesn't block the event loop"""
+        return await asyncio.to_thread(self.execute)
+
+
+class RpcBuilder:
+    """Builder for calling Postgres functions (Supabase RPC)"""
+    
+    def __init__(self, db_wrapper: 'DatabaseWrapper', function: str, params: Optional[Dict[str, Any]] = None):
+        self.db_wrapper = db_wrapper
+        self.function = function
+        self.params = params or {}
+    
+    def execute(self):
+        return self.db_wrapper._execute_rpc(self.function, self.params)
+    
+    async def execute_async(self):
+        """Execute in a worker thread so the sync client doesn't block the event loop"""
+        return await asyncio.to_thread(self.execute)
 
 
 class DatabaseWrapper:
     """Unified database interface for Supabase and SQLAlchemy"""
     
     def __init__(self, db_client):
+        # Re-wrapping a wrapper (routes wrap what get_db_session yields) reuses its client
+        if isinstance(db_client, DatabaseWrapper):
+            self.client = db_client.client
+            self.is_supabase = db_client.is_supabase
+            self.is_sqlalchemy = db_client.is_sqlalchemy
+            return
+        
         self.client = db_client
         # Detect Supabase client robustly: prefer isinstance check, fall back to duck-typing
         try:
@@ -195,11 +354,66 @@ class DatabaseWrapper:
     def table(self, table: str) -> QueryBuilder:
         """Start a query on a table"""
         return QueryBuilder(self, table)
+    
+    def rpc(self, function: str, params: Optional[Dict[str, Any]] = None) -> RpcBuilder:
+        """Call a Postgres function"""
+        return RpcBuilder(self, function, params)
+    
+    async def execute_concurrently(self, *queries) -> List[Any]:
+        """
+        Execute independent queries/RPCs off the event loop
+        
+        Supabase calls run in parallel threads; a SQLAlchemy session is not
+        thread-safe, so its queries run one after the other in a worker thread.
+        
+        Returns:
+            Results in the order of the queries
+        """
+        if self.is_supabase:
+            return list(await asyncio.gather(*(q.execute_async() for q in queries)))
+        return [await q.execute_async() for q in queries]
+    
+    def _execute_rpc(self, function: str, params: Dict[str, Any]):
+        """
+        Execute a Postgres function. Returns QueryResult with .data attribute.
+        
+        Set-returning functions give a list of records; scalar and json
+        functions give the bare value, matching PostgREST behaviour.
+        """
+        try:
+            if self.is_supabase:
+                result = self.client.rpc(function, params).execute()
+                return QueryResult(data=result.data if hasattr(result, "data") else result)
+            
+            elif self.is_sqlalchemy:
+                # Hot routes are RPCs: reuse the statement for the same function and arguments
+                result = self.client.execute(rpc_statement(function, tuple(params)), params)
+                self.client.commit()
+                
+                columns = list(result.keys())
+                rows = [dict(row._mapping) for row in result]
+                
+                # Scalar function: unwrap like PostgREST does
+                if columns == [function]:
+                    return QueryResult(data=rows[0][function] if rows else None)
+                
+                return QueryResult(data=rows)
+            
+            else:
+                raise ValueError("Unknown database client type")
+        
+        except Exception as e:
+            logger.error(f"Database RPC error ({function}): {e}")
+            if self.is_sqlalchemy:
+                self.client.rollback()
+            raise
         
     def _execute_query(self, table: str, columns: str = "*", filters: Optional[Dict[str, Any]] = None, 
                       in_filters: Optional[Dict[str, List[Any]]] = None,
                       comparison_filters: Optional[Dict[str, tuple]] = None,
-                      order_by: Optional[str] = None, order_desc: bool = False, limit_count: Optional[int] = None):
+                      or_filters: Optional[List[str]] = None,
+                      order_by: Optional[str] = None, order_desc: bool = False,
+                      then_order: Optional[List[Tuple[str, bool]]] = None, limit_count: Optional[int] = None):
         """
         Execute a query with the given parameters. Returns QueryResult with .data attribute.
         
@@ -209,8 +423,10 @@ class DatabaseWrapper:
             filters: Dictionary of column: value filters (eq)
             in_filters: Dictionary of column: [values] for IN filters
             comparison_filters: Dictionary of column: (op, value) for gt, lt, gte, lte
+            or_filters: PostgREST logic strings, each one an OR of its terms
             order_by: Column to order by
             order_desc: Whether to order descending
+            then_order: Tie-breaker (column, desc) pairs applied after order_by
             limit_count: Maximum number of records to return
             
         Returns:
@@ -242,9 +458,14 @@ class DatabaseWrapper:
                             query = query.gte(key, value)
                         elif op == 'lte':
                             query = query.lte(key, value)
+                
+                for expr in or_filters or []:
+                    query = query.or_(expr)
                         
                 if order_by:
                     query = query.order(order_by, desc=order_desc)
+                for key, desc in then_order or []:
+                    query = query.order(key, desc=desc)
                     
                 if limit_count:
                     query = query.limit(limit_count)
@@ -272,25 +493,49 @@ class DatabaseWrapper:
                 # Build WHERE clause
                 where_clause = ""
                 params = {}
+                conditions = []
                 
                 if filters:
-                    conditions = []
-                    for i, (key, value) in enumerate(filters.items()):
+                    for key, value in filters.items():
+                        param_name = f"param_{len(params)}"
                         if isinstance(value, tuple) and value[0] == 'neq':
-                            param_name = f"param_{i}"
                             conditions.append(f"{key} != :{param_name}")
                             params[param_name] = value[1]
                         else:
-                            param_name = f"param_{i}"
                             conditions.append(f"{key} = :{param_name}")
                             params[param_name] = value
+                
+                if in_filters:
+                    for key, values in in_filters.items():
+                        if not values:
+                            conditions.append("FALSE")
+                            continue
+                        names = []
+                        for value in values:
+                            param_name = f"param_{len(params)}"
+                            params[param_name] = value
+                            names.append(f":{param_name}")
+                        conditions.append(f"{key} IN ({', '.join(names)})")
+                
+                if comparison_filters:
+                    for key, (op, value) in comparison_filters.items():
+                        param_name = f"param_{len(params)}"
+                        conditions.append(f"{key} {SQL_COMPARISONS[op]} :{param_name}")
+                        params[param_name] = value
+                
+                for expr in or_filters or []:
+                    conditions.append(logic_filter_sql(expr, params))
+                
+                if conditions:
                     where_clause = " WHERE " + " AND ".join(conditions)
                 
                 # Build ORDER BY clause
                 order_clause = ""
                 if order_by:
-                    direction = "DESC" if order_desc else "ASC"
-                    order_clause = f" ORDER BY {order_by} {direction}"
+                    orders = [(order_by, order_desc)] + list(then_order or [])
+                    order_clause = " ORDER BY " + ", ".join(
+                        [f"{key} {'DESC' if desc else 'ASC'}" for key, desc in orders]
+                    )
                 
                 # Build LIMIT clause
                 limit_clause = ""
@@ -305,6 +550,10 @@ class DatabaseWrapper:
                 for row in result:
                     rows.append(dict(row._mapping))
                 
+                # End the read transaction so the connection goes back to the pool now,
+                # not whenever the request's session is garbage collected
+                self.client.commit()
+                
                 return QueryResult(data=rows)
                 
             else:
@@ -354,7 +603,91 @@ class DatabaseWrapper:
         """
         return self._execute_insert(table, data)
     
-    def _execute_update(self, table: str, data: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    def insert_many(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """
+        Insert several records in one statement (rows must share the same columns)
+
+        Args:
+            table: Table name
+            rows: List of column: value dictionaries
+
+        Returns:
+            Number of rows sent
+        """
+        if not rows:
+            return 0
+        
+        try:
+            if self.is_supabase:
+                self.client.table(table).insert(rows).execute()
+                
+            elif self.is_sqlalchemy:
+                from sqlalchemy import text
+                
+                columns = ", ".join(rows[0].keys())
+                placeholders = ", ".join([f":{key}" for key in rows[0].keys()])
+                
+                query_str = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+                self.client.execute(text(query_str), rows)
+                self.client.commit()
+                
+            else:
+                raise ValueError("Unknown database client type")
+            
+            return len(rows)
+                
+        except Exception as e:
+            logger.error(f"Database bulk insert error: {e}")
+            if self.is_sqlalchemy:
+                self.client.rollback()
+            raise
+    
+    def _execute_insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> QueryResult:
+        """
+        Insert several records in one multi-row INSERT and return them
+        
+        Args:
+            table: Table name
+            rows: List of column: value dictionaries (same columns)
+            
+        Returns:
+            QueryResult with the inserted records
+        """
+        if not rows:
+            return QueryResult(data=[])
+        
+        try:
+            if self.is_supabase:
+                result = self.client.table(table).insert(rows).execute()
+                return QueryResult(data=result.data)
+                
+            elif self.is_sqlalchemy:
+                from sqlalchemy import text
+                
+                columns = list(rows[0].keys())
+                values = []
+                params = {}
+                for i, row in enumerate(rows):
+                    values.append("(" + ", ".join([f":{key}_{i}" for key in columns]) + ")")
+                    params.update({f"{key}_{i}": row[key] for key in columns})
+                
+                query_str = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(values)} RETURNING *"
+                result = self.client.execute(text(query_str), params)
+                inserted = [dict(r._mapping) for r in result.fetchall()]
+                self.client.commit()
+                
+                return QueryResult(data=inserted)
+                
+            else:
+                raise ValueError("Unknown database client type")
+                
+        except Exception as e:
+            logger.error(f"Database bulk insert error: {e}")
+            if self.is_sqlalchemy:
+                self.client.rollback()
+            raise
+    
+    def _execute_update(self, table: str, data: Dict[str, Any], filters: Dict[str, Any]) -> QueryResult:
         """
         Internal method to execute UPDATE operations via QueryBuilder chain
         
@@ -364,7 +697,7 @@ class DatabaseWrapper:
             filters: Dictionary of column: value filters
             
         Returns:
-            True if update was successful
+            QueryResult with the updated rows (empty when nothing matched)
         """
         try:
             if self.is_supabase:
@@ -377,14 +710,7 @@ class DatabaseWrapper:
                         query = query.eq(key, value)
                 result = query.execute()
                 
-                # Handle different response types from Supabase
-                updated_rows = []
-                if isinstance(result, list):
-                    updated_rows = result
-                elif hasattr(result, 'data'):
-                    updated_rows = result.data or []
-                
-                return len(updated_rows) > 0
+                return QueryResult(data=result.data or [])
                 
             elif self.is_sqlalchemy:
                 from sqlalchemy import text
@@ -392,31 +718,148 @@ class DatabaseWrapper:
                 # Build SET clause
                 set_clause = ", ".join([f"{key} = :{key}" for key in data.keys()])
                 
-                # Build WHERE clause
-                where_conditions = []
-                params = dict(data)  # Copy data for parameters
+                where_clause, params = self._build_where(filters)
+                params.update(data)
                 
-                for i, (key, value) in enumerate(filters.items()):
-                    param_name = f"filter_{i}"
-                    where_conditions.append(f"{key} = :{param_name}")
-                    params[param_name] = value
+                query_str = f"UPDATE {table} SET {set_clause} WHERE {where_clause} RETURNING *"
+                result = self.client.execute(text(query_str), params)
+                updated = [dict(r._mapping) for r in result.fetchall()]
+                self.client.commit()
                 
-                where_clause = " AND ".join(where_conditions)
+                return QueryResult(data=updated)
                 
-                query_str = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
+            else:
+                raise ValueError("Unknown database client type")
+                
+        except Exception as e:
+            logger.error(f"Database update error: {e}", exc_info=True)
+            if self.is_sqlalchemy:
+                self.client.rollback()
+            raise
+    
+    def _execute_delete(self, table: str, filters: Dict[str, Any]) -> QueryResult:
+        """
+        Internal method to execute DELETE operations via QueryBuilder chain
+        
+        Args:
+            table: Table name
+            filters: Dictionary of column: value filters (required, no unfiltered deletes)
+            
+        Returns:
+            QueryResult with the deleted rows (empty when nothing matched)
+        """
+        if not filters:
+            raise ValueError("Refusing to DELETE without filters")
+        
+        try:
+            if self.is_supabase:
+                query = self.client.table(table).delete()
+                for key, value in filters.items():
+                    if isinstance(value, tuple) and value[0] == 'neq':
+                        query = query.neq(key, value[1])
+                    else:
+                        query = query.eq(key, value)
+                result = query.execute()
+                
+                return QueryResult(data=result.data or [])
+                
+            elif self.is_sqlalchemy:
+                from sqlalchemy import text
+                
+                where_clause, params = self._build_where(filters)
+                
+                query_str = f"DELETE FROM {table} WHERE {where_clause} RETURNING *"
                 result = self.client.execute(text(query_str), params)
+                deleted = [dict(r._mapping) for r in result.fetchall()]
                 self.client.commit()
                 
-                return result.rowcount > 0
+                return QueryResult(data=deleted)
                 
             else:
                 raise ValueError("Unknown database client type")
                 
         except Exception as e:
-            logger.error(f"Database update error: {e}", exc_info=True)
+            logger.error(f"Database delete error: {e}", exc_info=True)
+            if self.is_sqlalchemy:
+                self.client.rollback()
+            raise
+    
+    @staticmethod
+    def _build_where(filters: Dict[str, Any]):
+        """Build a WHERE clause and its parameters from eq/neq filters"""
+        conditions = []
+        params = {}
+        for i, (key, value) in enumerate(filters.items()):
+            param_name = f"filter_{i}"
+            if isinstance(value, tuple) and value[0] == 'neq':
+                conditions.append(f"{key} != :{param_name}")
+                params[param_name] = value[1]
+            else:
+                conditions.append(f"{key} = :{param_name}")
+                params[param_name] = value
+        return " AND ".join(conditions), params
+    
+    def _execute_upsert(self, table: str, data, on_conflict: Optional[str] = None,
+                        ignore_duplicates: bool = False) -> QueryResult:
+        """
+        Execute an INSERT ... ON CONFLICT query
+        
+        Args:
+            table: Table name
+            data: Record dictionary or list of record dictionaries
+            on_conflict: Comma-separated conflict columns (primary key if None)
+            ignore_duplicates: Keep the existing row instead of updating it
+            
+        Returns:
+            QueryResult with the inserted/updated rows
+        """
+        try:
+            if self.is_supabase:
+                options = {"ignore_duplicates": ignore_duplicates}
+                if on_conflict:
+                    options["on_conflict"] = on_conflict
+                result = self.client.table(table).upsert(data, **options).execute()
+                return QueryResult(data=result.data)
+                
+            elif self.is_sqlalchemy:
+                from sqlalchemy import text
+                
+                rows = data if isinstance(data, list) else [data]
+                if not rows:
+                    return QueryResult(data=[])
+                
+                conflict_columns = [c.strip() for c in (on_conflict or "id").split(",")]
+                columns = list(rows[0].keys())
+                placeholders = ", ".join([f":{key}" for key in columns])
+                
+                if ignore_duplicates:
+                    action = "DO NOTHING"
+                else:
+                    updates = [c for c in columns if c not in conflict_columns]
+                    action = "DO UPDATE SET " + ", ".join([f"{c} = EXCLUDED.{c}" for c in updates]) if updates else "DO NOTHING"
+                
+                query_str = (
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT ({', '.join(conflict_columns)}) {action} RETURNING *"
+                )
+                
+                returned = []
+                for row in rows:
+                    result = self.client.execute(text(query_str), row)
+                    returned.extend(dict(r._mapping) for r in result.fetchall())
+                self.client.commit()
+                
+                return QueryResult(data=returned)
+                
+            else:
+                raise ValueError("Unknown database client type")
+                
+        except Exception as e:
+            logger.error(f"Database upsert error: {e}")
             if self.is_sqlalchemy:
                 self.client.rollback()
             raise
+    
     def _execute_insert(self, table: str, data: Dict[str, Any]) -> Optional[Dict]:
         """
         Execute an insert query
@@ -0,0 +1,105 @@
+"""
+Deferred log writes
+Analytics rows are queued in memory and bulk-inserted by a background task,
+keeping the inserts out of the request path (rows still queued on a crash are lost)
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+
+from app.core.database import get_db
+
+# Flush every FLUSH_INTERVAL seconds or MAX_BATCH rows, whichever comes first
+FLUSH_INTERVAL = 0.1
+MAX_BATCH = 500
+
+_queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+_worker: Optional[asyncio.Task] = None
+
+# Put on the queue by stop_log_worker: the drain task flushes its batch and exits
+_STOP = object()
+
+
+def enqueue(table: str, row: Dict[str, Any]):
+    """Queue a row for deferred insertion"""
+    _ensure_worker()
+    _queue.put_nowait((table, row))
+
+
+def _ensure_worker():
+    """Start the drain task if it is not running (e.g. lifespan skipped)"""
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_drain())
+
+
+async def _drain():
+    """Collect queued rows into batches and flush them"""
+    while True:
+        first = await _queue.get()
+        if first is _STOP:
+            return
+        items = [first]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        stopping = False
+        
+        while len(items) < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            items.append(item)
+        
+        await _flush(items)
+        if stopping:
+            return
+
+
+async def _flush(items: List[Tuple[str, Dict[str, Any]]]):
+    """Bulk-insert queued rows, one statement per table"""
+    by_table = defaultdict(list)
+    for table, row in items:
+        by_table[table].append(row)
+    
+    db = get_db()
+    try:
+        for table, rows in by_table.items():
+            try:
+                await asyncio.to_thread(db.insert_many, table, rows)
+            except Exception as e:
+                logger.error(f"Deferred insert into {table} failed ({len(rows)} rows): {e}")
+    finally:
+        db.close()
+
+
+async def start_log_worker():
+    """Start the background drain task"""
+    _ensure_worker()
+
+
+async def stop_log_worker():
+    """Stop the drain task and flush whatever is still queued"""
+    global _worker
+    if _worker is not None and not _worker.done():
+        # Not cancelled: the batch being collected would be lost with the task
+        _queue.put_nowait(_STOP)
+        await _worker
+    _worker = None
+    
+    # Rows queued behind the stop marker
+    items = []
+    while not _queue.empty():
+        item = _queue.get_nowait()
+        if item is not _STOP:
+            items.append(item)
+    if items:
+        await _flush(items)
@@ -7,16 +7,52 @@ from typing import Optional, Dict
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
+from cachetools import TTLCache
+from calendar import timegm
+import base64
 import hashlib
+import hmac
+import orjson
 import secrets
+import time
 from app.core.config import settings
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Device encryption
+# Decoded JWT payloads, keyed by token digest (successful decodes only).
+# Entries live at most TOKEN_CACHE_TTL seconds and never past the token's exp
+TOKEN_CACHE_TTL = 30
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+
+# Device encryption (one cipher for the process)
 cipher_suite = Fernet(settings.DEVICE_ENCRYPTION_KEY.encode()[:44] + b'=' * (44 - len(settings.DEVICE_ENCRYPTION_KEY.encode())))
 
+# HMAC signing state computed once (key bytes and encoded header never change)
+_HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+_jwt_digest = _HMAC_DIGESTS.get(settings.JWT_ALGORITHM)
+_jwt_key = settings.JWT_SECRET_KEY.encode()
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+_jwt_header = _b64url(orjson.dumps({"alg": settings.JWT_ALGORITHM, "typ": "JWT"}))
+
+
+def _encode_jwt(claims: Dict) -> str:
+    """Sign a JWT with the configured secret (HMAC fast path, python-jose otherwise)"""
+    if _jwt_digest is None:
+        return jwt.encode(claims, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    
+    if isinstance(claims.get("exp"), datetime):
+        claims["exp"] = timegm(claims["exp"].utctimetuple())
+    
+    signing_input = _jwt_header + b"." + _b64url(orjson.dumps(claims))
+    signature = hmac.new(_jwt_key, signing_input, _jwt_digest).digest()
+    return (signing_input + b"." + _b64url(signature)).decode()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
@@ -42,7 +78,7 @@ def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = _encode_jwt(to_encode)
     return encoded_jwt
 
 
@@ -51,7 +87,7 @@ def create_refresh_token(data: Dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = _encode_jwt(to_encode)
     return encoded_jwt
 
 
@@ -64,6 +100,23 @@ def decode_token(token: str) -> Optional[Dict]:
         return None
 
 
+def decode_token_cached(token: str) -> Optional[Dict]:
+    """Decode JWT token, reusing recent successful decodes"""
+    key = hashlib.sha256(token.encode()).digest()[:16]
+    payload = _token_cache.get(key)
+    
+    if payload is not None:
+        # The cache TTL may outlive the token itself
+        if payload.get("exp", 0) > time.time():
+            return payload
+        _token_cache.pop(key, None)
+    
+    payload = decode_token(token)
+    if payload:
+        _token_cache[key] = payload
+    return payload
+
+
 def generate_device_id(user_agent: str, ip_address: str) -> str:
     """Generate unique device ID"""
     device_string = f"{user_agent}:{ip_address}:{secrets.token_hex(16)}"
@@ -95,5 +148,5 @@ def create_short_lived_token(data: Dict, seconds: int = 60) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(seconds=seconds)
     to_encode.update({"exp": expire, "type": "ephemeral"})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    encoded_jwt = _encode_jwt(to_encode)
     return encoded_jwt
@@ -0,0 +1,25 @@
+"""
+Minimal user profiles
+id, full_name and avatar_url cached in process for response enrichment and
+system messages (invalidated on profile/avatar updates)
+"""
+
+from typing import Optional
+from cachetools import TTLCache
+
+_user_mini: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+
+def peek_user_mini(uid: str) -> Optional[dict]:
+    """Cached minimal profile of uid, None on a miss (no query)"""
+    return _user_mini.get(uid)
+
+
+def remember_user_mini(uid: str, user: dict):
+    """Cache a minimal profile fetched by the caller"""
+    _user_mini[uid] = user
+
+
+def invalidate_user_mini(uid: str):
+    """Drop the cached minimal profile of uid"""
+    _user_mini.pop(uid, None)
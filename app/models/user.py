@@ -80,6 +80,10 @@ class UserResponse(BaseModel):
     last_login: Optional[datetime]
 
 
+# Columns needed to build a UserResponse (never password_hash / device_id)
+USER_RESPONSE_COLUMNS = ", ".join(UserResponse.model_fields)
+
+
 class UserUpdate(BaseModel):
     """User update schema"""
     full_name: Optional[str] = None
@@ -6,7 +6,7 @@ Version 15.0.0
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
 import time
@@ -14,6 +14,9 @@ from loguru import logger
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.log_queue import start_log_worker, stop_log_worker
+from app.core.cache import close_cache
+from app.core.announcement_events import start_announcement_listener, stop_announcement_listener
 from app.api.routes import auth, users, ai, courses, payments, admin, notifications, oauth
 
 # Import new routes
@@ -54,9 +57,26 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("✅ Database connected")
     
+    # Warm up shared HTTP clients
+    ai.get_scholar_client()
+    
+    # Firebase Admin app for push notifications
+    if HAS_FCM:
+        notifications_fcm.init_firebase()
+    
+    # Background writer for deferred logs
+    await start_log_worker()
+    
+    # Announcement change notifications for the SSE stream
+    start_announcement_listener()
+    
     yield
     
     logger.info("👋 Campus OS UNIGOM Backend shutting down...")
+    stop_announcement_listener()
+    await stop_log_worker()
+    await ai.close_scholar_client()
+    await close_cache()
 
 
 # Create FastAPI app
@@ -65,6 +85,7 @@ app = FastAPI(
     description="L'Intelligence Batera pour l'Université de Goma",
     version="15.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
 )
@@ -0,0 +1,26 @@
+-- Migration: Pre-aggregated admin dashboard statistics
+-- Date: 2026-10-15
+-- Description: Materialize the /admin/stats scalars so the dashboard reads one
+-- row instead of scanning users, purchase_transactions and ai_usage per hit
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS admin_stats_mv AS
+SELECT
+    1 AS id,
+    COUNT(*) AS total_users,
+    COUNT(*) FILTER (WHERE status = 'active') AS active_users,
+    COALESCE(SUM(batera_coins), 0) AS coins_in_circulation,
+    (SELECT COALESCE(SUM(amount_usd), 0) FROM purchase_transactions WHERE status = 'completed') AS total_revenue,
+    (SELECT COUNT(*) FROM ai_usage) AS total_ai_queries
+FROM users;
+
+-- Required by REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_admin_stats_mv_id ON admin_stats_mv(id);
+
+-- Refresh every minute (readers are never blocked while refreshing)
+CREATE EXTENSION IF NOT EXISTS pg_cron;
+
+SELECT cron.schedule(
+    'refresh-admin-stats',
+    '* * * * *',
+    $$REFRESH MATERIALIZED VIEW CONCURRENTLY admin_stats_mv$$
+);
@@ -0,0 +1,16 @@
+-- Migration: AI usage aggregation per service
+-- Date: 2026-10-15
+-- Description: Aggregate ai_usage by service in the database for /admin/ai-usage
+-- instead of transferring every row of the window to the API
+
+CREATE INDEX IF NOT EXISTS ai_usage_created_at_idx ON ai_usage(created_at, service);
+
+CREATE OR REPLACE FUNCTION get_ai_usage_by_service(p_since TIMESTAMPTZ)
+RETURNS TABLE(service TEXT, count BIGINT, total_cost DOUBLE PRECISION)
+LANGUAGE sql STABLE
+AS $$
+    SELECT u.service::TEXT, COUNT(*), COALESCE(SUM(u.cost), 0)::DOUBLE PRECISION
+    FROM ai_usage u
+    WHERE u.created_at >= p_since
+    GROUP BY u.service;
+$$;
@@ -0,0 +1,28 @@
+-- Migration: Announcement details in one call
+-- Date: 2026-10-15
+-- Description: Return an announcement with its attachments, stats and the
+-- caller's view flag as a single JSON document (one round trip instead of four)
+
+CREATE OR REPLACE FUNCTION get_announcement_bundle(p_id UUID, p_user UUID DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'announcement', to_jsonb(a),
+        'attachments', COALESCE(
+            (SELECT jsonb_agg(x) FROM announcement_attachments x WHERE x.announcement_id = p_id),
+            '[]'::jsonb
+        ),
+        'stats', COALESCE(
+            (SELECT to_jsonb(s) FROM get_announcement_stats(p_id) s LIMIT 1),
+            jsonb_build_object('total_views', 0, 'total_reactions', 0, 'reaction_breakdown', '{}'::jsonb)
+        ),
+        'user_has_viewed', EXISTS (
+            SELECT 1 FROM announcement_views v
+            WHERE v.announcement_id = p_id AND v.user_id = p_user
+        )
+    )
+    FROM announcements a
+    WHERE a.id = p_id;
+$$;
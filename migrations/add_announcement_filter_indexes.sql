@@ -0,0 +1,9 @@
+-- Migration: Announcement filter indexes
+-- Date: 2026-10-15
+-- Description: Back the admin list filters (status / type, newest first) with
+-- composite indexes. View/reaction pairs and users.email are already covered by
+-- announcement_views_reactions_unique.sql and users_email_unique.sql
+
+CREATE INDEX IF NOT EXISTS idx_announcements_created ON announcements(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_announcements_status_created ON announcements(status, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_announcements_type_created ON announcements(type, created_at DESC);
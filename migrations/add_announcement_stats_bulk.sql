@@ -0,0 +1,21 @@
+-- Migration: Bulk announcement statistics
+-- Date: 2026-10-15
+-- Description: Stats for a page of announcements in one call, used by the
+-- batched announcement loader on list endpoints
+
+CREATE OR REPLACE FUNCTION get_announcement_stats_bulk(p_ids UUID[])
+RETURNS TABLE(announcement_id UUID, stats JSONB)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        i.id,
+        COALESCE(
+            (SELECT to_jsonb(s) FROM get_announcement_stats(i.id) s LIMIT 1),
+            jsonb_build_object('total_views', 0, 'total_reactions', 0, 'reaction_breakdown', '{}'::jsonb)
+        )
+    FROM unnest(p_ids) AS i(id);
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_announcement_attachments_announcement ON announcement_attachments(announcement_id);
+CREATE INDEX IF NOT EXISTS idx_announcement_views_announcement_user ON announcement_views(announcement_id, user_id);
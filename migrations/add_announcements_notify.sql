@@ -0,0 +1,35 @@
+-- Migration: Announcement change notifications
+-- Date: 2026-10-15
+-- Description: NOTIFY announcements_changed on every announcement write so the
+-- API can push changes over SSE instead of clients polling /announcements/user.
+-- The payload carries only the audience fields (pg_notify is capped at 8000 bytes)
+
+CREATE OR REPLACE FUNCTION notify_announcement_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    r announcements%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        r := OLD;
+    ELSE
+        r := NEW;
+    END IF;
+    
+    PERFORM pg_notify('announcements_changed', json_build_object(
+        'id', r.id,
+        'action', lower(TG_OP),
+        'status', r.status,
+        'target_all_users', r.target_all_users,
+        'target_faculties', r.target_faculties,
+        'target_academic_levels', r.target_academic_levels
+    )::text);
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS announcements_notify ON announcements;
+CREATE TRIGGER announcements_notify
+    AFTER INSERT OR UPDATE OR DELETE ON announcements
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_announcement_changed();
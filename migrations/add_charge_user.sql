@@ -0,0 +1,33 @@
+-- Migration: Atomic AI service charge
+-- Date: 2026-10-15
+-- Description: Conditional debit + ledger entry in one statement pair, so a
+-- balance check can no longer race with a concurrent charge (no overdraft)
+
+CREATE OR REPLACE FUNCTION charge_user(p_uid UUID, p_cost NUMERIC, p_desc TEXT)
+RETURNS NUMERIC
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_balance NUMERIC;
+BEGIN
+    UPDATE users
+    SET batera_coins = batera_coins - p_cost
+    WHERE id = p_uid AND batera_coins >= p_cost
+    RETURNING batera_coins INTO v_balance;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM users WHERE id = p_uid) THEN
+            RAISE EXCEPTION 'insufficient_funds';
+        END IF;
+        RAISE EXCEPTION 'user_not_found';
+    END IF;
+
+    INSERT INTO transactions (user_id, type, amount, description, created_at)
+    VALUES (p_uid, 'debit', p_cost, p_desc, NOW());
+
+    RETURN v_balance;
+END;
+$$;
+
+-- Superseded by charge_user
+DROP FUNCTION IF EXISTS deduct_coins(UUID, NUMERIC, TEXT);
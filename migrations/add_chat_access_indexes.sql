@@ -0,0 +1,18 @@
+-- Migration: Chat access path indexes
+-- Date: 2026-10-15
+-- Description: Composite indexes for the remaining chat/messaging lookups.
+-- chat_messages(chat_id, timestamp DESC) and conversation_participants(user_id, conversation_id)
+-- already come from paginate_chat_messages.sql and add_recent_direct_contacts.sql.
+
+-- Other side of the participants join (partner lookup, member listings)
+CREATE INDEX IF NOT EXISTS idx_conversation_participants_conversation
+ON conversation_participants(conversation_id, user_id);
+
+-- Conversation history pages and last-message lookups, newest first
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation_created
+ON chat_messages(conversation_id, created_at DESC)
+WHERE is_deleted = false;
+
+-- Oracle session list per user
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated
+ON chat_sessions(user_id, updated_at DESC);
@@ -0,0 +1,41 @@
+-- Migration: Ownership-checked chat session RPCs
+-- Date: 2026-10-15
+-- Description: Read / post Oracle chat messages with the session ownership
+-- check folded into the same statement (one round trip, NULL when not owner)
+
+CREATE OR REPLACE FUNCTION get_owned_chat_messages(p_chat UUID, p_user UUID)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE
+        WHEN EXISTS (SELECT 1 FROM chat_sessions s WHERE s.id = p_chat AND s.user_id = p_user)
+        THEN COALESCE(
+            (SELECT jsonb_agg(to_jsonb(m) ORDER BY m.timestamp) FROM chat_messages m WHERE m.chat_id = p_chat),
+            '[]'::jsonb
+        )
+    END;
+$$;
+
+CREATE OR REPLACE FUNCTION post_chat_message(p_chat UUID, p_user UUID, p_type TEXT, p_content TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    msg JSONB;
+BEGIN
+    UPDATE chat_sessions
+    SET updated_at = NOW(), message_count = message_count + 1
+    WHERE id = p_chat AND user_id = p_user;
+    
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    
+    INSERT INTO chat_messages (id, chat_id, sender, type, content, timestamp, is_read)
+    VALUES (gen_random_uuid(), p_chat, 'user', p_type, p_content, NOW(), TRUE)
+    RETURNING to_jsonb(chat_messages.*) INTO msg;
+    
+    RETURN msg;
+END;
+$$;
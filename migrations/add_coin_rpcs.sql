@@ -0,0 +1,87 @@
+-- Migration: Atomic Batera Coins operations
+-- Date: 2026-10-15
+-- Description: Move balance updates and their ledger entry into single
+-- transactional functions (one round trip, no read-modify-write race)
+
+-- Approve a pending purchase: credit the user, close the purchase, log the credit
+CREATE OR REPLACE FUNCTION approve_purchase(p_tx UUID, p_admin UUID)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    t purchase_transactions%ROWTYPE;
+    v_balance NUMERIC;
+BEGIN
+    SELECT * INTO t FROM purchase_transactions WHERE id = p_tx FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    -- Already approved (or rejected): never credit twice
+    IF t.status <> 'pending' THEN
+        RETURN jsonb_build_object('error', 'not_pending', 'status', t.status);
+    END IF;
+
+    UPDATE users
+    SET batera_coins = batera_coins + t.coins
+    WHERE id = t.user_id
+    RETURNING batera_coins INTO v_balance;
+
+    UPDATE purchase_transactions
+    SET status = 'completed', approved_by = p_admin, approved_at = NOW()
+    WHERE id = p_tx;
+
+    INSERT INTO transactions (user_id, type, amount, description, created_at)
+    VALUES (t.user_id, 'credit', t.coins, 'Achat approuvé: ' || t.coins || ' Coins', NOW());
+
+    RETURN jsonb_build_object('user_id', t.user_id, 'coins', t.coins, 'new_balance', v_balance);
+END;
+$$;
+
+-- Credit a user and log the transaction, returns the new balance (NULL if unknown user)
+CREATE OR REPLACE FUNCTION add_coins(p_uid UUID, p_amount NUMERIC, p_desc TEXT)
+RETURNS NUMERIC
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_balance NUMERIC;
+BEGIN
+    UPDATE users
+    SET batera_coins = batera_coins + p_amount
+    WHERE id = p_uid
+    RETURNING batera_coins INTO v_balance;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO transactions (user_id, type, amount, description, created_at)
+    VALUES (p_uid, 'credit', p_amount, p_desc, NOW());
+
+    RETURN v_balance;
+END;
+$$;
+
+-- Debit a user and log the transaction, returns the new balance (NULL if unknown user)
+CREATE OR REPLACE FUNCTION deduct_coins(p_uid UUID, p_cost NUMERIC, p_desc TEXT)
+RETURNS NUMERIC
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_balance NUMERIC;
+BEGIN
+    UPDATE users
+    SET batera_coins = batera_coins - p_cost
+    WHERE id = p_uid
+    RETURNING batera_coins INTO v_balance;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO transactions (user_id, type, amount, description, created_at)
+    VALUES (p_uid, 'debit', p_cost, p_desc, NOW());
+
+    RETURN v_balance;
+END;
+$$;
@@ -0,0 +1,15 @@
+-- Migration: Last message per conversation
+-- Date: 2026-10-15
+-- Description: Latest chat message of each conversation in one call, used by
+-- the conversation list instead of one query per conversation
+
+CREATE OR REPLACE FUNCTION get_last_messages_per_conversation(p_ids UUID[])
+RETURNS SETOF chat_messages
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT ON (conversation_id) *
+    FROM chat_messages
+    WHERE conversation_id = ANY(p_ids)
+    ORDER BY conversation_id, created_at DESC;
+$$;
@@ -0,0 +1,50 @@
+-- Migration: Create or get a direct conversation
+-- Date: 2026-10-15
+-- Description: create_or_get_direct RPC that checks blocks, returns the existing
+-- direct conversation or creates it with both participants in one call
+
+CREATE OR REPLACE FUNCTION create_or_get_direct(p_user UUID, p_other UUID)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    conv conversations%ROWTYPE;
+    ts TIMESTAMPTZ := NOW();
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM blocked_users
+        WHERE (blocker_id = p_user AND blocked_id = p_other)
+           OR (blocker_id = p_other AND blocked_id = p_user)
+    ) THEN
+        RETURN jsonb_build_object('error', 'blocked');
+    END IF;
+    
+    -- Serialize concurrent creations for the same pair
+    PERFORM pg_advisory_xact_lock(hashtext(LEAST(p_user, p_other)::TEXT || GREATEST(p_user, p_other)::TEXT));
+    
+    SELECT c.* INTO conv
+    FROM conversations c
+    JOIN conversation_participants a ON a.conversation_id = c.id AND a.user_id = p_user
+    JOIN conversation_participants b ON b.conversation_id = c.id AND b.user_id = p_other
+    WHERE c.type = 'direct'
+    LIMIT 1;
+    
+    IF FOUND THEN
+        RETURN to_jsonb(conv);
+    END IF;
+    
+    INSERT INTO conversations (id, type, created_by, created_at, updated_at)
+    VALUES (gen_random_uuid(), 'direct', p_user, ts, ts)
+    RETURNING * INTO conv;
+    
+    INSERT INTO conversation_participants (
+        id, conversation_id, user_id, role, can_send_messages, can_add_members,
+        can_remove_members, can_edit_group_info, can_delete_messages, added_by, joined_at
+    )
+    VALUES
+        (gen_random_uuid(), conv.id, p_user, 'member', TRUE, FALSE, FALSE, FALSE, FALSE, NULL, ts),
+        (gen_random_uuid(), conv.id, p_other, 'member', TRUE, FALSE, FALSE, FALSE, FALSE, p_user, ts);
+    
+    RETURN to_jsonb(conv);
+END;
+$$;
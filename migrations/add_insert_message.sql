@@ -0,0 +1,37 @@
+-- Migration: Insert a conversation message with its sender
+-- Date: 2026-10-15
+-- Description: Inserts a chat message and returns it with the embedded sender
+-- profile, replacing the insert + users lookup of POST /messaging/.../messages
+
+CREATE OR REPLACE FUNCTION insert_message(
+    p_conversation UUID,
+    p_sender UUID,
+    p_content TEXT,
+    p_message_type TEXT DEFAULT 'text',
+    p_media_url TEXT DEFAULT NULL,
+    p_reply_to UUID DEFAULT NULL,
+    p_latitude DOUBLE PRECISION DEFAULT NULL,
+    p_longitude DOUBLE PRECISION DEFAULT NULL,
+    p_location_name TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+    WITH m AS (
+        INSERT INTO chat_messages (
+            id, conversation_id, sender_id, content, message_type, media_url,
+            reply_to_message_id, latitude, longitude, location_name, created_at
+        )
+        VALUES (
+            gen_random_uuid(), p_conversation, p_sender, p_content, p_message_type, p_media_url,
+            p_reply_to, p_latitude, p_longitude, p_location_name, NOW()
+        )
+        RETURNING *
+    )
+    SELECT to_jsonb(m) || jsonb_build_object(
+        'sender',
+        (SELECT jsonb_build_object('id', u.id, 'full_name', u.full_name, 'avatar_url', u.avatar_url)
+         FROM users u WHERE u.id = m.sender_id)
+    )
+    FROM m;
+$$;
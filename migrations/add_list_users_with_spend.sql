@@ -0,0 +1,33 @@
+-- Migration: Admin user list with aggregated spend
+-- Date: 2026-10-15
+-- Description: Join users with their total debit amount in one query so the
+-- admin panel no longer issues one transactions lookup per user
+
+-- Users joined with their total spent (debits only)
+CREATE OR REPLACE VIEW user_management_v AS
+SELECT
+    u.*,
+    COALESCE(s.total_spent, 0) AS total_spent
+FROM users u
+LEFT JOIN (
+    SELECT user_id, SUM(amount) AS total_spent
+    FROM transactions
+    WHERE type = 'debit'
+    GROUP BY user_id
+) s ON s.user_id = u.id;
+
+-- RPC used by GET /api/v1/admin/users
+CREATE OR REPLACE FUNCTION list_users_with_spend(p_status TEXT DEFAULT NULL, p_limit INT DEFAULT 100)
+RETURNS SETOF user_management_v
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT *
+    FROM user_management_v
+    WHERE p_status IS NULL OR status = p_status
+    ORDER BY created_at DESC
+    LIMIT p_limit;
+$$;
+
+-- Speeds up the per-user debit aggregation
+CREATE INDEX IF NOT EXISTS idx_transactions_user_type ON transactions(user_id, type);
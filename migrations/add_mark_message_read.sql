@@ -0,0 +1,16 @@
+-- Migration: Mark conversation read up to a message
+-- Date: 2026-10-15
+-- Description: Moves the reader's last_read_at / last_read_message_id in one
+-- statement (no separate lookup of the message's conversation)
+
+CREATE OR REPLACE FUNCTION mark_message_read(p_message UUID, p_user UUID)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE conversation_participants cp
+    SET last_read_at = NOW(), last_read_message_id = p_message
+    FROM chat_messages m
+    WHERE m.id = p_message
+      AND cp.conversation_id = m.conversation_id
+      AND cp.user_id = p_user;
+$$;
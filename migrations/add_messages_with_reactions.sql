@@ -0,0 +1,49 @@
+-- Migration: Conversation messages with sender and reactions
+-- Date: 2026-10-15
+-- Description: One page of a conversation (oldest first) with the sender profile
+-- and the reactions aggregated per message, replacing the messages query plus
+-- the separate reactions query of GET /messaging/conversations/{id}/messages
+
+CREATE OR REPLACE FUNCTION get_messages_with_reactions(
+    p_conversation UUID,
+    p_before TIMESTAMPTZ DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(
+        jsonb_agg(
+            to_jsonb(m)
+            || jsonb_build_object('sender', s.sender, 'reactions', COALESCE(r.reactions, '[]'::jsonb))
+            ORDER BY m.created_at
+        ),
+        '[]'::jsonb
+    )
+    FROM (
+        SELECT * FROM chat_messages
+        WHERE conversation_id = p_conversation
+          AND is_deleted = false
+          AND (p_before IS NULL OR created_at < p_before)
+        ORDER BY created_at DESC
+        LIMIT p_limit
+    ) m
+    LEFT JOIN LATERAL (
+        SELECT jsonb_build_object('id', u.id, 'full_name', u.full_name, 'avatar_url', u.avatar_url) AS sender
+        FROM users u WHERE u.id = m.sender_id
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object(
+            'message_id', mr.message_id,
+            'reaction', mr.reaction,
+            'user_id', mr.user_id,
+            'users', jsonb_build_object('full_name', ru.full_name)
+        )) AS reactions
+        FROM message_reactions mr
+        LEFT JOIN users ru ON ru.id = mr.user_id
+        WHERE mr.message_id = m.id
+    ) r ON true;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_message_reactions_message ON message_reactions(message_id);
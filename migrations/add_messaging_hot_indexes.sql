@@ -0,0 +1,24 @@
+-- Migration: Messaging hot predicate indexes
+-- Date: 2026-10-15
+-- Description: Remaining composite indexes for the messaging read path.
+-- chat_messages(conversation_id, created_at DESC) WHERE is_deleted = false comes from
+-- add_chat_access_indexes.sql, message_reactions(message_id) from add_messages_with_reactions.sql.
+
+-- Drop duplicate memberships left by create_conversation's old per-id inserts
+-- (keeps the earliest row, i.e. the creator's own or the first invitation)
+DELETE FROM conversation_participants a
+USING conversation_participants b
+WHERE a.conversation_id = b.conversation_id
+  AND a.user_id = b.user_id
+  AND a.ctid > b.ctid;
+
+-- One membership row per (conversation, user); also serves every participant check
+CREATE UNIQUE INDEX IF NOT EXISTS idx_participants_conv_user
+ON conversation_participants(conversation_id, user_id);
+
+-- Superseded by the unique index above
+DROP INDEX IF EXISTS idx_conversation_participants_conversation;
+
+-- Block checks in both directions and block list lookups (not unique)
+CREATE INDEX IF NOT EXISTS idx_blocked_users_blocker_blocked
+ON blocked_users(blocker_id, blocked_id);
@@ -0,0 +1,22 @@
+-- Migration: Notifiable push tokens
+-- Date: 2026-10-15
+-- Description: Active FCM tokens of the unmuted participants of a conversation (sender
+-- excluded) whose message or group notification setting is on, in one joined query
+
+CREATE OR REPLACE FUNCTION get_notifiable_tokens(p_conversation UUID, p_sender UUID, p_is_group BOOLEAN)
+RETURNS TABLE(fcm_token TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.fcm_token
+    FROM conversation_participants cp
+    LEFT JOIN user_messaging_settings s ON s.user_id = cp.user_id
+    JOIN push_notification_tokens t ON t.user_id = cp.user_id AND t.is_active = true
+    WHERE cp.conversation_id = p_conversation
+      AND cp.user_id <> p_sender
+      AND cp.is_muted = false
+      AND COALESCE(
+          CASE WHEN p_is_group THEN s.enable_group_notifications ELSE s.enable_message_notifications END,
+          true
+      );
+$$;
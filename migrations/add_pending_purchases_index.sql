@@ -0,0 +1,8 @@
+-- Migration: Pending purchases index
+-- Date: 2026-10-15
+-- Description: Partial index backing the admin pending-purchase queue
+-- (filter on status = 'pending', newest first)
+
+CREATE INDEX IF NOT EXISTS purchase_transactions_status_created_at_idx
+ON purchase_transactions(status, created_at DESC)
+WHERE status = 'pending';
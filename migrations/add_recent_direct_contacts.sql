@@ -0,0 +1,29 @@
+-- Migration: Recent direct contacts in one call
+-- Date: 2026-10-15
+-- Description: Users the caller shares a direct conversation with, most recent
+-- conversation first (replaces four chained queries in /contacts/recent)
+
+CREATE OR REPLACE FUNCTION get_recent_direct_contacts(p_user_id UUID, p_limit INTEGER DEFAULT 20)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(jsonb_agg(to_jsonb(x) - 'last_at' ORDER BY x.last_at DESC NULLS LAST), '[]'::jsonb)
+    FROM (
+        SELECT u.id, u.full_name, u.email, u.phone, u.avatar_url, u.faculty, u.academic_level, u.status,
+               r.last_at
+        FROM (
+            SELECT p2.user_id, MAX(c.last_message_at) AS last_at
+            FROM conversation_participants p1
+            JOIN conversations c ON c.id = p1.conversation_id AND c.type = 'direct'
+            JOIN conversation_participants p2 ON p2.conversation_id = c.id AND p2.user_id <> p_user_id
+            WHERE p1.user_id = p_user_id
+            GROUP BY p2.user_id
+            ORDER BY last_at DESC NULLS LAST
+            LIMIT p_limit
+        ) r
+        JOIN users u ON u.id = r.user_id
+    ) x;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_conversation_participants_user ON conversation_participants(user_id, conversation_id);
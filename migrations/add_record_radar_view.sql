@@ -0,0 +1,34 @@
+-- Migration: Atomic radar view counter
+-- Date: 2026-10-15
+-- Description: Record a radar alert view and bump views_count in one
+-- transaction (replaces check / insert / read count / write count+1)
+
+-- Drop duplicates left by the old check-then-insert race
+DELETE FROM radar_views a
+USING radar_views b
+WHERE a.alert_id = b.alert_id
+  AND a.user_id = b.user_id
+  AND a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_radar_views_alert_user
+ON radar_views(alert_id, user_id);
+
+ALTER TABLE radar_views ALTER COLUMN viewed_at SET DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION record_radar_view(p_alert UUID, p_user UUID)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO radar_views (alert_id, user_id)
+    VALUES (p_alert, p_user)
+    ON CONFLICT (alert_id, user_id) DO NOTHING;
+    
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+    
+    UPDATE radar_alerts SET views_count = COALESCE(views_count, 0) + 1 WHERE id = p_alert;
+    RETURN TRUE;
+END;
+$$;
@@ -0,0 +1,50 @@
+-- Migration: Toggle message reactions
+-- Date: 2026-10-15
+-- Description: One reaction per (message, user, emoji) and a toggle_reaction RPC
+-- that checks access and adds or removes the reaction in one call
+
+-- Drop duplicates left by the old upsert-on-random-id
+DELETE FROM message_reactions a
+USING message_reactions b
+WHERE a.message_id = b.message_id
+  AND a.user_id = b.user_id
+  AND a.reaction = b.reaction
+  AND a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_message_reactions_message_user_reaction
+ON message_reactions(message_id, user_id, reaction);
+
+CREATE OR REPLACE FUNCTION toggle_reaction(p_message UUID, p_user UUID, p_reaction TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    conv UUID;
+    added message_reactions%ROWTYPE;
+BEGIN
+    SELECT conversation_id INTO conv FROM chat_messages WHERE id = p_message;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'not_found');
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 FROM conversation_participants
+        WHERE conversation_id = conv AND user_id = p_user
+    ) THEN
+        RETURN jsonb_build_object('error', 'not_participant');
+    END IF;
+    
+    INSERT INTO message_reactions (id, message_id, user_id, reaction, created_at)
+    VALUES (gen_random_uuid(), p_message, p_user, p_reaction, NOW())
+    ON CONFLICT (message_id, user_id, reaction) DO NOTHING
+    RETURNING * INTO added;
+    
+    IF FOUND THEN
+        RETURN jsonb_build_object('action', 'added', 'reaction', to_jsonb(added));
+    END IF;
+    
+    DELETE FROM message_reactions
+    WHERE message_id = p_message AND user_id = p_user AND reaction = p_reaction;
+    RETURN jsonb_build_object('action', 'removed');
+END;
+$$;
@@ -0,0 +1,18 @@
+-- Migration: Unread counts per conversation
+-- Date: 2026-10-15
+-- Description: COUNT(*) of messages after the caller's last_read_at for a set of
+-- conversations, in one aggregate (no message ids sent back to be counted)
+
+CREATE OR REPLACE FUNCTION get_unread_counts(p_user_id UUID, p_ids UUID[])
+RETURNS TABLE(conversation_id UUID, unread_count INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT cp.conversation_id, COUNT(m.id)::INTEGER
+    FROM conversation_participants cp
+    LEFT JOIN chat_messages m
+        ON m.conversation_id = cp.conversation_id
+       AND m.created_at > COALESCE(cp.last_read_at, 'epoch'::timestamptz)
+    WHERE cp.user_id = p_user_id AND cp.conversation_id = ANY(p_ids)
+    GROUP BY cp.conversation_id;
+$$;
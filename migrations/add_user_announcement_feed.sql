@@ -0,0 +1,22 @@
+-- Migration: User announcement feed in one call
+-- Date: 2026-10-15
+-- Description: Audience-filtered announcements for a user, already shaped with
+-- attachments, stats and view flag, limited in SQL (one round trip per page)
+
+CREATE OR REPLACE FUNCTION get_user_announcement_feed(p_user_id UUID, p_limit INTEGER DEFAULT 50)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(
+        jsonb_agg(get_announcement_bundle(f.id, p_user_id) ORDER BY f.ordinality),
+        '[]'::jsonb
+    )
+    FROM (
+        -- Audience rules stay in get_user_announcements; keep its ordering
+        SELECT u.id, u.ordinality
+        FROM get_user_announcements(p_user_id) WITH ORDINALITY AS u
+        ORDER BY u.ordinality
+        LIMIT p_limit
+    ) f;
+$$;
@@ -0,0 +1,22 @@
+-- Migration: Announcement status timestamps
+-- Date: 2026-10-15
+-- Description: Stamp published_at / archived_at inside the UPDATE itself so the
+-- API no longer reads the row before updating it (single UPDATE ... RETURNING)
+
+CREATE OR REPLACE FUNCTION set_announcement_status_timestamps()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'published' AND OLD.published_at IS NULL THEN
+        NEW.published_at = NOW();
+    ELSIF NEW.status = 'archived' AND NEW.status IS DISTINCT FROM OLD.status THEN
+        NEW.archived_at = NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS announcements_status_timestamps ON announcements;
+CREATE TRIGGER announcements_status_timestamps
+    BEFORE UPDATE OF status ON announcements
+    FOR EACH ROW
+    EXECUTE FUNCTION set_announcement_status_timestamps();
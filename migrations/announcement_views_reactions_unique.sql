@@ -0,0 +1,26 @@
+-- Migration: One view / one reaction per user and announcement
+-- Date: 2026-10-15
+-- Description: Unique (announcement_id, user_id) so views and reactions can be
+-- written with a single upsert instead of check-then-insert
+
+-- Drop duplicates left by the old check-then-insert race
+DELETE FROM announcement_views a
+USING announcement_views b
+WHERE a.announcement_id = b.announcement_id
+  AND a.user_id = b.user_id
+  AND a.ctid > b.ctid;
+
+DELETE FROM announcement_reactions a
+USING announcement_reactions b
+WHERE a.announcement_id = b.announcement_id
+  AND a.user_id = b.user_id
+  AND a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_announcement_views_announcement_user
+ON announcement_views(announcement_id, user_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_announcement_reactions_announcement_user
+ON announcement_reactions(announcement_id, user_id);
+
+-- Superseded by the unique index above
+DROP INDEX IF EXISTS idx_announcement_views_announcement_user;
@@ -0,0 +1,109 @@
+-- Migration: Authorized message writes
+-- Date: 2026-10-15
+-- Description: Permission checks folded into the message writes themselves
+-- (one statement, no check-then-act race).
+-- insert_message returns NULL when the sender may not post; edit_own_message and
+-- delete_own_message return {"error": reason} when the change is not allowed.
+
+CREATE OR REPLACE FUNCTION insert_message(
+    p_conversation UUID,
+    p_sender UUID,
+    p_content TEXT,
+    p_message_type TEXT DEFAULT 'text',
+    p_media_url TEXT DEFAULT NULL,
+    p_reply_to UUID DEFAULT NULL,
+    p_latitude DOUBLE PRECISION DEFAULT NULL,
+    p_longitude DOUBLE PRECISION DEFAULT NULL,
+    p_location_name TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+    WITH m AS (
+        INSERT INTO chat_messages (
+            id, conversation_id, sender_id, content, message_type, media_url,
+            reply_to_message_id, latitude, longitude, location_name, created_at
+        )
+        SELECT
+            gen_random_uuid(), p_conversation, p_sender, p_content, p_message_type, p_media_url,
+            p_reply_to, p_latitude, p_longitude, p_location_name, NOW()
+        WHERE EXISTS (
+            SELECT 1 FROM conversation_participants cp
+            WHERE cp.conversation_id = p_conversation
+              AND cp.user_id = p_sender
+              AND cp.can_send_messages
+        )
+        RETURNING *
+    )
+    SELECT to_jsonb(m) || jsonb_build_object(
+        'sender',
+        (SELECT jsonb_build_object('id', u.id, 'full_name', u.full_name, 'avatar_url', u.avatar_url)
+         FROM users u WHERE u.id = m.sender_id)
+    )
+    FROM m;
+$$;
+
+CREATE OR REPLACE FUNCTION edit_own_message(p_message UUID, p_user UUID, p_content TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    msg chat_messages%ROWTYPE;
+BEGIN
+    UPDATE chat_messages
+    SET content = p_content, is_edited = TRUE, edited_at = NOW()
+    WHERE id = p_message
+      AND sender_id = p_user
+      AND message_type = 'text'
+      AND created_at > NOW() - INTERVAL '15 minutes'
+    RETURNING * INTO msg;
+    
+    IF FOUND THEN
+        RETURN to_jsonb(msg);
+    END IF;
+    
+    -- Rejected: report why (same statement, no extra round trip)
+    SELECT * INTO msg FROM chat_messages WHERE id = p_message;
+    RETURN jsonb_build_object('error', CASE
+        WHEN NOT FOUND THEN 'not_found'
+        WHEN msg.sender_id <> p_user THEN 'not_sender'
+        WHEN msg.message_type <> 'text' THEN 'not_text'
+        ELSE 'too_late'
+    END);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION delete_own_message(p_message UUID, p_user UUID, p_for_everyone BOOLEAN)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    msg chat_messages%ROWTYPE;
+BEGIN
+    IF p_for_everyone THEN
+        UPDATE chat_messages
+        SET is_deleted = TRUE, deleted_at = NOW(), deleted_for_everyone = TRUE,
+            content = 'Ce message a été supprimé'
+        WHERE id = p_message
+          AND sender_id = p_user
+          AND created_at > NOW() - INTERVAL '1 hour'
+        RETURNING * INTO msg;
+    ELSE
+        UPDATE chat_messages
+        SET is_deleted = TRUE, deleted_at = NOW()
+        WHERE id = p_message AND sender_id = p_user
+        RETURNING * INTO msg;
+    END IF;
+    
+    IF FOUND THEN
+        RETURN to_jsonb(msg);
+    END IF;
+    
+    SELECT * INTO msg FROM chat_messages WHERE id = p_message;
+    RETURN jsonb_build_object('error', CASE
+        WHEN NOT FOUND THEN 'not_found'
+        WHEN msg.sender_id <> p_user THEN 'not_sender'
+        ELSE 'too_late'
+    END);
+END;
+$$;
@@ -0,0 +1,39 @@
+-- Migration: Chat session stats view
+-- Date: 2026-10-15
+-- Description: message_count is derived from chat_messages instead of a counter
+-- bumped on every send; /chat/sessions reads chat_sessions_with_stats.
+-- total_cost stays on chat_sessions (chat_messages carries no per-message cost).
+
+CREATE OR REPLACE VIEW chat_sessions_with_stats AS
+SELECT s.id, s.user_id, s.title, s.course_context, s.faculty_context,
+       s.created_at, s.updated_at, s.is_active,
+       c.message_count, s.total_cost
+FROM chat_sessions s
+CROSS JOIN LATERAL (
+    -- Index-only count on idx_chat_messages_chat_timestamp
+    SELECT COUNT(*)::INTEGER AS message_count FROM chat_messages m WHERE m.chat_id = s.id
+) c;
+
+-- The send path no longer maintains message_count (updated_at still orders the session list)
+CREATE OR REPLACE FUNCTION post_chat_message(p_chat UUID, p_user UUID, p_type TEXT, p_content TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    msg JSONB;
+BEGIN
+    UPDATE chat_sessions
+    SET updated_at = NOW()
+    WHERE id = p_chat AND user_id = p_user;
+    
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    
+    INSERT INTO chat_messages (id, chat_id, sender, type, content, timestamp, is_read)
+    VALUES (gen_random_uuid(), p_chat, 'user', p_type, p_content, NOW(), TRUE)
+    RETURNING to_jsonb(chat_messages.*) INTO msg;
+    
+    RETURN msg;
+END;
+$$;
@@ -0,0 +1,31 @@
+-- Migration: Server-side created_at defaults
+-- Date: 2026-10-15
+-- Description: Let Postgres stamp created_at on the tables the API no longer
+-- timestamps client-side (single clock, no per-row Python datetime)
+
+ALTER TABLE admin_logs ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE ai_usage ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE announcements ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE announcement_attachments ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE announcement_reactions ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE announcement_views ALTER COLUMN viewed_at SET DEFAULT NOW();
+ALTER TABLE purchase_transactions ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE notification_queue ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE chat_messages ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE users ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE users ALTER COLUMN last_login SET DEFAULT NOW();
+
+-- announcements.updated_at follows every UPDATE
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS announcements_set_updated_at ON announcements;
+CREATE TRIGGER announcements_set_updated_at
+    BEFORE UPDATE ON announcements
+    FOR EACH ROW
+    EXECUTE FUNCTION set_updated_at();
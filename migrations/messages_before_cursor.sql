@@ -0,0 +1,53 @@
+-- Migration: Message cursor resolved server-side
+-- Date: 2026-10-15
+-- Description: get_messages_with_reactions also accepts the id of the oldest
+-- message already shown; its created_at is resolved in the same statement
+-- (an unknown id means no cursor, as before)
+
+DROP FUNCTION IF EXISTS get_messages_with_reactions(UUID, TIMESTAMPTZ, INTEGER);
+
+CREATE OR REPLACE FUNCTION get_messages_with_reactions(
+    p_conversation UUID,
+    p_before TIMESTAMPTZ DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50,
+    p_before_id UUID DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(
+        jsonb_agg(
+            to_jsonb(m)
+            || jsonb_build_object('sender', s.sender, 'reactions', COALESCE(r.reactions, '[]'::jsonb))
+            ORDER BY m.created_at
+        ),
+        '[]'::jsonb
+    )
+    FROM (
+        SELECT * FROM chat_messages
+        WHERE conversation_id = p_conversation
+          AND is_deleted = false
+          AND (p_before IS NULL OR created_at < p_before)
+          AND (p_before_id IS NULL OR created_at < COALESCE(
+                (SELECT b.created_at FROM chat_messages b WHERE b.id = p_before_id), 'infinity'
+              ))
+        ORDER BY created_at DESC
+        LIMIT p_limit
+    ) m
+    LEFT JOIN LATERAL (
+        SELECT jsonb_build_object('id', u.id, 'full_name', u.full_name, 'avatar_url', u.avatar_url) AS sender
+        FROM users u WHERE u.id = m.sender_id
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(jsonb_build_object(
+            'message_id', mr.message_id,
+            'reaction', mr.reaction,
+            'user_id', mr.user_id,
+            'users', jsonb_build_object('full_name', ru.full_name)
+        )) AS reactions
+        FROM message_reactions mr
+        LEFT JOIN users ru ON ru.id = mr.user_id
+        WHERE mr.message_id = m.id
+    ) r ON true;
+$$;
@@ -0,0 +1,36 @@
+-- Migration: Narrow admin user list projection
+-- Date: 2026-10-15
+-- Description: user_management_v exposed every users column (u.*) although
+-- the admin panel only reads seven; project just those
+
+-- list_users_with_spend returns SETOF user_management_v, so it goes with the view
+DROP VIEW IF EXISTS user_management_v CASCADE;
+
+CREATE VIEW user_management_v AS
+SELECT
+    u.id,
+    u.email,
+    u.full_name,
+    u.status,
+    u.batera_coins,
+    u.created_at,
+    COALESCE(s.total_spent, 0) AS total_spent
+FROM users u
+LEFT JOIN (
+    SELECT user_id, SUM(amount) AS total_spent
+    FROM transactions
+    WHERE type = 'debit'
+    GROUP BY user_id
+) s ON s.user_id = u.id;
+
+CREATE OR REPLACE FUNCTION list_users_with_spend(p_status TEXT DEFAULT NULL, p_limit INT DEFAULT 100)
+RETURNS SETOF user_management_v
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT *
+    FROM user_management_v
+    WHERE p_status IS NULL OR status = p_status
+    ORDER BY created_at DESC
+    LIMIT p_limit;
+$$;
@@ -0,0 +1,20 @@
+-- Migration: Notification list indexes
+-- Date: 2026-10-15
+-- Description: Newest-first notification pages per user with a (created_at, id) cursor
+-- (WHERE user_id = ? [AND read = false] AND (created_at, id) < (?, ?)
+--  ORDER BY created_at DESC, id DESC LIMIT n)
+
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created_id
+ON notifications(user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread_created_id
+ON notifications(user_id, created_at DESC, id DESC)
+WHERE read = false;
+
+CREATE INDEX IF NOT EXISTS idx_notification_queue_user_created_id
+ON notification_queue(user_id, created_at DESC, id DESC);
+
+-- Superseded by the (created_at, id) indexes above
+DROP INDEX IF EXISTS idx_notifications_user_created;
+DROP INDEX IF EXISTS idx_notifications_user_unread_created;
+DROP INDEX IF EXISTS idx_notification_queue_user_created;
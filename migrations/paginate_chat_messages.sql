@@ -0,0 +1,36 @@
+-- Migration: Keyset pagination for Oracle chat messages
+-- Date: 2026-10-15
+-- Description: get_owned_chat_messages returns one page (newest first in the
+-- scan, oldest first in the result) instead of the whole conversation
+
+DROP FUNCTION IF EXISTS get_owned_chat_messages(UUID, UUID);
+
+CREATE OR REPLACE FUNCTION get_owned_chat_messages(
+    p_chat UUID,
+    p_user UUID,
+    p_before TIMESTAMPTZ DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE
+        WHEN EXISTS (SELECT 1 FROM chat_sessions s WHERE s.id = p_chat AND s.user_id = p_user)
+        THEN COALESCE(
+            (
+                SELECT jsonb_agg(to_jsonb(m) ORDER BY m.timestamp)
+                FROM (
+                    SELECT * FROM chat_messages
+                    WHERE chat_id = p_chat
+                      AND (p_before IS NULL OR timestamp < p_before)
+                    ORDER BY timestamp DESC
+                    LIMIT p_limit
+                ) m
+            ),
+            '[]'::jsonb
+        )
+    END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_timestamp ON chat_messages(chat_id, timestamp DESC);
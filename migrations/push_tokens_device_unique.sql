@@ -0,0 +1,16 @@
+-- Migration: One push token row per device
+-- Date: 2026-10-15
+-- Description: register-token upserts on (user_id, device_id), so re-registering a
+-- device updates its row instead of inserting a new one
+
+-- Keep the most recently used row of each device
+DELETE FROM push_notification_tokens a
+USING push_notification_tokens b
+WHERE a.user_id = b.user_id
+  AND a.device_id = b.device_id
+  AND (COALESCE(a.last_used_at, '-infinity'), a.ctid) < (COALESCE(b.last_used_at, '-infinity'), b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_push_notification_tokens_user_device
+ON push_notification_tokens(user_id, device_id);
+
+ALTER TABLE push_notification_tokens ALTER COLUMN id SET DEFAULT gen_random_uuid();
@@ -0,0 +1,7 @@
+-- Migration: Typing indicator freshness index
+-- Date: 2026-10-15
+-- Description: Serve the "who is typing" poll (conversation, is_typing, updated_at > cutoff)
+-- with an index range scan instead of reading every indicator of the conversation
+
+CREATE INDEX IF NOT EXISTS idx_typing_indicators_conversation_fresh
+ON typing_indicators(conversation_id, is_typing, updated_at DESC);
@@ -0,0 +1,10 @@
+-- Migration: Unique users.email
+-- Date: 2026-10-15
+-- Description: Registration inserts with ON CONFLICT (email) DO NOTHING, which
+-- needs a unique index on email (also closes the check-then-insert race)
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users (email);
+
+ALTER TABLE users ALTER COLUMN batera_coins SET DEFAULT 5.0;
+ALTER TABLE users ALTER COLUMN created_at SET DEFAULT NOW();
+ALTER TABLE users ALTER COLUMN last_login SET DEFAULT NOW();
@@ -0,0 +1,6 @@
+-- Migration: Users phone index
+-- Date: 2026-10-15
+-- Description: Index backing the phone lookups of /contacts/sync-phone-contacts
+-- (phone IN (...) chunks of at most 500 numbers)
+
+CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone) WHERE phone IS NOT NULL;